@@ -1,8 +1,6 @@
 import atexit
-import http.server
 import logging
 import os
-import socketserver
 from threading import Thread
 
 from localizer.meta import Params
@@ -34,7 +32,6 @@ package_logger.addHandler(_console_handler)
 PORT = 80
 httpd = None
 httpd_thread = None
-socketserver.TCPServer.allow_reuse_address = True
 
 
 def set_serve(value):
@@ -69,7 +66,9 @@ def start_httpd():
         shutdown_httpd()
 
     package_logger.info("Starting http server in {}".format(os.getcwd()))
-    httpd = socketserver.TCPServer(("", PORT), QuietSimpleHTTPRequestHandler)
+    # Loaded on first use: the query api needs pandas
+    from localizer.api import ApiServer
+    httpd = ApiServer(("", PORT))
     httpd_thread = Thread(target=httpd.serve_forever)
     httpd_thread.daemon = True
     httpd_thread.start()
@@ -111,12 +110,6 @@ def set_working_dir(path):
         raise ValueError("Invalid directory '{}'".format(path))
 
 
-# A quiet implementation of SimpleHTTPRequestHandler
-class QuietSimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def log_message(self, fmt, *args):
-        pass
-
-
 def set_debug(value):
     global debug, _console_handler
     debug = value
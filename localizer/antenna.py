@@ -3,10 +3,13 @@ import logging
 import math
 import threading
 import time
+from collections import OrderedDict
 from subprocess import run
 
 import pigpio
 
+from localizer import motion
+
 module_logger = logging.getLogger(__name__)
 
 # Always start due north (magnetic) or change this variable
@@ -16,15 +19,16 @@ bearing_max = 720
 bearing_min = -360
 
 # Constants
-# Reset Rate Curve
-# From utils/model.py
-#   x = [0,90,180,360]
-#   y = [20,10,8,6]
-get_reset_rate = lambda x: 3.235294 + (20 - 3.235294) / (1 + (x / 34.68111) ** 1.29956)
-RESET_RATE = [get_reset_rate(x) for x in range(1080)]
 get_focused_rate = lambda x: -4 + (20 + 4) / (1 + (x / 180) ** 0.48542683)
 FOCUSED_RATE = [get_focused_rate(x) for x in range(360)]
 
+# Mechanical limits of the stepper and mount, used to plan resets and repositioning. The fixed-rate reset curve of
+# utils/model.py never got past 105 degrees/s, and ramped up over 3 degrees at its fastest; these move at the limit
+MAX_VELOCITY = 120  # degrees/s
+MAX_ACCELERATION = 240  # degrees/s^2
+MOTION_PROFILE = motion.S_CURVE
+MOTION_LEVELS = 8
+
 # Default number of steps per radian
 steps_per_revolution = 200
 degrees_per_step = 360 / steps_per_revolution
@@ -36,6 +40,17 @@ PUL_min = 18
 DIR_min = 23
 ENA_min = 24
 
+# Serializes antenna motion so the next capture's reset waits for the previous capture's trailing reset
+motion_lock = threading.RLock()
+# How long to wait at exit for the antenna to finish moving (s); longer than the slowest reset
+MOTION_EXIT_TIMEOUT = 30
+
+# Waveform cache
+# pigpio holds at most 250 waveforms and chains encode wave IDs as a single byte, so keep some headroom
+WAVE_CACHE_SIZE = 200
+# Focused speeds are preloaded for widths sampled at this interval (degrees)
+WAVE_PRELOAD_TRAVEL_STEP = 45
+
 
 # PIGPIOD bootstrap
 # Try to start pigpiod locally
@@ -55,10 +70,16 @@ pi.set_mode(DIR_min, pigpio.OUTPUT)
 pi.set_mode(ENA_min, pigpio.OUTPUT)
 pi.write(ENA_min, pigpio.HIGH)
 
+# Errors raised by pigpio when wave memory (IDs, pulses or control blocks) is exhausted
+_WAVE_MEMORY_ERRORS = [pigpio.error_text(e) for e in (pigpio.PI_NO_WAVEFORM_ID,
+                                                       pigpio.PI_TOO_MANY_PULSES,
+                                                       pigpio.PI_TOO_MANY_CBS,
+                                                       pigpio.PI_TOO_MANY_OOL)]
+
 
 class AntennaThread(threading.Thread):
 
-    def __init__(self, response_queue, event_flag, duration, degrees, bearing, reset=None):
+    def __init__(self, response_queue, event_flag, duration, degrees, bearing, reset=None, clockwise=True):
 
         # Set up thread
         super().__init__()
@@ -69,55 +90,67 @@ class AntennaThread(threading.Thread):
         self._response_queue = response_queue
         self._event_flag = event_flag
         self._duration = duration
-        self._degrees = degrees
+        self._degrees = degrees if clockwise else -degrees
         self._bearing = bearing
         self._reset = reset
+        self._cancelled = False
 
     def run(self):
         global bearing_current
 
         module_logger.info("Executing Stepper Thread")
 
-        # Point the antenna in the right direction
-        AntennaThread.reset_antenna(self._bearing, self._degrees)
+        with motion_lock:
+            # Point the antenna in the right direction
+            AntennaThread.reset_antenna(self._bearing, self._degrees)
 
-        # Indicate readiness
-        self._response_queue.put('r')
+            # Indicate readiness
+            self._response_queue.put('r')
 
-        # Wait for the synchronization flag
-        module_logger.info("Waiting for synchronization flag")
-        self._event_flag.wait()
+            # Wait for the synchronization flag
+            module_logger.info("Waiting for synchronization flag")
+            self._event_flag.wait()
+            if self._cancelled:
+                return
 
-        _start_time, _stop_time = self.rotate(self._degrees, self._duration)
-        bearing_current += self._degrees
+            _start_time, _stop_time = self.rotate(self._degrees, self._duration)
+            bearing_current += self._degrees
 
-        module_logger.info("Rotated antenna {} degrees for {:.2f}s"
-                           .format(self._degrees, _stop_time - _start_time))
+            module_logger.info("Rotated antenna {} degrees for {:.2f}s"
+                               .format(self._degrees, _stop_time - _start_time))
 
-        # Put results on queue
-        self._response_queue.put((_start_time, _stop_time))
+            # Put results on queue; the capture is processed and the next one set up while the antenna resets
+            self._response_queue.put((_start_time, _stop_time))
 
-        # Pause for a moment to reduce drift
-        time.sleep(.5)
+            if self._reset is not None:
+                # Pause for a moment to reduce drift
+                time.sleep(.5)
+
+                # Reset antenna for next test, assuming next test has same width as current. This stays under the lock,
+                # so the next capture's reset and rotation only start from where this one leaves the antenna
+                AntennaThread.reset_antenna(self._reset, self._degrees)
+
+    def cancel(self):
+        """
+        Skip the rotation once the synchronization flag is raised
+        """
 
-        if self._reset is not None:
-            # Reset antenna for next test, assuming next test has same width as current
-            AntennaThread.reset_antenna(self._reset, self._degrees)
+        self._cancelled = True
 
     @staticmethod
     def reset_antenna(bearing=bearing_default, degrees=0):
         global bearing_current
 
-        _travel = AntennaThread.determine_best_path(bearing, degrees)
+        with motion_lock:
+            _travel = AntennaThread.determine_best_path(bearing, degrees)
 
-        # Check to see if new bearing is within 0.1
-        if not math.isclose(bearing_current, bearing, abs_tol=0.1) and _travel != 0:
-            _travel_duration = RESET_RATE[abs(_travel)]
-            module_logger.info(
-                "Resetting antenna {} degrees (from {} to {})".format(_travel, bearing_current, bearing_current + _travel))
-            AntennaThread.rotate(_travel, _travel_duration)
-            bearing_current += _travel
-            return True
+            # Check to see if new bearing is within 0.1
+            if not math.isclose(bearing_current, bearing, abs_tol=0.1) and _travel != 0:
+                module_logger.info(
+                    "Resetting antenna {} degrees (from {} to {})".format(_travel, bearing_current, bearing_current + _travel))
+                AntennaThread.move(_travel)
+                bearing_current += _travel
+                return True
 
         return False
 
@@ -128,26 +161,11 @@ class AntennaThread(threading.Thread):
         of the antenna.
 
         :param new_bearing: New bearing to set the antenna to
-        :param degrees: How far will the antenna be traveling from this bearing
+        :param degrees: How far will the antenna be traveling from this bearing; negative for counter-clockwise
         :return: An optimized (equivalent) bearing to set the antenna
         """
 
-        global bearing_current
-
-
-        _edge_case = bool(new_bearing == bearing_current % 360)
-        if _edge_case and (bearing_current >= bearing_max or bearing_current <= bearing_min):
-            _travel = new_bearing - bearing_current
-        else:
-            # Use algorithm tested and optimized in tests/antenna_motion.py
-            _travel = 180 - (540 + (bearing_current - new_bearing)) % 360
-            _proposed_new_bearing = bearing_current + _travel
-            if _proposed_new_bearing + degrees >= bearing_max:
-                _travel = _travel - 360
-            elif _proposed_new_bearing <= bearing_min:
-                _travel = 360 - _travel
-
-        return _travel
+        return motion.best_path(bearing_current, new_bearing, degrees, bearing_min, bearing_max)
 
     @staticmethod
     def rotate(degrees, duration):
@@ -162,14 +180,109 @@ class AntennaThread(threading.Thread):
         :rtype: tuple
         """
 
-        pi.wave_clear()
+        _ramp = AntennaThread.build_ramp(abs(degrees), duration)
+
+        for r in _ramp:
+            assert r[0] > 0, "degrees: {}, duration: {}, ramp freq: {}".format(degrees, duration, r[0])
+            assert r[1] > 0, "degrees: {}, duration: {}, ramp pulses: {}".format(degrees, duration, r[0])
+
+        return AntennaThread._run_ramp(degrees, _ramp)
+
+    @staticmethod
+    def move(degrees):
+        """
+        Move by degrees as fast as the mechanical limits (MAX_VELOCITY, MAX_ACCELERATION) allow
+
+        :param degrees: Number of degrees to move
+        :type degrees: int
+        :return: start, end
+        :rtype: tuple
+        """
+
+        return AntennaThread._run_ramp(degrees, AntennaThread.build_profile(abs(degrees)))
+
+    @staticmethod
+    def build_profile(degrees):
+        """
+        Build the ramp levels of a motion profile at the mechanical limits
+
+        :param degrees: Number of degrees to move
+        :type degrees: int
+        :return: List of [Frequency, Steps]
+        :rtype: list
+        """
+
+        # A step is a full on/off pulse, so the wave frequency is twice the step rate
+        return [[2 * rate, steps] for rate, steps in motion.plan(degrees,
+                                                                 degrees_per_microstep,
+                                                                 MAX_VELOCITY,
+                                                                 MAX_ACCELERATION,
+                                                                 MOTION_LEVELS,
+                                                                 MOTION_PROFILE)]
+
+    @staticmethod
+    def travel_time(degrees):
+        """
+        Predict how long a move at the mechanical limits will take
+
+        :param degrees: Number of degrees to move
+        :type degrees: int
+        :return: Duration (s)
+        :rtype: float
+        """
+
+        return motion.travel_time(abs(degrees), degrees_per_microstep, MAX_VELOCITY, MAX_ACCELERATION,
+                                  MOTION_LEVELS, MOTION_PROFILE)
+
+    @staticmethod
+    def _run_ramp(degrees, ramp):
+        """
+        Transmit a ramp in the direction of degrees and wait for it to complete
+
+        :param degrees: Signed number of degrees, used for direction
+        :type degrees: int
+        :param ramp: List of [Frequency, Steps]
+        :type ramp: list
+        :return: start, end
+        :rtype: tuple
+        """
 
         if degrees < 0:
             pi.write(DIR_min, 1)
-            degrees = - degrees
         else:
             pi.write(DIR_min, 0)
 
+        _duration = 0
+        for r in ramp:
+            _duration += int(1000000 / r[0]) * r[1]
+
+        _duration *= 2
+        _duration /= 1000000
+
+        _chain, _ = AntennaThread.generate_ramp(ramp)
+
+        _time_start = time.time()
+        pi.wave_chain(_chain)
+        _time_end = _time_start + _duration
+
+        while time.time() < _time_end:
+            time.sleep(.1)
+
+        return _time_start, _time_end
+
+    @staticmethod
+    def build_ramp(degrees, duration):
+        """
+        Build the ramp levels needed to rotate a (positive) number of degrees
+
+        :param degrees: Number of degrees to rotate
+        :type degrees: int
+        :param duration: Time to take for rotation for 360 degrees
+        :type duration: float
+        :return: List of [Frequency, Steps]
+        :rtype: list
+        """
+
         _frequency = microsteps_per_revolution/duration
 
         if degrees > 6:
@@ -187,44 +300,17 @@ class AntennaThread(threading.Thread):
 
             _pulses = round((degrees - 2*(_ramp1 + _ramp2 + _ramp3)) / degrees_per_microstep)
 
-            _ramp = [[_ramp1_frequency, _ramp1_pulses],
-                     [_ramp2_frequency, _ramp2_pulses],
-                     [_ramp3_frequency, _ramp3_pulses],
-                     [_frequency, _pulses],
-                     [_ramp3_frequency, _ramp3_pulses],
-                     [_ramp2_frequency, _ramp2_pulses],
-                     [_ramp1_frequency, _ramp1_pulses]]
+            return [[_ramp1_frequency, _ramp1_pulses],
+                    [_ramp2_frequency, _ramp2_pulses],
+                    [_ramp3_frequency, _ramp3_pulses],
+                    [_frequency, _pulses],
+                    [_ramp3_frequency, _ramp3_pulses],
+                    [_ramp2_frequency, _ramp2_pulses],
+                    [_ramp1_frequency, _ramp1_pulses]]
 
         else:
             _pulses = round(degrees/degrees)
-            _ramp = [[_frequency/3, _pulses]]
-
-        _duration = 0
-        for r in _ramp:
-            assert r[0] > 0, "degrees: {}, duration: {}, ramp freq: {}".format(degrees, duration, r[0])
-            assert r[1] > 0, "degrees: {}, duration: {}, ramp pulses: {}".format(degrees, duration, r[0])
-            _duration += int(1000000 / r[0]) * r[1]
-
-        _duration *= 2
-        _duration /= 1000000
-
-        _chain, _wid = AntennaThread.generate_ramp(_ramp)
-
-        _time_start = time.time()
-        pi.wave_chain(_chain)
-        _time_end = _time_start + _duration
-
-        while time.time() < _time_end:
-            time.sleep(.1)
-
-        try:
-            for wid in _wid:
-                if wid:
-                    pi.wave_delete(wid)
-        except pigpio.error as e:
-            module_logger.error(e)
-
-        return _time_start, _time_end
+            return [[_frequency/3, _pulses]]
 
     @staticmethod
     def antenna_set_en(val):
@@ -241,19 +327,10 @@ class AntennaThread(threading.Thread):
         """Generate ramp wave forms.
         ramp:  List of [Frequency, Steps]
         """
-        pi.wave_clear()  # clear existing waves
         length = len(ramp)  # number of ramp levels
-        wid = [-1] * length
 
-        # Generate a wave per ramp level
-        for i in range(length):
-            frequency = ramp[i][0]
-            micros = int(1000000 / frequency)
-            wf1 = pigpio.pulse(1 << PUL_min, 0, micros)  # pulse on
-            wf2 = pigpio.pulse(0, 1 << PUL_min, micros)  # pulse off
-            wf = [wf1, wf2]
-            pi.wave_add_generic(wf)
-            wid[i] = pi.wave_create()
+        # Look up (or build) a wave per ramp level
+        wid = waveforms.acquire([int(1000000 / r[0]) for r in ramp])
 
         # Generate a chain of waves
         chain = []
@@ -266,11 +343,133 @@ class AntennaThread(threading.Thread):
         return chain, wid  # Return chain.
 
 
+class WaveformCache:
+
+    def __init__(self, size=WAVE_CACHE_SIZE):
+        """
+        Cache of pigpio step waveforms keyed by pulse period, so rotations only need to assemble a chain from existing
+        wave IDs instead of rebuilding every ramp level (a network round trip each when pigpiod is remote)
+
+        :param size: Maximum number of waveforms to hold before evicting the least recently used
+        :type size: int
+        """
+
+        self._size = size
+        self._waves = OrderedDict()
+
+    def acquire(self, periods):
+        """
+        Return wave IDs for the provided pulse periods, creating any that are not cached yet
+
+        :param periods: Pulse periods (microseconds for each of the on and off halves of a step)
+        :type periods: list[int]
+        :return: Wave ID per period
+        :rtype: list[int]
+        """
+
+        _pinned = set(periods)
+        return [self._get(micros, _pinned) for micros in periods]
+
+    def preload(self, ramps):
+        """
+        Build the waveforms for every level of the provided ramps
+
+        :param ramps: List of ramps, each a list of [Frequency, Steps]
+        :type ramps: list[list]
+        """
+
+        _periods = set()
+        for ramp in ramps:
+            for frequency, _ in ramp:
+                _periods.add(int(1000000 / frequency))
+
+        for micros in sorted(_periods):
+            if len(self._waves) >= self._size:
+                module_logger.warning("Waveform cache full, preloaded {}/{} waveforms"
+                                      .format(len(self._waves), len(_periods)))
+                break
+            self._get(micros)
+
+        module_logger.info("Waveform cache holds {} waveforms".format(len(self._waves)))
+
+    def clear(self):
+        self._waves.clear()
+        pi.wave_clear()
+
+    def _get(self, micros, pinned=()):
+        if micros in self._waves:
+            self._waves.move_to_end(micros)
+            return self._waves[micros]
+
+        if len(self._waves) >= self._size:
+            self._evict(pinned)
+
+        while True:
+            try:
+                pi.wave_add_new()
+                pi.wave_add_generic([pigpio.pulse(1 << PUL_min, 0, micros),    # pulse on
+                                     pigpio.pulse(0, 1 << PUL_min, micros)])   # pulse off
+                self._waves[micros] = pi.wave_create()
+                return self._waves[micros]
+            except pigpio.error as e:
+                if str(e) not in _WAVE_MEMORY_ERRORS or not self._evict(pinned):
+                    raise
+
+    def _evict(self, pinned=()):
+        """
+        Delete the least recently used waveform that is not pinned
+
+        :return: Whether a waveform was evicted
+        :rtype: bool
+        """
+
+        _micros = next((m for m in self._waves if m not in pinned), None)
+        if _micros is None:
+            return False
+
+        _wid = self._waves.pop(_micros)
+        module_logger.debug("Evicting waveform {} ({}us)".format(_wid, _micros))
+        try:
+            pi.wave_delete(_wid)
+        except pigpio.error as e:
+            module_logger.error(e)
+        return True
+
+    def __len__(self):
+        return len(self._waves)
+
+
+def rotation_ramps(durations):
+    """
+    Ramps used by full and short rotations of the provided durations, for preloading waveforms
+
+    :param durations: Rotation durations (seconds per 360 degrees)
+    :type durations: list[float]
+    :return: List of ramps
+    :rtype: list[list]
+    """
+
+    return [AntennaThread.build_ramp(degrees, duration) for duration in durations if duration > 0 for degrees in (1, 360)]
+
+
+# Build the waveforms for focused and reset speeds up front; the longest reset uses every level of the motion profile
+waveforms = WaveformCache()
+pi.wave_clear()
+waveforms.preload([AntennaThread.build_profile(bearing_max - bearing_min)] +
+                  rotation_ramps([FOCUSED_RATE[x] for x in range(0, 360, WAVE_PRELOAD_TRAVEL_STEP)]))
+
+
 @atexit.register
 def cleanup_gpio():
     """
     Cleanup - ensure GPIO is cleaned up properly
     """
 
+    # A trailing reset may still be running on its (daemon) thread; let it finish, so bearing_current stays true
+    if motion_lock.acquire(timeout=MOTION_EXIT_TIMEOUT):
+        motion_lock.release()
+    else:
+        module_logger.warning("Antenna still moving after {}s; its bearing is unknown".format(MOTION_EXIT_TIMEOUT))
+
     module_logger.info("Cleaning up GPIO")
-    pi.wave_clear()
+    waveforms.clear()
@@ -0,0 +1,419 @@
+import collections
+import csv
+import json
+import logging
+import os
+import re
+import threading
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from localizer import archive, locate
+from localizer.fileserver import FileServer, FileRequestHandler
+from localizer.meta import meta_csv_fieldnames, capture_suffixes
+
+module_logger = logging.getLogger(__name__)
+
+# Parsed files and derived tables kept in memory, at least; the cache grows to CACHE_ENTRIES_PER_CAPTURE per capture
+# found, so the AP queries, which read every capture, are answered from memory however large the campaign
+CACHE_SIZE = 256
+# Meta, results, guesses and profiles
+CACHE_ENTRIES_PER_CAPTURE = 4
+# Prefix of the query endpoints; everything else is served as files
+API_PREFIX = '/api/'
+
+capture_fieldnames = ['capture', 'path', 'name', 'pass', 'start', 'end', 'lat', 'lon', 'alt', 'degrees', 'processed']
+guess_fieldnames = ['ssid', 'bssid', 'channel', 'security', 'strength', 'beacons', 'method', 'bearing', 'bearing_true']
+
+
+class ResultsCache:
+
+    def __init__(self, size=CACHE_SIZE):
+        """
+        Least recently used cache of values loaded from capture files. Each value is stamped with the modification
+        time and size of the files it was loaded from, and reloaded once any of them changes. Directory scans are kept
+        apart, stamped with the directories they listed
+
+        :param size: Values kept, at least
+        :type size: int
+        """
+
+        self._size = size
+        self._values = collections.OrderedDict()
+        self._scans = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, paths, loader):
+        """
+        Cached value for a key, loading it if it is missing or stale
+
+        :param key: Cache key
+        :type key: tuple
+        :param paths: Files the value is loaded from
+        :type paths: list
+        :param loader: Called without arguments to load the value
+        :type loader: callable
+        :return: Value
+        """
+
+        _stamp = tuple(_stamp_of(path) for path in paths)
+
+        with self._lock:
+            _entry = self._values.get(key)
+            if _entry is not None and _entry[0] == _stamp:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return _entry[1]
+            self.misses += 1
+
+        # Load outside the lock, so one slow file does not hold up every other client
+        _value = loader()
+
+        with self._lock:
+            self._values[key] = (_stamp, _value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._size:
+                self._values.popitem(last=False)
+
+        return _value
+
+    def reserve(self, size):
+        """
+        Keep at least this many values
+
+        :param size: Values kept
+        :type size: int
+        """
+
+        with self._lock:
+            self._size = max(self._size, size)
+
+    def scan(self, root, scanner):
+        """
+        Cached result of scanning a directory tree, rescanned once any directory scanned has changed: files and
+        subdirectories being added, removed or renamed all change their directory's modification time
+
+        :param root: Directory scanned
+        :type root: str
+        :param scanner: Called without arguments to scan, returning (dict of directory to its stamp from before it
+                        was listed, result)
+        :type scanner: callable
+        :return: Result
+        """
+
+        with self._lock:
+            _entry = self._scans.get(root)
+        if _entry is not None and all(_stamp_of(path) == stamp for path, stamp in _entry[0].items()):
+            self.hits += 1
+            return _entry[1]
+        self.misses += 1
+
+        _directories, _result = scanner()
+        with self._lock:
+            self._scans[root] = (_directories, _result)
+        return _result
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _stamp_of(path):
+    try:
+        _stat = os.stat(path)
+    except OSError:
+        return None
+    return _stat.st_mtime_ns, _stat.st_size
+
+
+def _records(frame):
+    # JSON has no NaN
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+
+
+class Catalog:
+
+    def __init__(self, root, cache=None):
+        """
+        Captures under a directory, and the query results built from their files
+
+        :param root: Directory to search
+        :type root: str
+        :param cache: Cache for parsed files and derived tables
+        :type cache: ResultsCache
+        """
+
+        self._root = os.path.abspath(root)
+        self._cache = cache if cache is not None else ResultsCache()
+
+    def _scan(self):
+        # One capture per directory, as for processing: its meta, and its latest results if processed
+        def _walk():
+            _directories = {}
+            _captures = []
+            _pending = [self._root]
+            while _pending:
+                root = _pending.pop()
+                # Stamped before listing, so a change made while listing is picked up by the next request
+                _directories[root] = _stamp_of(root)
+                try:
+                    _entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+                except OSError:
+                    continue
+                # Walked depth first in name order, as os.walk with sorted dirs
+                _pending.extend(reversed([e.path for e in _entries if e.is_dir() and not e.is_symlink()]))
+                files = [e.name for e in _entries if not e.is_dir()]
+                _meta = sorted(f for f in files if f.endswith(capture_suffixes["meta"]))
+                if not _meta:
+                    continue
+                _results = sorted(f for f in files if archive.has_suffix(f, capture_suffixes["results"]))
+                _captures.append((_meta[0][:-len(capture_suffixes["meta"])], root, os.path.join(root, _meta[0]),
+                                  os.path.join(root, _results[-1]) if _results else None))
+            self._cache.reserve(CACHE_ENTRIES_PER_CAPTURE * len(_captures))
+            return _directories, _captures
+
+        return self._cache.scan(self._root, _walk)
+
+    def _meta(self, path):
+        def _load():
+            with open(path, 'rt') as meta_csv:
+                return next(csv.DictReader(meta_csv, dialect='unix'), None) or {}
+        return self._cache.get(('meta', path), [path], _load)
+
+    def _results(self, path):
+        return self._cache.get(('results', path), [path], lambda: pd.read_csv(path))
+
+    def captures(self):
+        """
+        Every capture, in directory order
+
+        :return: List of dicts of capture_fieldnames
+        :rtype: list
+        """
+
+        _captures = []
+        for capture, root, meta_path, results_path in self._scan():
+            _meta = self._meta(meta_path)
+            _captures.append(dict(zip(capture_fieldnames, [
+                capture,
+                os.path.relpath(root, self._root),
+                _meta.get(meta_csv_fieldnames[0]),
+                _meta.get(meta_csv_fieldnames[1]),
+                _number(_meta.get(meta_csv_fieldnames[12])),
+                _number(_meta.get(meta_csv_fieldnames[13])),
+                _number(_meta.get(meta_csv_fieldnames[6])),
+                _number(_meta.get(meta_csv_fieldnames[7])),
+                _number(_meta.get(meta_csv_fieldnames[8])),
+                _number(_meta.get(meta_csv_fieldnames[14])),
+                results_path is not None,
+            ])))
+        return _captures
+
+    def _find(self, capture):
+        return next((entry for entry in self._scan() if entry[0] == capture), None)
+
+    def _guesses(self, root, meta_path, results_path):
+        if results_path is not None:
+            return self._cache.get(('guesses', results_path), [results_path, meta_path],
+                                   lambda: guesses(self._results(results_path), self._meta(meta_path)))
+
+        # Unprocessed captures may still have the guesses made while capturing
+        _meta = self._meta(meta_path)
+        if not _meta.get(meta_csv_fieldnames[20]):
+            return None
+        _path = os.path.join(root, _meta[meta_csv_fieldnames[20]])
+        if not os.path.isfile(_path):
+            return None
+        return self._cache.get(('guesses', _path), [_path],
+                               lambda: pd.read_csv(_path, index_col=0).reindex(columns=guess_fieldnames))
+
+    def capture_guesses(self, capture):
+        """
+        Bearing guesses for every AP seen in a capture
+
+        :param capture: Capture, as listed by captures()
+        :type capture: str
+        :return: List of dicts of guess_fieldnames, or None if the capture is unknown or has no guesses
+        :rtype: list
+        """
+
+        _entry = self._find(capture)
+        if _entry is None:
+            return None
+        _guesses = self._guesses(*_entry[1:])
+        return None if _guesses is None else _records(_guesses)
+
+    def bearings(self, bssid):
+        """
+        Bearing guesses and beacon counts of an AP from every capture that saw it
+
+        :param bssid: BSSID
+        :type bssid: str
+        :return: List of dicts of the capture, its position, and guess_fieldnames
+        :rtype: list
+        """
+
+        bssid = bssid.lower()
+        _bearings = []
+        for capture, root, meta_path, results_path in self._scan():
+            _guesses = self._guesses(root, meta_path, results_path)
+            if _guesses is None:
+                continue
+            _meta = self._meta(meta_path)
+            for row in _records(_guesses[_guesses['bssid'] == bssid]):
+                _bearings.append(dict([('capture', capture),
+                                       ('lat', _number(_meta.get(meta_csv_fieldnames[6]))),
+                                       ('lon', _number(_meta.get(meta_csv_fieldnames[7]))),
+                                       ('time', _number(_meta.get(meta_csv_fieldnames[12])))], **row))
+        return _bearings
+
+    def profiles(self, bssid):
+        """
+        Angular signal strength profile of an AP from every processed capture that saw it
+
+        :param bssid: BSSID
+        :type bssid: str
+        :return: List of dicts of the capture, its position and the profile: strongest signal (dBm) and beacons per
+                 degree of true bearing
+        :rtype: list
+        """
+
+        bssid = bssid.lower()
+        _profiles = []
+        for capture, root, meta_path, results_path in self._scan():
+            if results_path is None:
+                continue
+            _profile = self._cache.get(('profiles', results_path), [results_path],
+                                       lambda: profiles(self._results(results_path)))
+            if bssid not in _profile.index:
+                continue
+            _meta = self._meta(meta_path)
+            _profiles.append({'capture': capture,
+                              'lat': _number(_meta.get(meta_csv_fieldnames[6])),
+                              'lon': _number(_meta.get(meta_csv_fieldnames[7])),
+                              'profile': _records(_profile.loc[[bssid]].reset_index(drop=True))})
+        return _profiles
+
+
+def guesses(results, meta):
+    """
+    Bearing guess, strength and beacon count of every AP in a capture's results
+
+    :param results: Results of process_capture
+    :type results: pd.DataFrame
+    :param meta: Capture meta
+    :type meta: dict
+    :return: DataFrame of guess_fieldnames, strongest first. Bearings are magnetic, as in guess files, with the true
+             bearing alongside
+    :rtype: pd.DataFrame
+    """
+
+    _degrees = int(float(meta.get(meta_csv_fieldnames[14]) or 360))
+    _rows = []
+    for (ssid, bssid), group in results.groupby(['ssid', 'bssid'], dropna=False):
+        _guess, _method = locate.interpolate(group, _degrees)
+        # The declination is the same for every packet of a capture
+        _declination = (group['bearing_true'].iloc[0] - group['bearing_magnetic'].iloc[0]) % 360
+        _rows.append([ssid if isinstance(ssid, str) and ssid else '<blank>', bssid,
+                      group.groupby('channel')['timestamp'].count().idxmax(), group['encryption'].iloc[0],
+                      group['ssi'].max(), len(group), _method, _guess, (_guess + _declination) % 360])
+
+    return pd.DataFrame(_rows, columns=guess_fieldnames).sort_values('strength', ascending=False)\
+        .reset_index(drop=True)
+
+
+def profiles(results):
+    """
+    Strongest signal and beacon count per AP and degree of true bearing
+
+    :param results: Results of process_capture
+    :type results: pd.DataFrame
+    :return: DataFrame of degree, strength and beacons, indexed by bssid
+    :rtype: pd.DataFrame
+    """
+
+    _binned = results.assign(degree=np.round(results['bearing_true']).astype(int) % 360)
+    return _binned.groupby(['bssid', 'degree'])['ssi'].agg(['max', 'count'])\
+        .rename(columns={'max': 'strength', 'count': 'beacons'}).reset_index(level='degree')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiServer(FileServer):
+
+    def __init__(self, address, handler=None, cache_size=CACHE_SIZE, **kwargs):
+        """
+        File server that also answers JSON queries about the captures it serves, from a cache of their parsed results:
+
+        /api/captures                   every capture
+        /api/captures/<capture>/guesses bearing guesses of a capture
+        /api/aps/<bssid>/bearings       bearing guesses and beacon counts of an AP, per capture
+        /api/aps/<bssid>/profile        angular signal strength profile of an AP, per capture
+
+        :param address: (host, port)
+        :type address: tuple
+        :param cache_size: Parsed files and derived tables kept in memory, at least
+        :type cache_size: int
+        """
+
+        super().__init__(address, handler or ApiRequestHandler, **kwargs)
+        self.cache = ResultsCache(cache_size)
+
+
+class ApiRequestHandler(FileRequestHandler):
+
+    routes = [(re.compile(r'^captures$'), 'captures'),
+              (re.compile(r'^captures/([^/]+)/guesses$'), 'capture_guesses'),
+              (re.compile(r'^aps/([^/]+)/bearings$'), 'bearings'),
+              (re.compile(r'^aps/([^/]+)/profile$'), 'profiles')]
+
+    def do_GET(self):
+        if not self._api():
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self._api(body=False):
+            super().do_HEAD()
+
+    def _api(self, body=True):
+        _path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if not _path.startswith(API_PREFIX):
+            return False
+
+        _query = _path[len(API_PREFIX):].strip('/')
+        for pattern, method in self.routes:
+            _match = pattern.match(_query)
+            if _match:
+                break
+        else:
+            self.send_error(404, "Unknown query")
+            return True
+
+        _catalog = Catalog(self.directory, self.server.cache)
+        try:
+            _result = getattr(_catalog, method)(*_match.groups())
+        except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+            module_logger.warning("Query {} failed: {}".format(_path, e))
+            self.send_error(500, "Could not read capture files")
+            return True
+        if _result is None:
+            self.send_error(404, "No such capture, or it has no guesses")
+            return True
+
+        _body = json.dumps(_result).encode()
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(_body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if body:
+            self.wfile.write(_body)
+        return True
@@ -0,0 +1,120 @@
+import logging
+import time
+
+import pandas as pd
+from tabulate import tabulate
+
+module_logger = logging.getLogger(__name__)
+
+# Rows per page of the AP listing
+PAGE_SIZE = 50
+
+
+class APs:
+
+    def __init__(self):
+        """
+        Access points detected during a session, keyed by BSSID. Rows keep their position (the number the shell refers
+        to them by) across updates, and every update is also kept as an observation in the AP's history
+        """
+
+        self._aps = None
+        self._observations = []
+        self._history = None
+        self._pages = {}
+
+    @property
+    def aps(self):
+        return self._aps
+
+    @aps.setter
+    def aps(self, val):
+        self._aps = None
+        self._observations = []
+        self.update(val)
+
+    def update(self, val):
+        """
+        Insert new APs and update known ones from a table of guesses, in one pass
+
+        :param val: Guesses, with a bssid column
+        :type val: pd.DataFrame
+        """
+
+        _new = val.drop_duplicates('bssid', keep='last').set_index('bssid', drop=False)
+        _new.index.name = None
+
+        self._observations.append(_new.assign(time=time.time()))
+        self._history = None
+        self._pages = {}
+
+        if self._aps is None:
+            self._aps = _new
+            return
+
+        # Known APs are updated in place, so their numbers do not change; unknown ones are appended
+        _known = _new.index.isin(self._aps.index)
+        _columns = self._aps.columns.intersection(_new.columns)
+        _aps = self._aps.reindex(columns=self._aps.columns.union(_new.columns, sort=False))
+        _aps.loc[_new.index[_known], _columns] = _new.loc[_known, _columns]
+        self._aps = pd.concat([_aps, _new[~_known]])
+
+    def history(self, bssid):
+        """
+        Every observation of an AP, oldest first
+
+        :param bssid: BSSID of the AP
+        :type bssid: str
+        :return: Observations, with the time of the update that recorded them
+        :rtype: pd.DataFrame
+        """
+
+        if self._history is None:
+            self._history = pd.concat(self._observations) if self._observations else pd.DataFrame(columns=['bssid'])
+
+        return self._history[self._history.index == bssid].reset_index(drop=True)
+
+    def page(self, number=0, size=PAGE_SIZE):
+        """
+        Render one page of the AP listing. Pages are rendered on demand and kept until the next update
+
+        :param number: Page number, from 0
+        :type number: int
+        :param size: Rows per page
+        :type size: int
+        :rtype: str
+        """
+
+        if (number, size) not in self._pages:
+            _view = self._aps.iloc[number * size:(number + 1) * size]
+            _view = _view.set_axis(range(number * size, number * size + len(_view)))
+            _table = tabulate(_view, headers='keys', tablefmt='psql')
+            _pages = self.pages(size)
+            if _pages > 1:
+                _table += "\nPage {} of {} ({} access points)".format(number + 1, _pages, len(self))
+            self._pages[(number, size)] = _table
+
+        return self._pages[(number, size)]
+
+    def pages(self, size=PAGE_SIZE):
+        """
+        Number of pages in the AP listing
+
+        :param size: Rows per page
+        :type size: int
+        :rtype: int
+        """
+
+        return -(-len(self) // size)
+
+    def __getitem__(self, arg):
+        return self._aps.iloc[arg]
+
+    def __len__(self):
+        if self._aps is None:
+            return 0
+        else:
+            return len(self._aps)
+
+    def __str__(self):
+        return self.page(0)
@@ -0,0 +1,173 @@
+import gzip
+import logging
+import os
+import shutil
+import zlib
+
+from localizer.meta import capture_suffixes
+
+module_logger = logging.getLogger(__name__)
+
+# Suffix added to compressed capture files
+COMPRESSED_SUFFIX = '.gz'
+# gzip level: fastest, as the Pi compresses right after processing; decompression is as fast at any level
+COMPRESS_LEVEL = 1
+# Bytes read at a time when compressing and verifying
+COPY_BUFFER = 2 ** 20
+
+# The bulky files of a capture. Metadata and guesses stay plain: they are small, and scanned to find captures
+archived_suffixes = [capture_suffixes["pcap"],
+                     capture_suffixes["nmea"],
+                     capture_suffixes["coords"],
+                     capture_suffixes["channels"],
+                     capture_suffixes["results"]]
+
+
+def has_suffix(file, suffix):
+    """
+    Check whether a file name ends with a capture suffix, compressed or not
+
+    :param file: File name
+    :type file: str
+    :param suffix: Suffix, from capture_suffixes
+    :type suffix: str
+    :rtype: bool
+    """
+
+    return file.endswith(suffix) or file.endswith(suffix + COMPRESSED_SUFFIX)
+
+
+def resolve(path):
+    """
+    Path of a capture file as it is on disk: the file itself, or its compressed copy if it has been archived. Metadata
+    refers to files by their original names
+
+    :param path: Path of the file
+    :type path: str
+    :return: Path of the file, or of its compressed copy if only that exists
+    :rtype: str
+    """
+
+    if not os.path.isfile(path) and os.path.isfile(path + COMPRESSED_SUFFIX):
+        return path + COMPRESSED_SUFFIX
+    return path
+
+
+def open_file(path, mode='rt', **kwargs):
+    """
+    Open a capture file, decompressing it as it is read if it has been archived
+
+    :param path: Path of the file, by its original name or its compressed one
+    :type path: str
+    :param mode: Mode, as for open
+    :type mode: str
+    :return: File object
+    """
+
+    _path = resolve(path)
+    if _path.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(_path, mode, **kwargs)
+    return open(_path, mode, **kwargs)
+
+
+def _checksum(fp):
+    _crc, _length = 0, 0
+    for chunk in iter(lambda: fp.read(COPY_BUFFER), b''):
+        _crc = zlib.crc32(chunk, _crc)
+        _length += len(chunk)
+    return _crc, _length
+
+
+def compress_file(path, level=COMPRESS_LEVEL):
+    """
+    Compress a file, verify the compressed copy reads back identical, and replace the file with it
+
+    :param path: Path of the file
+    :type path: str
+    :param level: gzip level
+    :type level: int
+    :return: (size before, size after)
+    :rtype: tuple
+    :raises OSError: If the file could not be compressed or the copy did not verify; the original is kept
+    """
+
+    _target = path + COMPRESSED_SUFFIX
+    _partial = _target + '.partial'
+
+    try:
+        with open(path, 'rb') as source, gzip.open(_partial, 'wb', compresslevel=level) as target:
+            _crc, _length = 0, 0
+            for chunk in iter(lambda: source.read(COPY_BUFFER), b''):
+                _crc = zlib.crc32(chunk, _crc)
+                _length += len(chunk)
+                target.write(chunk)
+
+        with gzip.open(_partial, 'rb') as check:
+            if _checksum(check) != (_crc, _length):
+                raise OSError("Compressed copy of {} does not match".format(path))
+
+        shutil.copystat(path, _partial)
+        os.replace(_partial, _target)
+    except (OSError, EOFError, zlib.error) as e:
+        if os.path.exists(_partial):
+            os.remove(_partial)
+        raise OSError("Could not compress {}: {}".format(path, e))
+
+    os.remove(path)
+    return _length, os.path.getsize(_target)
+
+
+def compress_capture(path):
+    """
+    Compress the bulky files of a capture directory
+
+    :param path: Capture directory
+    :type path: str
+    :return: (files compressed, bytes before, bytes after)
+    :rtype: tuple
+    """
+
+    _files, _before, _after = 0, 0, 0
+    for file in sorted(os.listdir(path)):
+        if not any(file.endswith(suffix) for suffix in archived_suffixes):
+            continue
+        _path = os.path.join(path, file)
+        if not os.path.isfile(_path):
+            continue
+
+        try:
+            _size = compress_file(_path)
+        except OSError as e:
+            module_logger.error(e)
+            continue
+
+        _files += 1
+        _before += _size[0]
+        _after += _size[1]
+
+    if _files:
+        module_logger.info("Compressed {} files in {} from {} to {} bytes".format(_files, path, _before, _after))
+    return _files, _before, _after
+
+
+def compress_directory(path):
+    """
+    Compress every capture under a directory
+
+    :param path: Directory to search
+    :type path: str
+    :return: (files compressed, bytes before, bytes after)
+    :rtype: tuple
+    """
+
+    _files, _before, _after = 0, 0, 0
+    for root, dirs, files in os.walk(path):
+        if not any(file.endswith(capture_suffixes["meta"]) for file in files):
+            continue
+        _result = compress_capture(root)
+        _files += _result[0]
+        _before += _result[1]
+        _after += _result[2]
+
+    print("Compressed {} files from {:.1f}MB to {:.1f}MB".format(_files, _before / 2 ** 20, _after / 2 ** 20))
+    return _files, _before, _after
@@ -1,38 +1,72 @@
+import asyncio
 import csv
+import datetime
 import logging
+import math
 import os
 import queue
+import re
 import shutil
+import signal
 import threading
 import time
 from subprocess import PIPE, Popen
 
-import gpsd
-from tabulate import tabulate
-from tqdm import tqdm, trange
+from tqdm import tqdm
 
 import localizer
-from localizer import antenna, gps, process, interface
-from localizer.meta import meta_csv_fieldnames, capture_suffixes
+from localizer import antenna, gps, hopping, orchestrate, process, interface, schedule, tap, tpacket
+from localizer.meta import meta_csv_fieldnames, capture_suffixes, IEEE80211bg, HOP_ADAPTIVE, HOP_PREDICTIVE, ENGINE_TPACKET, \
+    PROFILE_BEACONS, PROFILE_MGMT, PROFILE_ALL, profile_snaplens
 
 OPTIMAL_CAPTURE_DURATION = 20
 OPTIMAL_CAPTURE_DURATION_FOCUSED = 6
 OPTIMAL_CAPTURE_DEGREES_FOCUSED = 84
 
+# Capture buffer size (MB), for dumpcap or the TPACKET ring; doubled per interface, up to the maximum, whenever a
+# capture drops packets
+CAPTURE_BUFFER = 12
+MAX_CAPTURE_BUFFER = 96
+# Captures dropping more than this share of packets are flagged (and re-run in batches)
+MAX_DROP_RATIO = .05
+
+buffer_sizes = {}
+
+# libpcap capture filters for dumpcap, per capture profile
+capture_filters = {PROFILE_BEACONS: 'type mgt and (subtype beacon or subtype probe-resp)',
+                   PROFILE_MGMT: 'type mgt',
+                   PROFILE_ALL: None}
+
 module_logger = logging.getLogger(__name__)
 
+# Build the waveforms for the standard capture speeds ahead of the first rotation
+antenna.waveforms.preload(antenna.rotation_ramps([OPTIMAL_CAPTURE_DURATION,
+                                                 OPTIMAL_CAPTURE_DURATION_FOCUSED,
+                                                 antenna.FOCUSED_RATE[OPTIMAL_CAPTURE_DEGREES_FOCUSED]]))
+
 
 def capture(params, pass_num=None, reset=None, focused=None):
     _start_time = time.time()
+    _timer = orchestrate.PhaseTimer()
 
     # Create capture file names
     _capture_prefix = time.strftime('%Y%m%d-%H-%M-%S')
-    _capture_file_pcap = _capture_prefix + capture_suffixes["pcap"]
     _capture_file_gps = _capture_prefix + capture_suffixes["nmea"]
     _output_csv_gps = _capture_prefix + capture_suffixes["coords"]
     _output_csv_capture = _capture_prefix + capture_suffixes["meta"]
     _output_csv_guess = _capture_prefix + capture_suffixes["guess"] if params.focused else None
 
+    # Each radio captures its own share of the channels; without hopping, one radio is enough
+    _ifaces = params.ifaces if params.hop_int > 0 else params.ifaces[:1]
+    _partitions = interface.partition_channels(IEEE80211bg, len(_ifaces))
+    _ifaces = _ifaces[:len(_partitions)]
+    if len(_ifaces) > 1:
+        _capture_files_pcap = ["{}-{}{}".format(_capture_prefix, i, capture_suffixes["pcap"]) for i in _ifaces]
+        _output_csvs_channels = ["{}-{}{}".format(_capture_prefix, i, capture_suffixes["channels"]) for i in _ifaces]
+    else:
+        _capture_files_pcap = [_capture_prefix + capture_suffixes["pcap"]]
+        _output_csvs_channels = [_capture_prefix + capture_suffixes["channels"]]
+
     # Build capture path and validate directory
     # Set up working folder
     os.umask(0)
@@ -60,22 +94,24 @@ def capture(params, pass_num=None, reset=None, focused=None):
     _initialize_flag = threading.Event()
     _capture_ready = threading.Event()
 
+    # The gps fix is tracked in the background, so it is usually already there by the time the threads are ready
+    _fix = gps.service()
+
     module_logger.info("Setting up capture threads")
 
     # Show progress bar of creating threads
-    with tqdm(total=4, desc="{:<35}".format("Setting up threads")) as pbar:
+    with tqdm(total=2 + 2 * len(_ifaces), desc="{:<35}".format("Setting up threads")) as pbar:
 
-        # Set up antenna control thread
+        # Set up antenna control thread; it resets the antenna while the other threads set up
         _antenna_response_queue = queue.Queue()
         _antenna_thread = antenna.AntennaThread(_antenna_response_queue,
                                                 _capture_ready,
                                                 params.duration,
                                                 params.degrees,
                                                 params.bearing_magnetic,
-                                                reset)
+                                                reset,
+                                                params.clockwise)
         _antenna_thread.start()
-        # Wait for antenna to be ready
-        _antenna_response_queue.get()
         pbar.update()
         pbar.refresh()
 
@@ -90,85 +126,129 @@ def capture(params, pass_num=None, reset=None, focused=None):
         pbar.update()
         pbar.refresh()
 
-        # Set up pcap thread
-        _capture_response_queue = queue.Queue()
-        _capture_thread = CaptureThread(_capture_response_queue,
-                                        _initialize_flag,
-                                        _capture_ready,
-                                        params.iface,
-                                        params.duration,
-                                        os.path.join(_capture_path, _capture_file_pcap))
-        _capture_thread.start()
-        pbar.update()
-        pbar.refresh()
-
-        # Set up WiFi channel scanner thread
-        _channel_hopper_thread = interface.ChannelThread(_capture_ready,
-                                                         params.iface,
-                                                         params.duration,
-                                                         params.hop_int,
-                                                         distance=params.hop_dist,
-                                                         init_chan=params.channel)
-        _channel_hopper_thread.start()
-        pbar.update()
-        pbar.refresh()
-
-    # Ensure that gps has a 3D fix
-    if not localizer.debug:
-        module_logger.info("Waiting for GPS 3D fix")
-        gps_current_mode = gpsd.get_current().mode
-        time.sleep(.1)
-        try:
-            _time_waited = 0
-            while gps_current_mode != 3:
-                print("Waiting for {}s for 3D gps fix (current mode = '{}' - press 'CTRL-c to cancel)"
-                      .format(_time_waited, gpsd.get_current().mode))
-                time.sleep(1)
-                _time_waited += 1
-                gps_current_mode = gpsd.get_current().mode
-        except KeyboardInterrupt:
-            print('Capture canceled.')
-            return False
-
-    module_logger.info("Triggering synchronized threads")
-    # Start threads
-    _initialize_flag.set()
-
-    if not _capture_ready.is_set():
-        module_logger.info("Waiting for threads to start...")
-        try:
-            _delay_notified = False
-            _timeout_start = time.time()
-            while not _capture_ready.is_set():
-                if time.time() > _timeout_start + 5 and not _delay_notified:
-                    module_logger.error(
-                        "Waiting over 5s for capture to start... Press Ctrl-C to cancel")
-                    _delay_notified = True
-                time.sleep(.1)
-        except KeyboardInterrupt:
-            print('\nCapture canceled.')
-            return False
-
-    # Print out timer to console
-    for _ in trange(int(params.duration), desc="{:<35}"
-                    .format("Capturing packets for {}s".format((str(params.duration))))):
-        time.sleep(1)
-
-    # Show progress bar of getting thread results
-    with tqdm(total=3, desc="{:<35}".format("Waiting for results")) as pbar:
-
-        pbar.update()
-        pbar.refresh()
-        loop_start_time, loop_stop_time = _antenna_response_queue.get()
+        # Set up a pcap thread and a channel hopper per radio
+        _capture_response_queues = []
+        _capture_threads = []
+        _buffers = []
+        _taps = []
+        _hoppers = []
+        _channel_hopper_threads = []
+        for _iface, _channels, _pcap, _timeline in zip(_ifaces, _partitions, _capture_files_pcap, _output_csvs_channels):
+
+            # Set up pcap thread
+            _capture_response_queue = queue.Queue()
+            _buffer = buffer_sizes.get(_iface, CAPTURE_BUFFER)
+            _capture_thread = (tpacket.TPacketCaptureThread if params.capture_engine == ENGINE_TPACKET else CaptureThread)(
+                _capture_response_queue,
+                _initialize_flag,
+                _capture_ready,
+                _iface,
+                params.duration,
+                os.path.join(_capture_path, _pcap),
+                params.capture_profile,
+                buffer=_buffer)
+
+            # Adaptive and predictive hopping watch the capture to see which channels are busy: the in-process engine
+            # hands packets straight to the tap, otherwise the tap follows dumpcap's file
+            _tap = None
+            if params.hop_mode in (HOP_ADAPTIVE, HOP_PREDICTIVE):
+                if params.capture_engine == ENGINE_TPACKET:
+                    _tap = tap.BeaconTap()
+                    _capture_thread.subscribe(_tap.observe)
+                else:
+                    _tap = tap.BeaconTap(os.path.join(_capture_path, _pcap))
+                _tap.start()
+                _taps.append(_tap)
+
+            _capture_thread.start()
+            _capture_response_queues.append(_capture_response_queue)
+            _capture_threads.append(_capture_thread)
+            _buffers.append(_buffer)
+            pbar.update()
+            pbar.refresh()
+
+            # A radio only hops the channels of its partition, with a distance that still visits all of them
+            _init_chan = params.channel if params.channel in _channels else None
+            _hop_dist = params.hop_dist
+            if len(_ifaces) > 1 and math.gcd(_hop_dist, len(_channels)) != 1:
+                _hop_dist = 1
+
+            # Predictive hopping learns beacon timing over the first revolution, then targets the macs. Focused captures
+            # do not hop: they stay on their AP's channel
+            _hopper = hopping.get_hopper(params.hop_mode,
+                                         channels=_channels,
+                                         hop_int=params.hop_int,
+                                         distance=_hop_dist,
+                                         init_chan=_init_chan,
+                                         tap=_tap,
+                                         targets=params.macs,
+                                         learn_time=params.duration * min(1, 360 / abs(params.degrees)) if params.degrees else None)
+            _hoppers.append(_hopper)
+
+            # The in-process engine sees drops as they happen: hop more slowly, so switching costs the capture less
+            if params.capture_engine == ENGINE_TPACKET:
+                _capture_thread.watch_drops(lambda captured, dropped, hopper=_hopper: hopper.back_off())
+
+            # Set up WiFi channel scanner thread
+            _channel_hopper_thread = interface.ChannelThread(_capture_ready,
+                                                             _iface,
+                                                             params.duration,
+                                                             params.hop_int,
+                                                             distance=_hop_dist,
+                                                             init_chan=_init_chan,
+                                                             channels=_channels,
+                                                             timeline_output=os.path.join(_capture_path, _timeline),
+                                                             hopper=_hopper)
+            _channel_hopper_thread.start()
+            _channel_hopper_threads.append(_channel_hopper_thread)
+            pbar.update()
+            pbar.refresh()
+
+    _threads = [_antenna_thread, _gps_thread] + _capture_threads + _channel_hopper_threads
+    _timer.record('setup', _start_time)
 
-        pbar.update()
-        pbar.refresh()
-        _avg_lat, _avg_lon, _avg_alt, _avg_lat_err, _avg_lon_err, _avg_alt_err = _gps_response_queue.get()
-
-        pbar.update()
-        pbar.refresh()
-        _capture_result_cap, _capture_result_drop = _capture_response_queue.get()
-        module_logger.info("Captured {} packets ({} dropped)".format(_capture_result_cap, _capture_result_drop))
+    try:
+        orchestrate.run(_start_capture(_timer, _antenna_response_queue, _fix, _initialize_flag, _capture_ready))
+        (loop_start_time, loop_stop_time), _gps_result, _capture_results = orchestrate.run(
+            _collect_results(_timer, params.duration, _antenna_response_queue, _gps_response_queue,
+                             _capture_response_queues, _channel_hopper_threads))
+    except KeyboardInterrupt:
+        print('\nCapture canceled.')
+        _cancel(_threads, _initialize_flag, _capture_ready)
+        for _tap in _taps:
+            _tap.stop()
+        return False
+
+    _avg_lat, _avg_lon, _avg_alt, _avg_lat_err, _avg_lon_err, _avg_alt_err = _gps_result
+
+    with tqdm(total=len(_ifaces), desc="{:<35}".format("Waiting for results")) as pbar:
+
+        _capture_result_cap = _capture_result_drop = 0
+        for _iface, _buffer, (_cap, _drop) in zip(_ifaces, _buffers, _capture_results):
+            pbar.update()
+            pbar.refresh()
+            module_logger.info("Captured {} packets on {} ({} dropped)".format(_cap, _iface, _drop))
+            if _drop:
+                raise_buffer(_iface, _buffer, _drop)
+            _capture_result_cap += _cap
+            _capture_result_drop += _drop
+
+        if drop_ratio(_capture_result_cap, _capture_result_drop) > MAX_DROP_RATIO:
+            module_logger.warning("Capture dropped {} of {} packets; its results will be weak"
+                                  .format(_capture_result_drop, _capture_result_cap + _capture_result_drop))
+
+        for _tap in _taps:
+            _tap.stop()
+            _tap.join()
+
+        _beacons_planned = _beacons_hit = None
+        if params.hop_mode == HOP_PREDICTIVE:
+            _beacons_planned = _beacons_hit = 0
+            for _hopper in _hoppers:
+                for bssid, (planned, hit) in sorted(_hopper.hit_rates().items()):
+                    module_logger.info("Predicted {} beacons from {}, caught {}".format(planned, bssid, hit))
+                    _beacons_planned += planned
+                    _beacons_hit += hit
 
     # Create Meta Dict
     _capture_csv_data = {
@@ -188,11 +268,20 @@ def capture(params, pass_num=None, reset=None, focused=None):
         meta_csv_fieldnames[13]: loop_stop_time,
         meta_csv_fieldnames[14]: params.degrees,
         meta_csv_fieldnames[15]: params.bearing_magnetic,
-        meta_csv_fieldnames[16]: _capture_file_pcap,
+        meta_csv_fieldnames[16]: ','.join(_capture_files_pcap),
         meta_csv_fieldnames[17]: _capture_file_gps,
         meta_csv_fieldnames[18]: _output_csv_gps,
         meta_csv_fieldnames[19]: focused,
         meta_csv_fieldnames[20]: _output_csv_guess,
+        meta_csv_fieldnames[24]: params.clockwise,
+        meta_csv_fieldnames[25]: ','.join(_output_csvs_channels),
+        meta_csv_fieldnames[26]: params.hop_mode,
+        meta_csv_fieldnames[27]: _beacons_planned,
+        meta_csv_fieldnames[28]: _beacons_hit,
+        meta_csv_fieldnames[29]: _capture_result_cap,
+        meta_csv_fieldnames[30]: _capture_result_drop,
+        meta_csv_fieldnames[31]: params.capture_engine,
+        meta_csv_fieldnames[32]: params.capture_profile,
     }
 
     # Perform processing while we wait for threads to finish:
@@ -200,29 +289,26 @@ def capture(params, pass_num=None, reset=None, focused=None):
     _guess_time_start = time.time()
     if params.focused:
         module_logger.info("Processing capture")
-        _, _, _, _guesses = process.process_capture(_capture_csv_data, _capture_path, write_to_disk=True, guess=True, clockwise=True, macs=params.macs)
+        _, _, _, _guesses = process.process_capture(_capture_csv_data, _capture_path, write_to_disk=True, guess=True, clockwise=params.clockwise, macs=params.macs)
         _guesses.to_csv(os.path.join(_capture_path, _output_csv_guess), sep=',')
     _guess_time_end = time.time()
+    _timer.record('processing', _guess_time_start)
 
     # Show progress bar of joining threads
-    with tqdm(total=4, desc="{:<35}".format("Waiting for threads")) as pbar:
-
-        # Channel Hopper Thread
-        pbar.update()
-        pbar.refresh()
-        _channel_hopper_thread.join()
-
-        pbar.update()
-        pbar.refresh()
-        _antenna_thread.join()
+    # The antenna thread is not joined; its trailing reset overlaps with the next capture's setup
+    _join_start = time.time()
+    with tqdm(total=1 + len(_capture_threads), desc="{:<35}".format("Waiting for threads")) as pbar:
 
         pbar.update()
         pbar.refresh()
         _gps_thread.join()
 
-        pbar.update()
-        pbar.refresh()
-        _capture_thread.join()
+        for _capture_thread in _capture_threads:
+            pbar.update()
+            pbar.refresh()
+            _capture_thread.join()
+    _timer.record('join', _join_start)
+    module_logger.info("Capture phases (s): {}".format(_timer))
 
     # Write capture metadata to disk
     module_logger.info("Writing capture metadata to csv")
@@ -232,6 +318,7 @@ def capture(params, pass_num=None, reset=None, focused=None):
         _capture_csv_data[meta_csv_fieldnames[21]] = time.time() - _start_time
         _capture_csv_data[meta_csv_fieldnames[22]] = len(_guesses) if _guesses is not None else None
         _capture_csv_data[meta_csv_fieldnames[23]] = _guess_time_end - _guess_time_start if _guesses is not None else None
+        _capture_csv_data[meta_csv_fieldnames[33]] = str(_timer)
         _capture_csv_writer.writerow(_capture_csv_data)
 
     # Perform focused-level captures
@@ -240,22 +327,33 @@ def capture(params, pass_num=None, reset=None, focused=None):
         _width = params.focused[0]
         _duration = params.focused[1]
 
-        _params = []
+        _sectors = []
 
         for i, row in _guesses.iterrows():
             _bearing_guess = row.bearing
             _focused = row.bssid
 
-            _new_bearing = _bearing_guess - _width/2
-            _new_degrees = _width
-
             _param = params.copy()
-            _param.bearing_magnetic = _new_bearing
-            _param.degrees = _new_degrees
             _param.duration = _duration
             _param.channel = row.channel
             _param.hop_int = 0
             _param.focused = None
+            _sectors.append(schedule.Sector(_bearing_guess - _width/2, _width, _duration, (_param, _focused)))
+
+        # Order the sectors (and sweep directions) to minimize time spent resetting the antenna
+        _visits, _predicted = schedule.plan(antenna.bearing_current, _sectors,
+                                            antenna.AntennaThread.travel_time,
+                                            antenna.bearing_min, antenna.bearing_max,
+                                            return_bearing=params.bearing_magnetic)
+        print("Performing {} focused captures, predicted duration {}"
+              .format(len(_visits), datetime.timedelta(seconds=round(_predicted))))
+
+        _params = []
+        for _sector, _clockwise in _visits:
+            _param, _focused = _sector.key
+            _param.bearing_magnetic = _sector.start(_clockwise)
+            _param.degrees = _sector.width
+            _param.clockwise = _clockwise
             _params.append((_param, _focused))
 
         # Try to set the next bearing to speed up capture
@@ -274,9 +372,91 @@ def capture(params, pass_num=None, reset=None, focused=None):
     return _capture_path, _output_csv_capture
 
 
+async def _start_capture(timer, antenna_response_queue, fix, initialize_flag, capture_ready):
+    """
+    Wait for the antenna and a gps fix, then trigger the synchronized threads and wait for the capture to start
+
+    :param timer: Timer to record the phases in
+    :type timer: orchestrate.PhaseTimer
+    :param antenna_response_queue: Queue the antenna reports ready on
+    :type antenna_response_queue: queue.Queue
+    :param fix: GPS service
+    :type fix: gps.GPSService
+    :param initialize_flag: Flag that starts the threads
+    :type initialize_flag: threading.Event
+    :param capture_ready: Flag raised once the capture has started
+    :type capture_ready: threading.Event
+    """
+
+    with timer.phase('antenna'):
+        await orchestrate.get_result(antenna_response_queue)
+
+    # Ensure that gps has a 3D fix
+    with timer.phase('fix'):
+        if not localizer.debug and not fix.wait_for_fix(0):
+            module_logger.info("Waiting for GPS 3D fix")
+            _time_waited = 0
+            while not await orchestrate.in_thread(fix.wait_for_fix, 1):
+                _time_waited += 1
+                print("Waiting for {}s for 3D gps fix (current mode = '{}' - press 'CTRL-c to cancel)"
+                      .format(_time_waited, fix.mode))
+
+    module_logger.info("Triggering synchronized threads")
+    with timer.phase('start'):
+        initialize_flag.set()
+        if not await orchestrate.wait_event(capture_ready, 5):
+            module_logger.error("Waiting over 5s for capture to start... Press Ctrl-C to cancel")
+            await orchestrate.wait_event(capture_ready)
+
+
+async def _collect_results(timer, duration, antenna_response_queue, gps_response_queue, capture_response_queues, hopper_threads):
+    """
+    Count down the capture, then gather every thread's results at once
+
+    :param timer: Timer to record the phases in
+    :type timer: orchestrate.PhaseTimer
+    :param duration: Duration of the capture (s)
+    :type duration: float
+    :param hopper_threads: Channel hopper threads, whose timelines are needed for processing
+    :type hopper_threads: list[threading.Thread]
+    :return: ((loop start, loop stop), gps statistics, list of (captured, dropped) per radio)
+    :rtype: tuple
+    """
+
+    # Responses are awaited from the start, so each is picked up as soon as it is ready
+    _antenna = orchestrate.get_result(antenna_response_queue)
+    _gps = orchestrate.get_result(gps_response_queue)
+    _captures = asyncio.gather(*[orchestrate.get_result(q) for q in capture_response_queues])
+    _hoppers = asyncio.gather(*[orchestrate.join_thread(t) for t in hopper_threads])
+
+    with timer.phase('capture'):
+        await orchestrate.countdown(duration, "Capturing packets for {}s".format(duration))
+
+    with timer.phase('results'):
+        _loop_times, _gps_result, _capture_results, _ = await asyncio.gather(_antenna, _gps, _captures, _hoppers)
+
+    return _loop_times, _gps_result, _capture_results
+
+
+def _cancel(threads, *flags):
+    """
+    Cancel capture threads and release the flags they are waiting on
+
+    :param threads: Threads with a cancel() method
+    :type threads: list
+    :param flags: Synchronization flags to raise
+    :type flags: threading.Event
+    """
+
+    for thread in threads:
+        thread.cancel()
+    for flag in flags:
+        flag.set()
+
+
 class CaptureThread(threading.Thread):
 
-    def __init__(self, response_queue, initialize_flag, start_flag, iface, duration, output):
+    def __init__(self, response_queue, initialize_flag, start_flag, iface, duration, output, profile=PROFILE_BEACONS, buffer=None):
 
         super().__init__()
 
@@ -289,10 +469,23 @@ class CaptureThread(threading.Thread):
         self._iface = iface
         self._duration = duration
         self._output = output
+        self._cancelled = False
+
+        # Live capture count, from dumpcap's periodic report; drops are only known from its summary at the end
+        self.captured = 0
+        self.dropped = 0
+        self._stderr = []
 
         # Check for required system packages
         self._pcap_util = "dumpcap"
-        self._pcap_params = ['-i', self._iface, '-B', '12', '-q']
+        self._buffer = buffer or buffer_sizes.get(self._iface, CAPTURE_BUFFER)
+        self._pcap_params = ['-i', self._iface, '-B', str(self._buffer)]
+
+        # Filter and truncate in the kernel, so unused frames never reach the disk
+        if capture_filters[profile]:
+            self._pcap_params += ['-f', capture_filters[profile]]
+        if profile_snaplens[profile]:
+            self._pcap_params += ['-s', str(profile_snaplens[profile])]
 
         if shutil.which(self._pcap_util) is None:
             module_logger.error("Required packet capture system tool '{}' is not installed"
@@ -306,75 +499,137 @@ class CaptureThread(threading.Thread):
     def run(self):
         module_logger.info("Executing capture thread")
 
-        _dur = int(self._duration + 1)
-        command = [self._pcap_util] + self._pcap_params + ["-a", "duration:{}".format(_dur), "-w", self._output]
+        command = [self._pcap_util] + self._pcap_params + ["-w", self._output]
 
-        # Wait for synchronization signal
-        self._initialize_flag.wait()
-
-        _start_time = time.time()
+        # Start dumpcap while the other threads set up; processing drops packets outside of the sweep
         proc = Popen(command, stdout=PIPE, stderr=PIPE)
 
-        # Wait for process to output "File: ..." to stderr and then set flag for other threads
+        # Wait for process to output "File: ..." to stderr
         curr_line = ""
         while not curr_line.startswith("File:"):
             curr_line = proc.stderr.readline().decode()
-            time.sleep(.1)
+            if not curr_line and proc.poll() is not None:
+                raise ValueError("Capture failed to start")
 
-        # Tell other threads to start
+        # Follow dumpcap's "Packets: N" reports for the rest of the capture
+        _reader = threading.Thread(target=self._read_stats, args=(proc.stderr,), daemon=True)
+        _reader.start()
+
+        # Wait for synchronization signal, then tell other threads to start
+        self._initialize_flag.wait()
+        if self._cancelled:
+            proc.terminate()
+            proc.wait()
+            return
+
+        _start_time = time.time()
         self._start_flag.set()
 
-        # Wait for the dumpcap process to finish
+        # dumpcap is stopped once the duration (plus a margin) has elapsed
+        time.sleep(max(0, _start_time + self._duration + 1 - time.time()))
+
+        # dumpcap reports its statistics on SIGINT
+        proc.send_signal(signal.SIGINT)
         proc.wait()
+        _reader.join()
         _end_time = time.time()
 
         module_logger.info("Captured packets for {:.2f}s (expected {}s)".format(_end_time-_start_time, self._duration))
 
-        import re
-        matches = re.search("(?<=dropped on interface\s')(?:\S+':\s)(\d+)/(\d+)", proc.stderr.read().decode())
-        if matches is not None and len(matches.groups()) == 2:
-            num_cap = int(matches.groups()[0])
-            num_drop = int(matches.groups()[1])
-        else:
+        _summary = dumpcap_summary(''.join(self._stderr))
+        if _summary is None:
             raise ValueError("Capture failed")
 
+        num_cap, num_drop, _ifdrop = _summary
+        if _ifdrop:
+            # Dropped by the driver or the network stack before the capture socket: a larger buffer would not help
+            module_logger.info("{} dropped {} packets before the capture saw them".format(self._iface, _ifdrop))
+
+        self.captured, self.dropped = num_cap, num_drop
+
         # Respond with actual
         self._response_queue.put((num_cap, num_drop))
         self._response_queue.put((_start_time, _end_time))
 
+    def cancel(self):
+        """
+        Stop dumpcap without capturing once the synchronization flag is raised
+        """
+
+        self._cancelled = True
+
+    def _read_stats(self, stderr):
+        # dumpcap rewrites its packet count in place with carriage returns
+        _line = b''
+        while True:
+            _char = stderr.read(1)
+            if not _char or _char in b'\r\n':
+                _text = _line.decode(errors='replace')
+                self._stderr.append(_text + '\n')
+                _match = re.match(r'Packets: (\d+)', _text.strip())
+                if _match:
+                    self.captured = int(_match.group(1))
+                _line = b''
+                if not _char:
+                    return
+            else:
+                _line += _char
 
-class APs:
 
-    def __init__(self):
-        self._aps = None
+def raise_buffer(iface, buffer, dropped):
+    """
+    Double the capture buffer of an interface for its next capture, up to MAX_CAPTURE_BUFFER
 
-    @property
-    def aps(self):
-        return self._aps
+    :param iface: Interface
+    :type iface: str
+    :param buffer: Buffer the dropping capture ran with (MB)
+    :type buffer: int
+    :param dropped: Packets dropped
+    :type dropped: int
+    """
 
-    @aps.setter
-    def aps(self, val):
-        self._aps = val.reset_index(drop=True)
+    _buffer = min(buffer * 2, MAX_CAPTURE_BUFFER)
+    buffer_sizes[iface] = _buffer
+    module_logger.warning("{} dropped {} packets; raising the capture buffer to {}MB for the next capture"
+                          .format(iface, dropped, _buffer))
+
+
+def dumpcap_summary(text):
+    """
+    Packet counts from the summary dumpcap prints when it stops, eg
+    "Packets received/dropped on interface 'wlan0': 100/2 (pcap:2/dumpcap:0/flushed:0/ps_ifdrop:7) (98.0%)".
+    Dropped packets are those the capture lost itself (the kernel ring, dumpcap's buffer, or flushing), which a larger
+    buffer helps with; packets the interface dropped before the capture socket (ps_ifdrop) are reported apart
+
+    :param text: dumpcap's stderr
+    :type text: str
+    :return: (captured, dropped, dropped by the interface), or None if there is no summary
+    :rtype: tuple
+    """
+
+    _match = re.search(r"Packets received/dropped on interface '?([^':]+)'?: (\d+)/(\d+)(?: \(([^)]*)\))?", text)
+    if _match is None:
+        return None
+
+    _details = dict(item.split(':', 1) for item in (_match.group(4) or '').split('/') if ':' in item)
+    try:
+        _ifdrop = int(_details.get('ps_ifdrop', 0))
+    except ValueError:
+        _ifdrop = 0
+    return int(_match.group(2)), int(_match.group(3)), _ifdrop
 
-    def update(self, val):
-        for i, row in val.iterrows():
-            # If the new row exists in the dataframe, update the existing value
-            if row.bssid in self._aps.bssid.unique():
-                self._aps.iloc[self._aps.index[self._aps.bssid == row.bssid][0]] = row
-            # If it's not in the current list, add it
-            else:
-                self._aps = self._aps.append(row)
 
-        self._aps.reset_index(inplace=True, drop=True)
+def drop_ratio(captured, dropped):
+    """
+    Share of packets dropped during a capture
 
-    def __getitem__(self, arg):
-        return self._aps.iloc[arg]
+    :param captured: Packets captured
+    :type captured: int
+    :param dropped: Packets dropped
+    :type dropped: int
+    :rtype: float
+    """
 
-    def __len__(self):
-        if self._aps is None:
-            return 0
-        else:
-            return len(self._aps)
+    _total = int(captured or 0) + int(dropped or 0)
+    return int(dropped or 0) / _total if _total else 0
 
-    def __str__(self):
-        return tabulate(self._aps, headers='keys', tablefmt='psql')
@@ -0,0 +1,123 @@
+import collections
+import logging
+import math
+
+from localizer.meta import IEEE80211bg, STD_BEACON_INT
+from localizer.hopping import stride_order
+from localizer.hopplan import SWITCH_LATENCY
+
+module_logger = logging.getLogger(__name__)
+
+# Degrees per sample that the standard 20s sweep of 360 degrees reaches at the default hop settings (min_duration gives
+# 19.8s), so automatic durations keep today's bearing accuracy, and narrower sweeps get proportionally shorter
+DEFAULT_RESOLUTION = 40
+DEFAULT_CONFIDENCE = .95
+
+
+def channel_visits(channels, hop_dist):
+    """
+    Number of visits each channel gets per hop cycle
+
+    :param channels: Channels to hop
+    :type channels: list[int]
+    :param hop_dist: Number of channels to advance per hop
+    :type hop_dist: int
+    :return: (Dictionary of channel to visits per cycle, hops per cycle)
+    :rtype: tuple
+    """
+
+    # The stride returns to its start after len / gcd hops, visiting only the channels on its orbit
+    _hops = len(channels) // math.gcd(hop_dist, len(channels))
+    return collections.Counter(channels[i] for i in stride_order(channels, hop_dist)[:_hops]), _hops
+
+
+def catch_probability(hop_int, latency=SWITCH_LATENCY, beacon_int=STD_BEACON_INT):
+    """
+    Probability that one visit to a channel catches a beacon from a given AP on it
+
+    :param hop_int: Dwell per hop (s)
+    :type hop_int: float
+    :param latency: Switch latency (s)
+    :type latency: float
+    :param beacon_int: Beacon interval of the AP (s)
+    :type beacon_int: float
+    :rtype: float
+    """
+
+    return min(1, max(0, hop_int - latency) / beacon_int)
+
+
+def angular_density(duration, degrees, hop_int, hop_dist, channels=IEEE80211bg, latency=SWITCH_LATENCY, beacon_int=STD_BEACON_INT):
+    """
+    Degrees the antenna turns between samples of an AP, per channel
+
+    :param duration: Duration of the sweep (s)
+    :type duration: float
+    :param degrees: Degrees swept
+    :type degrees: float
+    :param hop_int: Dwell per hop (s), or 0 for a fixed channel
+    :type hop_int: float
+    :param hop_dist: Number of channels to advance per hop
+    :type hop_dist: int
+    :param channels: Channels to hop, or the fixed channel alone
+    :type channels: list[int]
+    :return: Dictionary of channel to expected degrees per beacon caught (inf for channels never visited)
+    :rtype: dict
+    """
+
+    _rate = abs(degrees) / duration
+    if not hop_int:
+        # A fixed channel catches every beacon
+        return {c: _rate * beacon_int for c in channels}
+
+    _visits, _hops = channel_visits(channels, hop_dist)
+    _cycle = _hops * hop_int
+    _p = catch_probability(hop_int, latency, beacon_int)
+
+    return {c: (_rate * _cycle / (_visits[c] * _p)) if _visits[c] and _p else math.inf for c in channels}
+
+
+def min_duration(degrees, hop_int, hop_dist, resolution=DEFAULT_RESOLUTION, confidence=DEFAULT_CONFIDENCE, channels=IEEE80211bg, latency=SWITCH_LATENCY, beacon_int=STD_BEACON_INT):
+    """
+    Shortest sweep that catches at least one beacon from an AP on any hopped channel in every `resolution` degrees,
+    with the given confidence. Visits are treated as independent draws, which holds for hop intervals coprime with the
+    beacon interval
+
+    :param degrees: Degrees swept
+    :type degrees: float
+    :param hop_int: Dwell per hop (s), or 0 for a fixed channel
+    :type hop_int: float
+    :param hop_dist: Number of channels to advance per hop
+    :type hop_dist: int
+    :param resolution: Degrees per sample
+    :type resolution: float
+    :param confidence: Probability of catching a beacon in each window of resolution degrees
+    :type confidence: float
+    :param channels: Channels to hop
+    :type channels: list[int]
+    :return: Duration (s)
+    :rtype: float
+    """
+
+    if not 0 < confidence < 1:
+        raise ValueError("Invalid confidence: {}; should be between 0 and 1".format(confidence))
+    if resolution <= 0:
+        raise ValueError("Invalid resolution: {}; should be > 0".format(resolution))
+
+    if not hop_int:
+        # A fixed channel catches every beacon: a window only has to span one beacon interval
+        _needed, _p = 1, 1
+        _window = beacon_int
+    else:
+        _p = catch_probability(hop_int, latency, beacon_int)
+        if not _p:
+            raise ValueError("Hop interval {} is shorter than the switch latency".format(hop_int))
+
+        # Visits needed per window, then the window that holds that many whole visits of the least visited channel
+        _needed = 1 if _p == 1 else math.ceil(math.log(1 - confidence) / math.log(1 - _p))
+        _visits, _hops = channel_visits(channels, hop_dist)
+        _window = _needed * _hops * hop_int / min(_visits.values()) + hop_int
+
+    _duration = math.ceil(_window * abs(degrees) / resolution * 10) / 10
+    module_logger.debug("{} visits per channel per {} degrees at p={:.2f}: {}s".format(_needed, resolution, _p, _duration))
+    return _duration
@@ -0,0 +1,242 @@
+import ctypes
+import ctypes.util
+import gzip
+import http.server
+import logging
+import os
+import platform
+import re
+import socketserver
+import threading
+import time
+
+from localizer.archive import COMPRESSED_SUFFIX
+
+module_logger = logging.getLogger(__name__)
+
+# Combined rate files are served at, across all clients (bytes/s); leaves the SD card to the capture. None is unlimited
+BANDWIDTH_LIMIT = 4 * 2 ** 20
+# Clients served at once; others wait for a free slot
+MAX_CLIENTS = 8
+# Bytes sent per throttled sendfile call
+SEND_CHUNK = 2 ** 16
+# Niceness of the threads serving files
+SERVE_NICENESS = 19
+
+# ioprio_set(2), to put serving threads in the idle I/O class: syscall numbers per architecture
+IOPRIO_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289, 'armv6l': 314, 'armv7l': 314, 'aarch64': 30}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def lower_priority():
+    """
+    Lower the CPU and I/O priority of the calling thread, so it only gets what the capture leaves over
+    """
+
+    _tid = threading.get_native_id() if hasattr(threading, 'get_native_id') else 0
+    try:
+        os.setpriority(os.PRIO_PROCESS, _tid, SERVE_NICENESS)
+    except (AttributeError, OSError) as e:
+        module_logger.debug("Could not lower cpu priority: {}".format(e))
+
+    _syscall = IOPRIO_SYSCALLS.get(platform.machine())
+    if _syscall is None:
+        module_logger.debug("Could not lower io priority: unknown architecture {}".format(platform.machine()))
+        return
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if _libc.syscall(_syscall, IOPRIO_WHO_PROCESS, _tid, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+        module_logger.debug("Could not lower io priority: {}".format(os.strerror(ctypes.get_errno())))
+
+
+def parse_range(header, size):
+    """
+    Parse a single byte range request
+
+    :param header: Value of the Range header
+    :type header: str
+    :param size: Size of the file
+    :type size: int
+    :return: (start, end) inclusive, None to serve the whole file (no range, or one we do not handle), or False if
+             the range can not be satisfied
+    :rtype: tuple
+    """
+
+    _match = _RANGE.match(header.strip()) if header else None
+    if not _match or not any(_match.groups()):
+        return None
+
+    _start, _end = _match.groups()
+    if not _start:
+        # Suffix range: the last n bytes
+        _length = int(_end)
+        if not _length or not size:
+            return False
+        return max(0, size - _length), size - 1
+
+    _start = int(_start)
+    _end = min(int(_end), size - 1) if _end else size - 1
+    if _start >= size or _end < _start:
+        return False
+    return _start, _end
+
+
+class Throttle:
+
+    def __init__(self, rate):
+        """
+        Token bucket shared by every client of a server
+
+        :param rate: Bytes per second
+        :type rate: float
+        """
+
+        self._rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def take(self, count):
+        """
+        Wait until count bytes may be sent
+
+        :param count: Bytes
+        :type count: int
+        """
+
+        with self._lock:
+            _now = time.monotonic()
+            _start = max(_now, self._next)
+            self._next = _start + count / self._rate
+        if _start > _now:
+            time.sleep(_start - _now)
+
+
+class FileServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler=None, bandwidth=BANDWIDTH_LIMIT, max_clients=MAX_CLIENTS):
+        """
+        Threaded file server for the working directory: files go out with sendfile at low CPU and I/O priority,
+        throttled to a shared bandwidth, and byte ranges are honoured so large downloads can resume
+
+        :param address: (host, port)
+        :type address: tuple
+        :param bandwidth: Combined bytes per second, or None for unlimited
+        :type bandwidth: float
+        :param max_clients: Clients served at once
+        :type max_clients: int
+        """
+
+        super().__init__(address, handler or FileRequestHandler)
+        self.throttle = Throttle(bandwidth) if bandwidth else None
+        self._slots = threading.BoundedSemaphore(max_clients)
+
+    def process_request_thread(self, request, client_address):
+        lower_priority()
+        with self._slots:
+            super().process_request_thread(request, client_address)
+
+
+class FileRequestHandler(http.server.SimpleHTTPRequestHandler):
+
+    def __init__(self, *args, **kwargs):
+        self._range = None
+        self._stream = False
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def send_head(self):
+        _path = self.translate_path(self.path)
+        _encoding = None
+        if self.path.split('?', 1)[0].split('#', 1)[0].endswith('/'):
+            return super().send_head()
+        if not os.path.exists(_path) and os.path.isfile(_path + COMPRESSED_SUFFIX):
+            # Archived: clients that take gzip get the compressed file as is, others a decompressed stream
+            if 'gzip' not in self.headers.get('Accept-Encoding', ''):
+                return self._send_decompressed(_path)
+            _encoding = 'gzip'
+        elif not os.path.isfile(_path):
+            return super().send_head()
+
+        try:
+            _file = open(_path + COMPRESSED_SUFFIX if _encoding else _path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        try:
+            _stat = os.fstat(_file.fileno())
+            _size = _stat.st_size
+            _range = parse_range(self.headers.get('Range'), _size)
+            if _range is False:
+                _file.close()
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(_size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+            self._range = _range or (0, _size - 1)
+            self.send_response(206 if _range else 200)
+            self.send_header("Content-type", self.guess_type(_path))
+            self.send_header("Accept-Ranges", "bytes")
+            if _encoding:
+                self.send_header("Content-Encoding", _encoding)
+                self.send_header("Vary", "Accept-Encoding")
+            if _range:
+                self.send_header("Content-Range", "bytes {}-{}/{}".format(_range[0], _range[1], _size))
+            self.send_header("Content-Length", str(self._range[1] - self._range[0] + 1))
+            self.send_header("Last-Modified", self.date_time_string(_stat.st_mtime))
+            self.end_headers()
+            return _file
+        except Exception:
+            _file.close()
+            raise
+
+    def _send_decompressed(self, path):
+        try:
+            _file = gzip.open(path + COMPRESSED_SUFFIX, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        # The decompressed size is not known up front: the response ends when the connection closes
+        self._stream = True
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Last-Modified", self.date_time_string(os.stat(path + COMPRESSED_SUFFIX).st_mtime))
+        self.end_headers()
+        return _file
+
+    def copyfile(self, source, outputfile):
+        if self._stream:
+            _throttle = self.server.throttle
+            for chunk in iter(lambda: source.read(SEND_CHUNK), b''):
+                if _throttle:
+                    _throttle.take(len(chunk))
+                outputfile.write(chunk)
+            return
+
+        if self._range is None:
+            return super().copyfile(source, outputfile)
+
+        # Straight from the page cache to the socket
+        _offset, _end = self._range
+        _throttle = self.server.throttle
+        while _offset <= _end:
+            _count = min(SEND_CHUNK, _end - _offset + 1) if _throttle else _end - _offset + 1
+            if _throttle:
+                _throttle.take(_count)
+            _sent = self.connection.sendfile(source, _offset, _count)
+            if not _sent:
+                break
+            _offset += _sent
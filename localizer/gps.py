@@ -1,49 +1,275 @@
+import collections
 import csv
+import json
 import logging
 import os
-import shutil
+import socket
 import threading
 import time
-from subprocess import Popen
-
-import gpsd
 
 module_logger = logging.getLogger(__name__)
 
+# gpsd address
+GPSD_HOST = '127.0.0.1'
+GPSD_PORT = 2947
+# Reports kept in memory, enough for over an hour at 10Hz
+GPS_HISTORY = 2 ** 16
+# NMEA sentences kept in memory; devices send several per fix
+NMEA_HISTORY = 2 ** 19
+# The fix is considered lost if gpsd sends no position for this long (s)
+FIX_TIMEOUT = 3
+# Wait between attempts to reach gpsd (s)
+RECONNECT_DELAY = 1
+# GST reports 1 sigma errors per axis, TPV reports them at 95% confidence; this scales the former to the latter
+GST_95_SCALE = 1.96
 
-# GPS Update frequency - Depends on hardware - eg BU-353-S4 http://usglobalsat.com/store/gpsfacts/bu353s4_gps_facts.html
-_gps_update_frequency = 1
+_WATCH = b'?WATCH={"enable":true,"json":true,"nmea":true}\n'
 
+Fix = collections.namedtuple('Fix', ['timestamp', 'mode', 'lat', 'lon', 'alt', 'lat_err', 'lon_err', 'alt_err'])
 
-def _initialize():
-    # initialize GPS information
-    if shutil.which("gpsd") is None:
-        module_logger.warning("Required system tool 'gpsd' is not installed")
-        return False
-    if shutil.which("gpspipe") is None:
-        module_logger.warning("Required system tool 'gpspipe' is not installed. On Debian systems it is found in the package 'gpsd-clients'")
-        return False
 
-    gpsd.connect()
+def _initialize(timeout=5):
+    """
+    Start the gps service if needed, and wait for it to reach gpsd and a device
+
+    :param timeout: Seconds to wait
+    :type timeout: float
+    :rtype: bool
+    """
 
-    try:
-        gpsd.device()
-        module_logger.info("GPS device connected: {}".format(gpsd.device()))
-    except (KeyError, IndexError):
+    if not service().wait_for_device(timeout):
         module_logger.warning("GPS device failed to initialize, please make sure that gpsd can see gps data")
         return False
 
     return True
 
 
-_initialize()
+class GPSService(threading.Thread):
+
+    def __init__(self, host=GPSD_HOST, port=GPSD_PORT):
+        """
+        Background thread holding a gpsd watch stream open. Every position report (TPV), error estimate (GST) and raw
+        NMEA sentence is kept in ring buffers, stamped with the time it was received, so captures can read the fixes for
+        their time span instead of polling gpsd themselves, and the fix is always current
+
+        :param host: gpsd host
+        :type host: str
+        :param port: gpsd port
+        :type port: int
+        """
+
+        super().__init__()
+
+        self.daemon = True
+        self._host = host
+        self._port = port
+        self._lock = threading.Lock()
+        self._fixes = collections.deque(maxlen=GPS_HISTORY)
+        self._errors = collections.deque(maxlen=GPS_HISTORY)
+        self._sentences = collections.deque(maxlen=NMEA_HISTORY)
+        self._fix = threading.Event()
+        self._device = threading.Event()
+        self._stopped = threading.Event()
+        self._last_fix = 0
+
+        self.mode = 0
+        self.devices = []
+
+    def run(self):
+        module_logger.info("Executing gps service")
+
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection((self._host, self._port), timeout=RECONNECT_DELAY) as sock:
+                    sock.sendall(_WATCH)
+                    self._follow(sock)
+            except OSError as e:
+                module_logger.debug("Could not follow gpsd ({})".format(e))
+
+            self._set_mode(0)
+            self._device.clear()
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def _follow(self, sock):
+        _buffer = b''
+        while not self._stopped.is_set():
+            try:
+                _data = sock.recv(4096)
+            except socket.timeout:
+                # The device went quiet
+                if time.time() - self._last_fix > FIX_TIMEOUT:
+                    self._set_mode(0)
+                continue
+
+            if not _data:
+                module_logger.warning("gpsd closed the connection")
+                return
+
+            _timestamp = time.time()
+            _lines = (_buffer + _data).split(b'\n')
+            _buffer = _lines.pop()
+            for line in _lines:
+                self._receive(_timestamp, line.decode('ascii', 'replace').strip())
+
+    def _receive(self, timestamp, line):
+        if line.startswith('$') or line.startswith('!'):
+            with self._lock:
+                self._sentences.append((timestamp, line))
+            return
+
+        try:
+            _report = json.loads(line)
+        except ValueError:
+            return
+
+        _class = _report.get('class')
+        if _class == 'TPV':
+            _mode = _report.get('mode', 0)
+            _fix = Fix(timestamp, _mode, _report.get('lat'), _report.get('lon'), _report.get('altMSL', _report.get('alt')),
+                       _report.get('epy'), _report.get('epx'), _report.get('epv'))
+            with self._lock:
+                self._fixes.append(_fix)
+            self._last_fix = timestamp
+            self._set_mode(_mode)
+        elif _class == 'GST':
+            _error = [_report.get(axis) for axis in ('lat', 'lon', 'alt')]
+            with self._lock:
+                self._errors.append((timestamp, *(e * GST_95_SCALE if e is not None else None for e in _error)))
+        elif _class == 'DEVICES':
+            self.devices = [device.get('path') for device in _report.get('devices', [])]
+            if self.devices:
+                module_logger.info("GPS device connected: {}".format(', '.join(str(d) for d in self.devices)))
+                self._device.set()
+            else:
+                self._device.clear()
+        elif _class == 'DEVICE' and _report.get('activated'):
+            self._device.set()
+
+    def _set_mode(self, mode):
+        self.mode = mode
+        if mode == 3:
+            self._fix.set()
+        else:
+            self._fix.clear()
+
+    def wait_for_fix(self, timeout=None):
+        """
+        Wait for a 3D fix
+
+        :param timeout: Seconds to wait, or None to wait indefinitely
+        :type timeout: float
+        :return: True if there is a 3D fix
+        :rtype: bool
+        """
+
+        return self._fix.wait(timeout)
+
+    def wait_for_device(self, timeout=None):
+        """
+        Wait for gpsd to report a device
+
+        :param timeout: Seconds to wait, or None to wait indefinitely
+        :type timeout: float
+        :return: True if gpsd has a device
+        :rtype: bool
+        """
+
+        return self._device.wait(timeout)
+
+    def fixes(self, start, end):
+        """
+        Position reports received in a time span, with the GST error estimate in effect, scaled to 95% confidence as
+        the reports' own are, where the report has none
+
+        :param start: Start of the span
+        :type start: float
+        :param end: End of the span
+        :type end: float
+        :return: Fixes with at least a 2D position
+        :rtype: list[Fix]
+        """
+
+        with self._lock:
+            _fixes = [f for f in self._fixes if start <= f.timestamp <= end and f.mode >= 2]
+            _errors = [e for e in self._errors if e[0] <= end]
+
+        _filled = []
+        _index = 0
+        _error = (None, None, None, None)
+        for fix in _fixes:
+            while _index < len(_errors) and _errors[_index][0] <= fix.timestamp:
+                _error = _errors[_index]
+                _index += 1
+            _filled.append(fix._replace(lat_err=fix.lat_err if fix.lat_err is not None else _error[1],
+                                        lon_err=fix.lon_err if fix.lon_err is not None else _error[2],
+                                        alt_err=fix.alt_err if fix.alt_err is not None else _error[3]))
+
+        return _filled
+
+    def sentences(self, start, end):
+        """
+        NMEA sentences received in a time span
+
+        :param start: Start of the span
+        :type start: float
+        :param end: End of the span
+        :type end: float
+        :return: List of (timestamp, sentence)
+        :rtype: list[tuple]
+        """
+
+        with self._lock:
+            return [s for s in self._sentences if start <= s[0] <= end]
+
+    def stop(self):
+        self._stopped.set()
+
+
+def statistics(fixes):
+    """
+    Average position and errors of a list of fixes
+
+    :param fixes: Fixes
+    :type fixes: list[Fix]
+    :return: (lat, lon, alt, lat_err, lon_err, alt_err), 0 where there is no data
+    :rtype: tuple
+    """
+
+    def _mean(values):
+        _values = [v for v in values if v is not None]
+        return sum(_values) / len(_values) if _values else 0
+
+    return (_mean(f.lat for f in fixes),
+            _mean(f.lon for f in fixes),
+            _mean(f.alt for f in fixes if f.mode == 3),
+            _mean(f.lat_err for f in fixes),
+            _mean(f.lon_err for f in fixes),
+            _mean(f.alt_err for f in fixes if f.mode == 3))
+
+
+_service = None
+
+
+def service(host=GPSD_HOST, port=GPSD_PORT):
+    """
+    Return the shared gps service, starting it on first use
+
+    :rtype: GPSService
+    """
+
+    global _service
+    if _service is None:
+        _service = GPSService(host, port)
+        _service.start()
+    return _service
 
 
 class GPSThread(threading.Thread):
 
     def __init__(self, response_queue, event_flag, duration, nmea_output, csv_output):
         """
-        GPS Thread that, when started and when the flag is raised, records the time and GPS location
+        GPS Thread that, when started and when the flag is raised, records the time and GPS location. Fixes and NMEA
+        come from the gps service's history of the capture's time span
         """
 
         if not _initialize():
@@ -59,40 +285,29 @@ class GPSThread(threading.Thread):
         self._duration = duration
         self._nmea_output = nmea_output
         self._csv_output = csv_output
+        self._cancelled = False
 
     def run(self):
         module_logger.info("Executing gps thread")
 
-        gps_sentences = {}
-
         # Wait for synchronization signal
         self._event_flag.wait()
+        if self._cancelled:
+            return
 
         _start_time = time.time()
-        gpspipe = Popen(['gpspipe', '-r', '-uu', '-o', self._nmea_output])
-
-        # Capture gps data for <duration> seconds
-        t = time.time() + self._duration
-        while time.time() < t:
-            gps_sentences[time.time()] = gpsd.get_current()
-            time.sleep(_gps_update_frequency)
+        time.sleep(self._duration)
+        _end_time = time.time()
 
-        module_logger.info("Terminating gpspipe")
-        gpspipe.terminate()
+        _service = service()
+        _fixes = _service.fixes(_start_time, _end_time)
+        module_logger.info("Captured {} gps fixes for {:.2f}s (expected {}s)"
+                           .format(len(_fixes), _end_time - _start_time, self._duration))
 
-        _end_time = time.time()
-        module_logger.info("Captured gps data for {:.2f}s (expected {}s)".format(_end_time-_start_time, self._duration))
-
-        # Set up average coordinate
-        _avg_lat = 0
-        _avg_lon = 0
-        _avg_alt = 0
-        _avg_lat_err = 0
-        _avg_lon_err = 0
-        _avg_alt_err = 0
-        _lat_err_count = 0
-        _lon_err_count = 0
-        _alt_err_count = 0
+        # Write the sentences as gpspipe -r -uu would have: unix time, then the sentence
+        with open(self._nmea_output, 'w') as nmea_file:
+            for timestamp, sentence in _service.sentences(_start_time, _end_time):
+                nmea_file.write("{:.6f}: {}\n".format(timestamp, sentence))
 
         # Write GPS coordinates to CSV
         with open(self._csv_output, 'w', newline='') as nmea_csv:
@@ -101,44 +316,14 @@ class GPSThread(threading.Thread):
             nmea_csv_writer = csv.DictWriter(nmea_csv, dialect="unix", fieldnames=fieldnames)
             nmea_csv_writer.writeheader()
 
-            for tstamp, msg in gps_sentences.items():
-
-                _avg_lat += msg.lat
-                _avg_lon += msg.lon
-                _avg_alt += msg.alt
-
-                # Retrieve error rates
-                lat_err = None
-                lon_err = None
-                alt_err = None
-                if 'y' in msg.error:
-                    lat_err = msg.error['y']
-                    _lat_err_count += 1
-                if 'x' in msg.error:
-                    lon_err = msg.error['x']
-                    _lon_err_count += 1
-                if 'v' in msg.error:
-                    alt_err = msg.error['v']
-                    _alt_err_count += 1
-
-                nmea_csv_writer.writerow({fieldnames[0]: tstamp,
-                                         fieldnames[1]: msg.lat,
-                                         fieldnames[2]: msg.lon,
-                                         fieldnames[3]: msg.alt,
-                                         fieldnames[4]: lat_err,
-                                         fieldnames[5]: lon_err,
-                                         fieldnames[6]: alt_err})
-
-        # Finish calculating coordinate average
-        try:
-            _avg_lat /= len(gps_sentences)
-            _avg_lon /= len(gps_sentences)
-            _avg_alt /= len(gps_sentences)
-            _avg_lat_err /= _lat_err_count
-            _avg_lon_err /= _lon_err_count
-            _avg_alt_err /= _alt_err_count
-        except ZeroDivisionError:
-            pass
+            for fix in _fixes:
+                nmea_csv_writer.writerow({fieldnames[0]: fix.timestamp,
+                                          fieldnames[1]: fix.lat,
+                                          fieldnames[2]: fix.lon,
+                                          fieldnames[3]: fix.alt,
+                                          fieldnames[4]: fix.lat_err,
+                                          fieldnames[5]: fix.lon_err,
+                                          fieldnames[6]: fix.alt_err})
 
         # Confirm capture file contains gps coordinates
         if os.path.isfile(self._nmea_output) and os.path.isfile(self._csv_output):
@@ -147,5 +332,12 @@ class GPSThread(threading.Thread):
             module_logger.error("Could not capture gps nmea data")
 
         # send gps data back
-        self._response_queue.put((_avg_lat, _avg_lon, _avg_alt, _avg_lat_err, _avg_lon_err, _avg_alt_err))
+        self._response_queue.put(statistics(_fixes))
         self._response_queue.put((_start_time, _end_time))
+
+    def cancel(self):
+        """
+        Stop recording without capturing once the synchronization flag is raised
+        """
+
+        self._cancelled = True
@@ -0,0 +1,316 @@
+import bisect
+import collections
+import logging
+import math
+import threading
+
+from localizer.meta import OPTIMAL_BEACON_INT, STD_BEACON_INT, STD_CHANNEL_DISTANCE, IEEE80211bg, TU, HOP_FIXED, \
+    HOP_ADAPTIVE, HOP_PREDICTIVE, HOP_MODES
+from localizer.pcapng import SUBTYPE_BEACON
+
+module_logger = logging.getLogger(__name__)
+
+# Every channel gets at least this much dwell per rotation, so each AP has a chance to beacon once per rotation
+MIN_DWELL = STD_BEACON_INT
+# Weight every channel starts with, so quiet channels keep a share of the spare dwell
+ADAPTIVE_PRIOR = 1
+# Predictive hopping is live on the target channel this long before a predicted beacon...
+BEACON_LEAD = .003
+# ...and stays for this long after it, to cover contention delay and the beacon's airtime
+BEACON_WINDOW = .006
+# A capture that drops packets slows hopping by this factor each time, up to MAX_BACKOFF times the planned dwell
+BACKOFF_FACTOR = 1.5
+MAX_BACKOFF = 4
+
+BeaconModel = collections.namedtuple('BeaconModel', ['tbtt', 'interval', 'channel'])
+
+
+def stride_order(channels, distance, start=0):
+    """
+    Order in which a rotation visits channels when hopping by a fixed distance
+
+    :param channels: Channels to hop
+    :type channels: list[int]
+    :param distance: Number of channels to advance per hop
+    :type distance: int
+    :param start: Index of the first channel
+    :type start: int
+    :return: Indices into channels, one rotation long
+    :rtype: list[int]
+    """
+
+    return [(start + i * distance) % len(channels) for i in range(len(channels))]
+
+
+def allocate_dwell(order, channels, weights, cycle, min_dwell=MIN_DWELL):
+    """
+    Split a rotation's time between channels: each visit gets min_dwell, and the rest is shared in proportion to the
+    channel's weight
+
+    :param order: Indices into channels, one per visit
+    :type order: list[int]
+    :param channels: Channels to hop
+    :type channels: list[int]
+    :param weights: Dictionary of channel to weight (eg number of BSSIDs seen)
+    :type weights: dict
+    :param cycle: Length of the rotation (s)
+    :type cycle: float
+    :param min_dwell: Minimum dwell per visit (s)
+    :type min_dwell: float
+    :return: Dwell per visit (s)
+    :rtype: list[float]
+    """
+
+    _min_dwell = min(min_dwell, cycle / len(order))
+    _spare = cycle - _min_dwell * len(order)
+
+    # Channels visited more than once per rotation share their weight between visits
+    _visits = {i: order.count(i) for i in order}
+    _weights = [(ADAPTIVE_PRIOR + weights.get(channels[i], 0)) / _visits[i] for i in order]
+    _total = sum(_weights)
+
+    return [_min_dwell + _spare * w / _total for w in _weights]
+
+
+class FixedHopper:
+
+    def __init__(self, channels=IEEE80211bg, hop_int=OPTIMAL_BEACON_INT, distance=STD_CHANNEL_DISTANCE, init_chan=None):
+        """
+        Hop through channels by a fixed distance, dwelling hop_int on each
+
+        :param channels: Channels to hop
+        :type channels: list[int]
+        :param hop_int: Dwell per channel (s)
+        :type hop_int: float
+        :param distance: Number of channels to advance per hop
+        :type distance: int
+        :param init_chan: Channel to start on
+        :type init_chan: int
+        """
+
+        self._channels = channels
+        self._hop_int = hop_int
+        self._max_hop_int = hop_int * MAX_BACKOFF
+        self._distance = distance
+        self._index = channels.index(init_chan) if init_chan else 0
+        self._started = False
+        self._start_time = None
+
+    def start(self, now):
+        """
+        Mark the start of the capture
+
+        :param now: Current time
+        :type now: float
+        """
+
+        self._start_time = now
+
+    def back_off(self):
+        """
+        Hop more slowly, eg while the capture is dropping packets: fewer switches leave the capture more time
+
+        :return: New dwell per channel (s)
+        :rtype: float
+        """
+
+        _hop_int = min(self._hop_int * BACKOFF_FACTOR, self._max_hop_int)
+        if _hop_int > self._hop_int:
+            module_logger.warning("Slowing channel hopping to {:.0f}ms per channel".format(_hop_int * 1000))
+        self._hop_int = _hop_int
+        return _hop_int
+
+    def next(self, now):
+        """
+        Channel to switch to and how long to stay on it
+
+        :param now: Current time
+        :type now: float
+        :return: (channel, dwell)
+        :rtype: tuple
+        """
+
+        if self._started:
+            self._index = (self._index + self._distance) % len(self._channels)
+        self._started = True
+        return self._channels[self._index], self._hop_int
+
+
+class AdaptiveHopper(FixedHopper):
+
+    def __init__(self, tap, channels=IEEE80211bg, hop_int=OPTIMAL_BEACON_INT, distance=STD_CHANNEL_DISTANCE, init_chan=None, min_dwell=MIN_DWELL):
+        """
+        Hop through channels in the same order as FixedHopper, but re-split each rotation's time toward channels where
+        the live capture has seen the most BSSIDs
+
+        :param tap: Beacon tap providing live per-channel counts
+        :type tap: localizer.tap.BeaconTap
+        :param min_dwell: Minimum dwell per channel per rotation (s)
+        :type min_dwell: float
+        """
+
+        super().__init__(channels, hop_int, distance, init_chan)
+
+        self._tap = tap
+        self._min_dwell = min_dwell
+        self._rotation = []
+
+    def next(self, now):
+        if not self._rotation:
+            _start = (self._index + self._distance) % len(self._channels) if self._started else self._index
+            _order = stride_order(self._channels, self._distance, _start)
+            _weights = {channel: bssids for channel, (_, bssids) in self._tap.counts().items()}
+            _dwells = allocate_dwell(_order, self._channels, _weights, self._hop_int * len(_order), self._min_dwell)
+            self._rotation = list(zip(_order, _dwells))
+            module_logger.debug("Rotation dwell: {}".format(
+                ", ".join("{}: {:.0f}ms".format(self._channels[i], d * 1000) for i, d in self._rotation)))
+
+        self._index, _dwell = self._rotation.pop(0)
+        self._started = True
+        return self._channels[self._index], _dwell
+
+
+def next_beacon(model, after):
+    """
+    Predicted time of the first beacon at or after a given time
+
+    :param model: Beacon model of the AP
+    :type model: BeaconModel
+    :param after: Time (s)
+    :type after: float
+    :rtype: float
+    """
+
+    return model.tbtt + math.ceil((after - model.tbtt) / model.interval) * model.interval
+
+
+class PredictiveHopper(FixedHopper):
+
+    def __init__(self, tap, channels=IEEE80211bg, hop_int=OPTIMAL_BEACON_INT, distance=STD_CHANNEL_DISTANCE, init_chan=None, targets=None, learn_time=None):
+        """
+        Learn each target's beacon phase and interval from its TSF and beacon interval fields, then visit its channel
+        just before each predicted beacon. Until every target is learned (or learn_time has passed), and in gaps
+        between predicted beacons, hop like FixedHopper to find the rest
+
+        :param tap: Beacon tap providing live beacons
+        :type tap: localizer.tap.BeaconTap
+        :param targets: BSSIDs to target, or None to target every AP heard
+        :type targets: list[str]
+        :param learn_time: Time to hop normally for before predicting, eg the first revolution of the antenna (s)
+        :type learn_time: float
+        """
+
+        super().__init__(channels, hop_int, distance, init_chan)
+
+        self._targets = {_normalize(t) for t in targets} if targets else None
+        self._learn_time = learn_time
+        self._lock = threading.Lock()
+        self._models = {}
+        self._heard = collections.defaultdict(list)
+        self._planned = []
+
+        tap.subscribe(self._observe)
+
+    def next(self, now):
+        with self._lock:
+            _models = {bssid: m for bssid, m in self._models.items() if m.channel in self._channels}
+
+        if self._learning(now, _models) or not _models:
+            return super().next(now)
+
+        # Aim for the earliest beacon we can still be in time for
+        _upcoming = sorted((next_beacon(m, now + BEACON_LEAD), bssid) for bssid, m in _models.items())
+        _beacon, _bssid = _upcoming[0]
+        _channel = _models[_bssid].channel
+
+        # Nothing is due for a while; hop on to refresh and find other APs in the meantime
+        if _beacon - BEACON_LEAD - now > self._hop_int:
+            _channel, _ = super().next(now)
+            return _channel, min(self._hop_int, _beacon - BEACON_LEAD - now)
+
+        # Stay for any other targets on the same channel that beacon within the next hop interval
+        _hits = [(b, bssid) for b, bssid in _upcoming
+                 if _models[bssid].channel == _channel and b - _beacon <= self._hop_int]
+        _dwell = _hits[-1][0] + BEACON_WINDOW - now
+
+        with self._lock:
+            self._planned.extend((bssid, now, now + _dwell) for _, bssid in _hits)
+
+        self._index = self._channels.index(_channel)
+        self._started = True
+        return _channel, _dwell
+
+    def hit_rates(self):
+        """
+        Planned and achieved beacon hits, per target. Should be called once the tap has read the whole capture
+
+        :return: Dictionary of BSSID to (planned, achieved)
+        :rtype: dict
+        """
+
+        _rates = {}
+        with self._lock:
+            for bssid, start, stop in self._planned:
+                _heard = self._heard[bssid]
+                _hit = bisect.bisect_left(_heard, start) < bisect.bisect_right(_heard, stop)
+                _planned, _achieved = _rates.get(bssid, (0, 0))
+                _rates[bssid] = (_planned + 1, _achieved + _hit)
+
+        return _rates
+
+    def _learning(self, now, models):
+        if self._start_time is None:
+            return True
+        if self._targets is not None and self._targets.issubset(models):
+            return False
+        return self._learn_time is not None and now < self._start_time + self._learn_time
+
+    def _observe(self, timestamp, beacon, channel, signal):
+        _bssid = _normalize(beacon.bssid)
+        if self._targets is not None and _bssid not in self._targets:
+            return
+
+        with self._lock:
+            bisect.insort(self._heard[_bssid], timestamp)
+
+            # Probe responses carry a TSF too, but are not sent on target beacon transmission times
+            if beacon.subtype != SUBTYPE_BEACON or not beacon.interval or channel is None:
+                return
+
+            # Beacons are scheduled when the TSF is a multiple of the interval, so the TSF gives the phase directly
+            _interval = beacon.interval * TU
+            _tbtt = timestamp - (beacon.tsf % (beacon.interval * 1024)) / 1000000
+            self._models[_bssid] = BeaconModel(_tbtt, _interval, channel)
+
+
+def _normalize(bssid):
+    return bssid.lower().replace('-', ':')
+
+
+def get_hopper(mode, channels=IEEE80211bg, hop_int=OPTIMAL_BEACON_INT, distance=STD_CHANNEL_DISTANCE, init_chan=None, tap=None, targets=None, learn_time=None):
+    """
+    Build a hopper for the provided hop mode
+
+    :param mode: One of HOP_MODES
+    :type mode: str
+    :param tap: Beacon tap, required by the adaptive and predictive modes
+    :type tap: localizer.tap.BeaconTap
+    :param targets: BSSIDs for the predictive mode to target, or None for all
+    :type targets: list[str]
+    :param learn_time: Time for the predictive mode to learn beacon timing before predicting (s)
+    :type learn_time: float
+    :return: Hopper
+    """
+
+    if mode == HOP_FIXED:
+        return FixedHopper(channels, hop_int, distance, init_chan)
+    elif mode == HOP_ADAPTIVE:
+        if tap is None:
+            raise ValueError("Adaptive hopping requires a beacon tap")
+        return AdaptiveHopper(tap, channels, hop_int, distance, init_chan)
+    elif mode == HOP_PREDICTIVE:
+        if tap is None:
+            raise ValueError("Predictive hopping requires a beacon tap")
+        return PredictiveHopper(tap, channels, hop_int, distance, init_chan, targets, learn_time)
+    else:
+        raise ValueError("Invalid hop mode: {}; should be one of {}".format(mode, HOP_MODES))
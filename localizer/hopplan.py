@@ -0,0 +1,236 @@
+import collections
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from localizer import archive
+from localizer.meta import IEEE80211bg, TU, capture_suffixes, channel_timeline_fieldnames
+from localizer.utils.generate_hop_int import coprime_rate_generator
+
+module_logger = logging.getLogger(__name__)
+
+# Channels most 2.4GHz APs sit on, used when there are no results to learn the site's distribution from
+DEFAULT_CHANNEL_DISTRIBUTION = {1: 1/3, 6: 1/3, 11: 1/3}
+DEFAULT_CHANNEL_SETS = [IEEE80211bg, [1, 6, 11]]
+# Time after a switch before the radio receives on the new channel (s)
+SWITCH_LATENCY = .005
+# Simulated APs per plan
+SIMULATED_APS = 200
+# Upper bound on simulated beacons held in memory at once
+CHUNK_SIZE = 2 ** 21
+# Beacons are delayed after their target transmission time by contention; mean of the exponential delay (s)
+CONTENTION_DELAY = .001
+
+HopPlan = collections.namedtuple('HopPlan', ['hop_int', 'hop_dist', 'channels', 'beacons_per_degree', 'coverage'])
+
+
+def candidate_plans(channel_sets=None, hop_ints=None):
+    """
+    Candidate (hop_int, hop_dist, channels) plans: hop intervals coprime with the standard beacon interval, and hop
+    distances that visit every channel of the set
+
+    :param channel_sets: Lists of channels to hop
+    :type channel_sets: list[list[int]]
+    :param hop_ints: Hop intervals to try (s)
+    :type hop_ints: list[float]
+    :rtype: list[tuple]
+    """
+
+    if channel_sets is None:
+        channel_sets = DEFAULT_CHANNEL_SETS
+    if hop_ints is None:
+        hop_ints = [rate for _, rate in coprime_rate_generator()]
+
+    _plans = []
+    for channels in channel_sets:
+        _distances = [d for d in range(1, len(channels)) if math.gcd(d, len(channels)) == 1] or [1]
+        for hop_int in hop_ints:
+            for hop_dist in _distances:
+                _plans.append((hop_int, hop_dist, list(channels)))
+
+    return _plans
+
+
+def simulate(plans, distribution, duration, degrees=360, resolution=1, latency=SWITCH_LATENCY, aps=SIMULATED_APS, beacon_int=100*TU, seed=None):
+    """
+    Monte Carlo estimate of how well each hop plan samples beacons during a sweep. Every plan is evaluated against the
+    same simulated APs, so differences between plans are not noise between draws
+
+    :param plans: List of (hop_int, hop_dist, channels)
+    :type plans: list[tuple]
+    :param distribution: Dictionary of channel to the share of APs on it
+    :type distribution: dict
+    :param duration: Duration of the sweep (s)
+    :type duration: float
+    :param degrees: Degrees swept
+    :type degrees: float
+    :param resolution: Width of the bearing bins used for coverage (degrees)
+    :type resolution: float
+    :param latency: Switch latency (s)
+    :type latency: float
+    :param aps: Number of APs to simulate
+    :type aps: int
+    :param beacon_int: Beacon interval of the APs (s)
+    :type beacon_int: float
+    :param seed: Random seed
+    :type seed: int
+    :return: List of HopPlan, in the order of plans
+    :rtype: list[HopPlan]
+    """
+
+    _rng = np.random.RandomState(seed)
+
+    # Simulated APs: channel, and beacon times with a random phase and contention delay
+    _channels = np.array(list(distribution.keys()))
+    _shares = np.array(list(distribution.values()), dtype=float)
+    _ap_channels = _rng.choice(_channels, size=aps, p=_shares / _shares.sum())
+    _beacons = int(math.ceil(duration / beacon_int)) + 1
+    _times = (_rng.uniform(0, beacon_int, (aps, 1)) + np.arange(_beacons) * beacon_int +
+              _rng.exponential(CONTENTION_DELAY, (aps, _beacons)))
+    _valid = _times < duration
+    _bins = int(math.ceil(degrees / resolution))
+    _bearing_bins = np.minimum((_times / duration * degrees / resolution).astype(int), _bins - 1)
+
+    # Pad the channel sets into one array so plans with different sets are evaluated together
+    _lengths = np.array([len(p[2]) for p in plans])
+    _table = np.zeros((len(plans), _lengths.max()), dtype=int)
+    for i, p in enumerate(plans):
+        _table[i, :len(p[2])] = p[2]
+    _hop_ints = np.array([p[0] for p in plans], dtype=float)
+    _hop_dists = np.array([p[1] for p in plans])
+
+    _per_degree = np.empty(len(plans))
+    _coverage = np.empty(len(plans))
+    _chunk = max(1, CHUNK_SIZE // _times.size)
+    for start in range(0, len(plans), _chunk):
+        _slice = slice(start, start + _chunk)
+        _hop_int = _hop_ints[_slice, None, None]
+
+        # Channel the radio is on at each beacon, and whether it had settled after the switch
+        _hop = np.floor(_times / _hop_int)
+        _index = (_hop.astype(int) * _hop_dists[_slice, None, None]) % _lengths[_slice, None, None]
+        _tuned = np.take_along_axis(_table[_slice, None, :], _index.reshape(_index.shape[0], 1, -1), 2).reshape(_index.shape)
+        _caught = (_tuned == _ap_channels[None, :, None]) & (_times - _hop * _hop_int >= latency) & _valid
+
+        _per_degree[_slice] = _caught.sum(axis=(1, 2)) / aps / degrees
+
+        # Share of bearing bins in which each AP was heard at least once
+        _flat = (np.arange(_caught.shape[0] * aps).reshape(-1, aps, 1) * _bins + _bearing_bins)[_caught]
+        _heard = np.bincount(_flat, minlength=_caught.shape[0] * aps * _bins).reshape(-1, aps, _bins) > 0
+        _coverage[_slice] = _heard.mean(axis=(1, 2))
+
+    return [HopPlan(p[0], p[1], p[2], float(b), float(c)) for p, b, c in zip(plans, _per_degree, _coverage)]
+
+
+def best_plans(duration, degrees=360, distribution=None, channel_sets=None, latency=SWITCH_LATENCY, count=10, seed=None):
+    """
+    Rank candidate hop plans for a sweep
+
+    :param duration: Duration of the sweep (s)
+    :type duration: float
+    :param degrees: Degrees swept
+    :type degrees: float
+    :param distribution: Dictionary of channel to share of APs, defaults to DEFAULT_CHANNEL_DISTRIBUTION
+    :type distribution: dict
+    :param count: Number of plans to return
+    :type count: int
+    :return: Best plans, by expected beacons per AP per degree, then coverage
+    :rtype: list[HopPlan]
+    """
+
+    if not distribution:
+        distribution = DEFAULT_CHANNEL_DISTRIBUTION
+
+    # Also try hopping only the channels APs were seen on
+    if channel_sets is None:
+        channel_sets = DEFAULT_CHANNEL_SETS + [sorted(distribution)]
+    _unique = []
+    for channels in channel_sets:
+        if list(channels) not in _unique:
+            _unique.append(list(channels))
+
+    _results = simulate(candidate_plans(_unique), distribution, duration, degrees, latency=latency, seed=seed)
+    return sorted(_results, key=lambda p: (p.beacons_per_degree, p.coverage), reverse=True)[:count]
+
+
+def site_distribution(path):
+    """
+    Share of distinct BSSIDs seen on each channel, from the results files under a directory
+
+    :param path: Directory to search
+    :type path: str
+    :return: Dictionary of channel to share of APs, or None if no results were found
+    :rtype: dict
+    """
+
+    _bssids = []
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            if archive.has_suffix(file, capture_suffixes["results"]):
+                _bssids.append(pd.read_csv(os.path.join(root, file), usecols=['bssid', 'channel']))
+
+    if not _bssids:
+        return None
+
+    _counts = pd.concat(_bssids).dropna().drop_duplicates('bssid')['channel'].astype(int).value_counts()
+    return (_counts / _counts.sum()).to_dict()
+
+
+def site_latency(path):
+    """
+    Mean channel switch latency, from the channel timelines under a directory
+
+    :param path: Directory to search
+    :type path: str
+    :return: Latency (s), or None if no timelines were found
+    :rtype: float
+    """
+
+    _latencies = []
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            if archive.has_suffix(file, capture_suffixes["channels"]):
+                _timeline = pd.read_csv(os.path.join(root, file), names=channel_timeline_fieldnames, header=0)
+                _latencies.append(_timeline['latency'].values[1:])
+
+    if not _latencies or not sum(len(l) for l in _latencies):
+        return None
+
+    return float(np.concatenate(_latencies).mean())
+
+
+def plan_hops(path, duration, degrees=360, count=10):
+    """
+    Find and print the best hop plans for the site whose captures are under path
+
+    :param path: Working directory
+    :type path: str
+    :param duration: Duration of the sweep (s)
+    :type duration: float
+    :param degrees: Degrees swept
+    :type degrees: float
+    :param count: Number of plans to print
+    :type count: int
+    :return: Best plans
+    :rtype: list[HopPlan]
+    """
+
+    _distribution = site_distribution(path)
+    if _distribution is None:
+        print("No results found in {}; assuming APs on channels 1, 6 and 11".format(path))
+    _latency = site_latency(path)
+    if _latency is None:
+        _latency = SWITCH_LATENCY
+
+    _plans = best_plans(duration, degrees, _distribution, latency=_latency, count=count)
+
+    print("Best hop plans for a {}s sweep of {} degrees (switch latency {:.1f}ms):".format(duration, degrees, _latency * 1000))
+    print("{:>10} {:>8} {:>12} {:>10}  {}".format("hop_int", "hop_dist", "beacons/deg", "coverage", "channels"))
+    for plan in _plans:
+        print("{:>10.5f} {:>8} {:>12.3f} {:>9.1%}  {}".format(plan.hop_int, plan.hop_dist, plan.beacons_per_degree,
+                                                            plan.coverage, plan.channels))
+
+    return _plans
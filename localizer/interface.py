@@ -1,7 +1,9 @@
 import atexit
+import csv
 import logging
 import re
 import shutil
+import socket
 import threading
 import time
 from subprocess import call, run, PIPE, CalledProcessError
@@ -9,10 +11,17 @@ from subprocess import call, run, PIPE, CalledProcessError
 from tqdm import tqdm
 
 import localizer
-from localizer.meta import OPTIMAL_BEACON_INT, STD_CHANNEL_DISTANCE, IEEE80211bg
+from localizer import hopping, inventory, nl80211
+from localizer.meta import OPTIMAL_BEACON_INT, STD_CHANNEL_DISTANCE, IEEE80211bg, channel_timeline_fieldnames
 
 module_logger = logging.getLogger(__name__)
 
+# Channel switching engines
+ENGINE_NETLINK = 'netlink'
+ENGINE_IWCONFIG = 'iwconfig'
+CHANNEL_ENGINES = [ENGINE_NETLINK, ENGINE_IWCONFIG]
+CHANNEL_ENGINE = ENGINE_NETLINK
+
 # Make sure required system tools are installed
 if shutil.which("iwconfig") is None:
     module_logger.error("Required system tool 'iwconfig' is not installed")
@@ -46,6 +55,7 @@ def set_interface_mode(iface, mode):
         call(['ifconfig', iface, 'down'], stdout=localizer.DN, stderr=localizer.DN)
         call(['iwconfig', iface, 'mode', mode], stdout=localizer.DN, stderr=localizer.DN)
         call(['ifconfig', iface, 'up'], stdout=localizer.DN, stderr=localizer.DN)
+        _inventory.invalidate()
 
         # Validate mode of interface
         interfaces = get_interfaces()
@@ -79,6 +89,18 @@ def get_interface_mode(iface):
 
 
 def get_interfaces():
+    """
+    Builds a dictionary of interfaces and their properties from the cached inventory (nl80211 or sysfs, falling back
+    to iwconfig)
+
+    :return: A dictionary with keys as interface name (str) and value as dictionary of key/value pairs
+    :rtype: dict
+    """
+
+    return _inventory.interfaces()
+
+
+def _iwconfig_interfaces():
     """
     Queries iwconfig and builds a dictionary of interfaces and their properties
 
@@ -121,6 +143,28 @@ def get_interfaces():
         return None
 
 
+_inventory = inventory.Inventory(_iwconfig_interfaces)
+
+
+def partition_channels(channels, count):
+    """
+    Split channels round-robin between radios, so that each radio hops a smaller set and neighbouring (overlapping)
+    channels end up on different radios
+
+    :param channels: Channels to hop
+    :type channels: list[int]
+    :param count: Number of radios
+    :type count: int
+    :return: A list of channels per radio
+    :rtype: list[list[int]]
+    """
+
+    if count < 1:
+        raise ValueError("Invalid number of radios: {}".format(count))
+
+    return [channels[i::count] for i in range(min(count, len(channels)))]
+
+
 def get_first_interface():
     """
     Returns the name of the first interface, or None if none are present on the system.
@@ -176,13 +220,101 @@ def set_channel(iface, channel):
         return False
 
 
+class IwconfigChannelEngine:
+    name = ENGINE_IWCONFIG
+
+    def __init__(self, iface):
+        """
+        Switch channels by running iwconfig for every hop
+        """
+
+        self._iface = iface
+
+    def set_channel(self, channel):
+        return set_channel(self._iface, str(channel))
+
+    def close(self):
+        pass
+
+
+class NetlinkChannelEngine:
+    name = ENGINE_NETLINK
+
+    def __init__(self, iface):
+        """
+        Switch channels over an nl80211 netlink socket that stays open for the lifetime of the engine
+        """
+
+        self._iface = iface
+        self._ifindex = socket.if_nametoindex(iface)
+        self._nl = nl80211.NL80211()
+
+    def set_channel(self, channel):
+        try:
+            self._nl.set_channel(self._ifindex, channel)
+            return True
+        except (OSError, ValueError) as e:
+            module_logger.error("Failed to set {} to channel {} ({})".format(self._iface, channel, e))
+            return False
+
+    def close(self):
+        self._nl.close()
+
+
+def get_channel_engine(iface, engine=None):
+    """
+    Open a channel switching engine for an interface, falling back to iwconfig if netlink is unavailable
+
+    :param iface: Interface to switch channels on
+    :type iface: str
+    :param engine: Engine name, one of CHANNEL_ENGINES (defaults to CHANNEL_ENGINE)
+    :type engine: str
+    :return: Engine with set_channel(channel) and close() methods
+    """
+
+    engine = engine or CHANNEL_ENGINE
+    if engine not in CHANNEL_ENGINES:
+        raise ValueError("Invalid channel engine: {}; should be one of {}".format(engine, CHANNEL_ENGINES))
+
+    if engine == ENGINE_NETLINK:
+        try:
+            return NetlinkChannelEngine(iface)
+        except OSError as e:
+            module_logger.warning("Netlink channel engine unavailable for {} ({}), using iwconfig".format(iface, e))
+
+    return IwconfigChannelEngine(iface)
+
+
+def write_channel_timeline(path, timeline):
+    """
+    Write a channel timeline to csv
+
+    :param path: Path of the csv file
+    :type path: str
+    :param timeline: List of (time the channel became active, channel, switch latency)
+    :type timeline: list[tuple]
+    """
+
+    with open(path, 'w', newline='') as timeline_csv:
+        _timeline_csv_writer = csv.writer(timeline_csv, dialect="unix")
+        _timeline_csv_writer.writerow(channel_timeline_fieldnames)
+        _timeline_csv_writer.writerows(timeline)
+
+
 class ChannelThread(threading.Thread):
-    def __init__(self, event_flag, iface, duration, hop_int=OPTIMAL_BEACON_INT, response_queue=None, distance=STD_CHANNEL_DISTANCE, init_chan=None, channels=IEEE80211bg):
+
+    # Weight given to each new switch latency measurement when compensating for it
+    LATENCY_SMOOTHING = .2
+
+    def __init__(self, event_flag, iface, duration, hop_int=OPTIMAL_BEACON_INT, response_queue=None, distance=STD_CHANNEL_DISTANCE, init_chan=None, channels=IEEE80211bg, engine=None, timeline_output=None, hopper=None):
         """
         Wait for commands on the queue and asynchronously change channels of wireless interface with specified timing.
 
         :param command_queue queue.Queue: A queue to read commands in the format (iface, iterations, hop_int)
         :param channels list[int]: A list of channels to iterate over
+        :param engine str: Channel switching engine, one of CHANNEL_ENGINES (defaults to CHANNEL_ENGINE)
+        :param timeline_output str: Path to write the channel timeline (time, channel, switch latency) to, if any
+        :param hopper: Decides the channel and dwell of each hop (defaults to a hopping.FixedHopper)
         """
 
         super().__init__()
@@ -197,12 +329,17 @@ class ChannelThread(threading.Thread):
         self._distance = distance
         self._response_queue = response_queue
         self._channels = channels
+        self._engine = engine
+        self._timeline_output = timeline_output
+        self._cancelled = False
 
         # Validate initial channel, if given
         self._init_chan = init_chan
         if self._init_chan and self._init_chan not in self._channels:
             raise ValueError("If you specify an initial channel, it must be in the list of channels")
 
+        self._hopper = hopper or hopping.FixedHopper(channels, hop_int, distance, init_chan)
+
         # Ensure we are in monitor mode
         if get_interface_mode(self._iface) != "monitor":
             set_interface_mode(self._iface, "monitor")
@@ -210,43 +347,76 @@ class ChannelThread(threading.Thread):
 
     def run(self):
 
-        _chan_len = len(self._channels)
+        # Keep the engine (and its netlink socket) open for the lifetime of the thread
+        _engine = get_channel_engine(self._iface, self._engine)
 
-        # Build local channel str list for speed
-        _channels = [str(channel) for channel in self._channels]
-
-        # Initial channel position - will cycle through all in _channels
-        if self._init_chan:
-            _chan = self._channels.index(self._init_chan)
-        else:
-            _chan = 0
-        set_channel(self._iface, _channels[_chan])  # Set channel to first channel
+        # Set channel to first channel
+        _channel, _dwell = self._hopper.next(time.time())
+        if not _engine.set_channel(_channel):
+            # The radio is on whatever it was tuned to; 0 attributes its packets to no channel until the next hop
+            module_logger.warning("Could not tune {} to channel {}".format(self._iface, _channel))
+            _channel = 0
 
         # Wait for synchronization signal
         self._event_flag.wait()
+        if self._cancelled:
+            _engine.close()
+            return
 
         _start_time = time.time()
-        _stop_time = _start_time + self._duration
+        _start_monotonic = time.monotonic()
+        _stop_monotonic = _start_monotonic + self._duration
+        _timeline = [(_start_time, _channel, 0)]
+        self._hopper.start(_start_time)
 
         # Only hop channels if we have a list of channels to hop, and our duration is greater than 0
         if self._hop_int > 0 and len(self._channels) > 1:
 
             # HOP CHANNELS https://github.com/elBradford/snippets/blob/master/chanhop.sh
-            while _stop_time > time.time():
-                time.sleep(self._hop_int)
-                _chan = (_chan + self._distance) % _chan_len
-                set_channel(self._iface, _channels[_chan])
-
-        else:
-            time.sleep(_stop_time - time.time())
+            # Hops fire on absolute deadlines so that neither sleep overshoot nor switch latency accumulates
+            _latency = 0
+            _deadline = _start_monotonic + _dwell
+            while _deadline < _stop_monotonic:
+                # Start switching early by the expected latency so the new channel is live at the deadline
+                _delay = _deadline - _latency - time.monotonic()
+                if _delay > 0:
+                    time.sleep(_delay)
+
+                _channel, _dwell = self._hopper.next(_start_time + _deadline - _start_monotonic)
+                _switch_start = time.monotonic()
+                _switched = _engine.set_channel(_channel)
+                _switch_end = time.monotonic()
+
+                _switch_latency = _switch_end - _switch_start
+                _latency += ChannelThread.LATENCY_SMOOTHING * (_switch_latency - _latency)
+                # The radio stays on the last channel it switched to, so packets are still attributed to that
+                if _switched:
+                    _timeline.append((_start_time + _switch_end - _start_monotonic, _channel, _switch_latency))
+
+                _deadline += _dwell
+
+        _delay = _stop_monotonic - time.monotonic()
+        if _delay > 0:
+            time.sleep(_delay)
 
         _end_time = time.time()
+        _engine.close()
+
+        if self._timeline_output is not None:
+            write_channel_timeline(self._timeline_output, _timeline)
 
         if self._response_queue is not None:
             self._response_queue.put((_start_time, _end_time))
         module_logger.info("Hopped {} channels for {:.2f}s (expected {}s)"
                            .format(len(self._channels), _end_time-_start_time, self._duration))
 
+    def cancel(self):
+        """
+        Skip hopping once the synchronization flag is raised
+        """
+
+        self._cancelled = True
+
 
 @atexit.register
 def cleanup():
@@ -0,0 +1,159 @@
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+from localizer import nl80211
+
+module_logger = logging.getLogger(__name__)
+
+SYSFS_NET = '/sys/class/net'
+# Link types from linux/if_arp.h
+ARPHRD_ETHER = 1
+ARPHRD_IEEE80211_RADIOTAP = 803
+# rtnetlink link notifications, from linux/rtnetlink.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+# How long cached interfaces are trusted when link events can not be followed (s)
+INVENTORY_TTL = 2
+
+
+def sysfs_interfaces(root=SYSFS_NET):
+    """
+    Wireless interfaces and their modes from sysfs. Monitor interfaces deliver radiotap frames, so their link type
+    gives the mode away
+
+    :param root: sysfs network class directory
+    :type root: str
+    :return: Dictionary with keys as interface name (str) and value as dictionary of key/value pairs
+    :rtype: dict
+    """
+
+    _interfaces = {}
+    for iface in sorted(os.listdir(root)):
+        _path = os.path.join(root, iface)
+        if not os.path.exists(os.path.join(_path, 'phy80211')) and not os.path.isdir(os.path.join(_path, 'wireless')):
+            continue
+
+        try:
+            with open(os.path.join(_path, 'type')) as fp:
+                _type = int(fp.read())
+        except (OSError, ValueError):
+            _type = None
+
+        _interfaces[iface] = {"mode": "monitor" if _type == ARPHRD_IEEE80211_RADIOTAP else "managed"}
+
+    return _interfaces
+
+
+def netlink_interfaces():
+    """
+    Wireless interfaces, their modes and frequencies from an nl80211 dump
+
+    :return: Dictionary with keys as interface name (str) and value as dictionary of key/value pairs
+    :rtype: dict
+    """
+
+    with nl80211.NL80211() as nl:
+        _dump = nl.interfaces()
+
+    _interfaces = {}
+    for iface in sorted(_dump):
+        _attrs = _dump[iface]
+        _interfaces[iface] = {}
+        if nl80211.NL80211_ATTR_IFTYPE in _attrs:
+            _type = struct.unpack('=I', _attrs[nl80211.NL80211_ATTR_IFTYPE][:4])[0]
+            _interfaces[iface]["mode"] = nl80211.IFTYPE_MODES.get(_type, str(_type))
+        if nl80211.NL80211_ATTR_WIPHY_FREQ in _attrs:
+            _frequency = struct.unpack('=I', _attrs[nl80211.NL80211_ATTR_WIPHY_FREQ][:4])[0]
+            _interfaces[iface]["frequency"] = "{:.3f} ghz".format(_frequency / 1000)
+
+    return _interfaces
+
+
+class Inventory:
+
+    def __init__(self, fallback=None):
+        """
+        Cached view of the system's wireless interfaces. Sources are tried in order: nl80211, sysfs, then fallback
+        (eg iwconfig). The cache is dropped on rtnetlink link events and explicit invalidation; if link events can
+        not be followed, it expires after INVENTORY_TTL
+
+        :param fallback: Function returning interfaces when neither nl80211 nor sysfs know of any
+        :type fallback: callable
+        """
+
+        self._fallback = fallback
+        self._lock = threading.Lock()
+        self._interfaces = None
+        self._refreshed = 0
+        self._monitor = None
+        self._watching = False
+
+    def interfaces(self):
+        """
+        Interfaces and their properties
+
+        :return: A dictionary with keys as interface name (str) and value as dictionary of key/value pairs
+        :rtype: dict
+        """
+
+        with self._lock:
+            if self._monitor is None:
+                self._watch()
+
+            if self._interfaces is None or (not self._watching and time.monotonic() - self._refreshed > INVENTORY_TTL):
+                self._interfaces = self._load()
+                self._refreshed = time.monotonic()
+
+            if self._interfaces is None:
+                return None
+            return {iface: dict(values) for iface, values in self._interfaces.items()}
+
+    def invalidate(self):
+        """
+        Drop the cached interfaces, eg after changing the mode of one
+        """
+
+        with self._lock:
+            self._interfaces = None
+
+    def _load(self):
+        for source in (netlink_interfaces, sysfs_interfaces):
+            try:
+                _interfaces = source()
+                if _interfaces:
+                    return _interfaces
+            except OSError as e:
+                module_logger.debug("Could not read interfaces: {}".format(e))
+
+        return self._fallback() if self._fallback else {}
+
+    def _watch(self):
+        try:
+            _sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            _sock.bind((0, RTMGRP_LINK))
+        except (OSError, AttributeError) as e:
+            module_logger.debug("Not following link events ({}); caching interfaces for {}s".format(e, INVENTORY_TTL))
+            self._monitor = False
+            return
+
+        self._monitor = threading.Thread(target=self._follow, args=(_sock,), daemon=True)
+        self._monitor.start()
+        self._watching = True
+
+    def _follow(self, sock):
+        while True:
+            try:
+                _data = sock.recv(65536)
+            except OSError as e:
+                module_logger.warning("Stopped following link events: {}".format(e))
+                self._watching = False
+                return
+
+            if any(msg_type in (RTM_NEWLINK, RTM_DELLINK) for msg_type, _, _, _ in nl80211.parse_messages(_data)):
+                self.invalidate()
@@ -29,6 +29,25 @@ def main():
     me_group.add_argument("-s", "--shell",
                           help="Start the localizer shell",
                           action="store_true")
+    me_group.add_argument("--plan-hops",
+                          help="Simulate channel hop plans for a sweep of the given duration (s) and print the best, "
+                               "using the channels of APs in the working directory's results",
+                          type=float,
+                          metavar="DURATION")
+    me_group.add_argument("--locate-aps",
+                          help="Triangulate the APs observed from two or more capture positions in the working directory",
+                          action="store_true")
+    me_group.add_argument("--compress",
+                          help="Compress the capture files in the working directory. Processing compresses the captures "
+                               "it processes, unless --no-compress is given",
+                          action="store_true")
+    parser.add_argument("--no-compress",
+                        help="If processing, leave the capture files uncompressed",
+                        action="store_true")
+    parser.add_argument("--degrees",
+                        help="If planning hops, the degrees swept",
+                        type=float,
+                        default=360)
     parser.add_argument("--serve",
                         help="Serve files from the working directory on port 80. This flag may also be set in the shell",
                         action="store_true")
@@ -56,7 +75,19 @@ def main():
 
     elif args.process:
         from localizer import process
-        process.process_directory(args.macs, not args.counterclockwise)
+        process.process_directory(args.macs, not args.counterclockwise, not args.no_compress)
+
+    elif args.plan_hops:
+        from localizer import hopplan
+        hopplan.plan_hops(getcwd(), args.plan_hops, args.degrees)
+
+    elif args.locate_aps:
+        from localizer import triangulate
+        triangulate.locate_aps(getcwd())
+
+    elif args.compress:
+        from localizer import archive
+        archive.compress_directory(getcwd())
 
     elif args.serve:
         import socket
@@ -1,6 +1,7 @@
 import datetime
 import re
 import time
+from distutils.util import strtobool
 
 #CB from geomag import WorldMagneticModel
 import geomag
@@ -18,6 +19,27 @@ STD_BEACON_INT = 100*TU
 OPTIMAL_BEACON_INT = 179*TU
 STD_CHANNEL_DISTANCE = 2
 
+# Channel hopping modes
+HOP_FIXED = 'fixed'
+HOP_ADAPTIVE = 'adaptive'
+HOP_PREDICTIVE = 'predictive'
+HOP_MODES = [HOP_FIXED, HOP_ADAPTIVE, HOP_PREDICTIVE]
+
+# Capture engines
+ENGINE_DUMPCAP = 'dumpcap'
+ENGINE_TPACKET = 'tpacket'
+CAPTURE_ENGINES = [ENGINE_DUMPCAP, ENGINE_TPACKET]
+
+# Capture profiles: which frames the capture engine keeps, and how much of each
+PROFILE_BEACONS = 'beacons'
+PROFILE_MGMT = 'mgmt'
+PROFILE_ALL = 'all'
+CAPTURE_PROFILES = [PROFILE_BEACONS, PROFILE_MGMT, PROFILE_ALL]
+# Keeps whole management frames: processing reads IEs anywhere in the body (the WPA vendor IE is often last, behind
+# HT/VHT/HE and WPS), and a body may be up to 2304 bytes, plus its 24 byte header, FCS and radiotap (0 is unlimited)
+MGMT_SNAPLEN = 2560
+profile_snaplens = {PROFILE_BEACONS: MGMT_SNAPLEN, PROFILE_MGMT: MGMT_SNAPLEN, PROFILE_ALL: 0}
+
 
 meta_csv_fieldnames = ['name',
                        'pass',
@@ -43,9 +65,22 @@ meta_csv_fieldnames = ['name',
                        'elapsed',
                        'num_guesses',
                        'guess_time',
+                       'clockwise',
+                       'channels',
+                       'hop_mode',
+                       'beacons_planned',
+                       'beacons_hit',
+                       'captured',
+                       'dropped',
+                       'capture_engine',
+                       'capture_profile',
+                       'phases',
                        ]
 
 
+channel_timeline_fieldnames = ['timestamp', 'channel', 'latency']
+
+
 required_suffixes = {"nmea": ".nmea",
                     "pcap": ".pcapng",
                     "meta": "-capture.csv",
@@ -55,6 +90,7 @@ required_suffixes = {"nmea": ".nmea",
 
 capture_suffixes = {
                     "guess": "-guess.csv",
+                    "channels": "-channels.csv",
                     "results": "-results.csv",
                     "capture": "-capture.conf",
                     }
@@ -70,11 +106,14 @@ class Params:
                     "bearing",
                     "hop_int",
                     "hop_dist",
+                    "hop_mode",
                     "mac",
                     "macs",
                     "channel",
                     "focused",
-                    "capture"]
+                    "capture",
+                    "capture_engine",
+                    "capture_profile"]
 
     def __init__(self,
                  iface=None,
@@ -86,10 +125,14 @@ class Params:
                  macs=None,
                  channel=None,
                  focused=None,
-                 capture=time.strftime('%Y%m%d-%H-%M-%S')):
+                 capture=time.strftime('%Y%m%d-%H-%M-%S'),
+                 clockwise=True,
+                 hop_mode=HOP_FIXED,
+                 capture_engine=ENGINE_DUMPCAP,
+                 capture_profile=PROFILE_BEACONS):
 
         # Default Values
-        self._duration = self._degrees = self._bearing = self._hop_int = self._hop_dist = self._macs = self._channel = self._focused = self._capture = None
+        self._duration = self._degrees = self._bearing = self._hop_int = self._hop_dist = self._macs = self._channel = self._focused = self._capture = self._clockwise = self._hop_mode = self._capture_engine = self._capture_profile = None
         self._iface = iface
         self.duration = duration
         self.degrees = degrees
@@ -100,6 +143,10 @@ class Params:
         self.channel = channel
         self.focused = focused
         self.capture = capture
+        self.clockwise = clockwise
+        self.hop_mode = hop_mode
+        self.capture_engine = capture_engine
+        self.capture_profile = capture_profile
 
     @property
     def iface(self):
@@ -108,10 +155,16 @@ class Params:
     @iface.setter
     def iface(self, value):
         from localizer import interface
-        if value in list(interface.get_interfaces()):
-            self._iface = value
-        else:
+        # Several radios may be given, comma separated, to split the channels between them
+        _ifaces = value.split(',') if isinstance(value, str) else list(value or [])
+        _system = list(interface.get_interfaces())
+        if not _ifaces or any(iface not in _system for iface in _ifaces) or len(set(_ifaces)) != len(_ifaces):
             raise ValueError("Invalid interface: {}".format(value))
+        self._iface = ','.join(_ifaces)
+
+    @property
+    def ifaces(self):
+        return self._iface.split(',') if self._iface else []
 
     @property
     def duration(self):
@@ -190,6 +243,36 @@ class Params:
         except ValueError:
             raise ValueError("Invalid hop distance: {}; should be an integer > 0".format(value))
 
+    @property
+    def hop_mode(self):
+        return self._hop_mode
+
+    @hop_mode.setter
+    def hop_mode(self, value):
+        if value not in HOP_MODES:
+            raise ValueError("Invalid hop mode: {}; should be one of {}".format(value, HOP_MODES))
+        self._hop_mode = value
+
+    @property
+    def capture_engine(self):
+        return self._capture_engine
+
+    @capture_engine.setter
+    def capture_engine(self, value):
+        if value not in CAPTURE_ENGINES:
+            raise ValueError("Invalid capture engine: {}; should be one of {}".format(value, CAPTURE_ENGINES))
+        self._capture_engine = value
+
+    @property
+    def capture_profile(self):
+        return self._capture_profile
+
+    @capture_profile.setter
+    def capture_profile(self, value):
+        if value not in CAPTURE_PROFILES:
+            raise ValueError("Invalid capture profile: {}; should be one of {}".format(value, CAPTURE_PROFILES))
+        self._capture_profile = value
+
     @property
     def macs(self):
         return self._macs
@@ -269,6 +352,19 @@ class Params:
     def capture(self, value):
         self._capture = str(value)
 
+    @property
+    def clockwise(self):
+        return self._clockwise
+
+    @clockwise.setter
+    def clockwise(self, value):
+        try:
+            if not isinstance(value, bool):
+                value = bool(strtobool(str(value)))
+            self._clockwise = value
+        except ValueError:
+            raise ValueError("Invalid clockwise: {}; should be a boolean".format(value))
+
     # Validation functions
     def validate_antenna(self):
         return self.duration is not None and \
@@ -326,5 +422,9 @@ class Params:
             deepcopy(self.macs),
             self.channel,
             deepcopy(self.focused),
-            self.capture
+            self.capture,
+            self.clockwise,
+            self.hop_mode,
+            self.capture_engine,
+            self.capture_profile
         )
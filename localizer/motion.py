@@ -0,0 +1,163 @@
+import math
+
+# Pigpio chains encode loop counts as two bytes
+MAX_CHAIN_LOOP = 65535
+# Pigpio chains are limited to 600 bytes; each loop entry takes 7
+MAX_CHAIN_ENTRIES = 600 // 7
+
+TRAPEZOIDAL = 'trapezoidal'
+S_CURVE = 's-curve'
+PROFILES = [TRAPEZOIDAL, S_CURVE]
+
+
+def _shape(profile, x):
+    """
+    Normalized velocity (0-1) reached at normalized time x (0-1) of an acceleration ramp
+    """
+
+    if profile == TRAPEZOIDAL:
+        return x
+    elif profile == S_CURVE:
+        return x * x * (3 - 2 * x)
+    else:
+        raise ValueError("Invalid motion profile: {}; should be one of {}".format(profile, PROFILES))
+
+
+def plan(degrees, degrees_per_step, max_velocity, acceleration, levels=8, profile=S_CURVE):
+    """
+    Plan a symmetric acceleration/cruise/deceleration profile that moves a (positive) number of degrees.
+
+    The ramp is split into a fixed set of velocity levels, each held for the same amount of time, so that moves of any
+    length reuse the same step rates. Short moves drop the upper levels rather than scaling them.
+
+    :param degrees: Number of degrees to move
+    :type degrees: float
+    :param degrees_per_step: Degrees moved per step pulse
+    :type degrees_per_step: float
+    :param max_velocity: Velocity limit (degrees/s)
+    :type max_velocity: float
+    :param acceleration: Acceleration limit (degrees/s^2)
+    :type acceleration: float
+    :param levels: Number of velocity levels in each ramp
+    :type levels: int
+    :param profile: Shape of the ramp, trapezoidal (constant acceleration) or s-curve (limited jerk)
+    :type profile: str
+    :return: List of [Step rate (steps/s), Steps]
+    :rtype: list
+    """
+
+    if max_velocity <= 0 or acceleration <= 0 or levels < 1:
+        raise ValueError("Velocity, acceleration and levels must all be > 0")
+
+    _total_steps = int(round(abs(degrees) / degrees_per_step))
+    if _total_steps == 0:
+        return []
+
+    # The s-curve peaks at 1.5x its average acceleration, stretch it so the peak stays within the limit
+    _ramp_time = max_velocity / acceleration * (1.5 if profile == S_CURVE else 1)
+    _dwell = _ramp_time / levels
+
+    _rates = [max_velocity * _shape(profile, (k + .5) / levels) / degrees_per_step for k in range(levels)]
+    _steps = [max(1, int(round(rate * _dwell))) for rate in _rates]
+
+    # Drop upper levels until both ramps fit in the move
+    _used = levels
+    while _used > 0 and 2 * sum(_steps[:_used]) > _total_steps:
+        _used -= 1
+
+    _ramp = [[_rates[k], _steps[k]] for k in range(_used)]
+    # Cruise at the next level up; stepping to it is no bigger a change than any other level
+    _cruise_rate = max_velocity / degrees_per_step if _used == levels else _rates[_used]
+    _cruise_steps = _total_steps - 2 * sum(s for _, s in _ramp)
+
+    _plan = list(_ramp)
+    if _cruise_steps > 0:
+        _plan.append([_cruise_rate, _cruise_steps])
+    _plan += reversed(_ramp)
+
+    return split_loops(_plan)
+
+
+def split_loops(ramp):
+    """
+    Split ramp levels whose step counts do not fit in a single pigpio chain loop
+
+    :param ramp: List of [Step rate, Steps]
+    :type ramp: list
+    :return: List of [Step rate, Steps] with Steps <= MAX_CHAIN_LOOP
+    :rtype: list
+    """
+
+    _split = []
+    for rate, steps in ramp:
+        while steps > MAX_CHAIN_LOOP:
+            _split.append([rate, MAX_CHAIN_LOOP])
+            steps -= MAX_CHAIN_LOOP
+        if steps > 0:
+            _split.append([rate, steps])
+
+    if len(_split) > MAX_CHAIN_ENTRIES:
+        raise ValueError("Motion profile needs {} chain entries; pigpio supports {}"
+                         .format(len(_split), MAX_CHAIN_ENTRIES))
+
+    return _split
+
+
+def duration(ramp):
+    """
+    Time taken to execute a ramp
+
+    :param ramp: List of [Step rate (steps/s), Steps]
+    :type ramp: list
+    :return: Duration (s)
+    :rtype: float
+    """
+
+    return sum(steps / rate for rate, steps in ramp)
+
+
+def travel_time(degrees, degrees_per_step, max_velocity, acceleration, levels=8, profile=S_CURVE):
+    """
+    Predict how long a move will take without building the chain
+
+    :return: Duration (s)
+    :rtype: float
+    """
+
+    if math.isclose(degrees, 0):
+        return 0
+    return duration(plan(degrees, degrees_per_step, max_velocity, acceleration, levels, profile))
+
+
+def best_path(current, new_bearing, degrees, bearing_min, bearing_max):
+    """
+    Return an optimized path to arrive at the provided bearing based on how far the travel is and the current state
+    of the antenna, keeping the following sweep within the cable-wrap limits.
+
+    :param current: Current (unwrapped) bearing of the antenna
+    :type current: float
+    :param new_bearing: New bearing to set the antenna to
+    :type new_bearing: float
+    :param degrees: How far will the antenna be traveling from this bearing; negative for counter-clockwise
+    :type degrees: float
+    :param bearing_min: Lowest unwrapped bearing the antenna may reach
+    :type bearing_min: float
+    :param bearing_max: Highest unwrapped bearing the antenna may reach
+    :type bearing_max: float
+    :return: Signed travel from the current bearing
+    :rtype: float
+    """
+
+    _edge_case = bool(new_bearing == current % 360)
+    if _edge_case and (current >= bearing_max or current <= bearing_min):
+        _travel = new_bearing - current
+    else:
+        # Use algorithm tested and optimized in tests/antenna_motion.py
+        _travel = 180 - (540 + (current - new_bearing)) % 360
+        _proposed_new_bearing = current + _travel
+        if _proposed_new_bearing + max(degrees, 0) >= bearing_max:
+            _travel = _travel - 360
+        elif _proposed_new_bearing + min(degrees, 0) <= bearing_min:
+            _travel = _travel + 360
+
+    return _travel
@@ -0,0 +1,296 @@
+import errno
+import itertools
+import logging
+import os
+import socket
+import struct
+
+module_logger = logging.getLogger(__name__)
+
+# Netlink constants, from linux/netlink.h and linux/genetlink.h
+NETLINK_GENERIC = 16
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# nl80211 constants, from linux/nl80211.h
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_SET_WIPHY = 2
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_WIPHY_CHANNEL_TYPE = 39
+NL80211_CHAN_NO_HT = 0
+
+# Interface types, and the iwconfig names of the modes they correspond to
+NL80211_IFTYPE_MONITOR = 6
+IFTYPE_MODES = {1: 'ad-hoc',
+                2: 'managed',
+                3: 'master',
+                4: 'master',
+                5: 'repeater',
+                6: 'monitor',
+                7: 'mesh',
+                8: 'managed',
+                9: 'master',
+                }
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_GENLMSGHDR = struct.Struct('=BBH')
+_NLATTR = struct.Struct('=HH')
+_U16 = struct.Struct('=H')
+_U32 = struct.Struct('=I')
+_ERRNO = struct.Struct('=i')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def pack_attr(attr_type, payload):
+    """
+    Pack a netlink attribute, padded to a 4 byte boundary
+
+    :param attr_type: Attribute type
+    :type attr_type: int
+    :param payload: Attribute payload
+    :type payload: bytes
+    :rtype: bytes
+    """
+
+    _length = _NLATTR.size + len(payload)
+    return _NLATTR.pack(_length, attr_type) + payload + b'\0' * (_align(_length) - _length)
+
+
+def pack_message(msg_type, flags, seq, cmd, attrs=b''):
+    """
+    Pack a generic netlink message
+
+    :param msg_type: Netlink message type (the generic netlink family id)
+    :type msg_type: int
+    :param flags: Netlink flags
+    :type flags: int
+    :param seq: Sequence number
+    :type seq: int
+    :param cmd: Generic netlink command
+    :type cmd: int
+    :param attrs: Packed attributes
+    :type attrs: bytes
+    :rtype: bytes
+    """
+
+    _payload = _GENLMSGHDR.pack(cmd, 1, 0) + attrs
+    return _NLMSGHDR.pack(_NLMSGHDR.size + len(_payload), msg_type, flags, seq, 0) + _payload
+
+
+def parse_attrs(data):
+    """
+    Parse packed netlink attributes
+
+    :param data: Packed attributes
+    :type data: bytes
+    :return: Dictionary of attribute type to payload
+    :rtype: dict
+    """
+
+    _attrs = {}
+    _offset = 0
+    while _offset + _NLATTR.size <= len(data):
+        _length, _type = _NLATTR.unpack_from(data, _offset)
+        if _length < _NLATTR.size:
+            break
+        _attrs[_type & 0x3fff] = data[_offset + _NLATTR.size:_offset + _length]
+        _offset += _align(_length)
+
+    return _attrs
+
+
+def parse_messages(data):
+    """
+    Split a netlink datagram into messages
+
+    :param data: Datagram received from the socket
+    :type data: bytes
+    :return: List of (type, flags, seq, payload)
+    :rtype: list
+    """
+
+    _messages = []
+    _offset = 0
+    while _offset + _NLMSGHDR.size <= len(data):
+        _length, _type, _flags, _seq, _ = _NLMSGHDR.unpack_from(data, _offset)
+        if _length < _NLMSGHDR.size:
+            break
+        _messages.append((_type, _flags, _seq, data[_offset + _NLMSGHDR.size:_offset + _length]))
+        _offset += _align(_length)
+
+    return _messages
+
+
+def channel_to_frequency(channel):
+    """
+    Convert an IEEE 802.11 channel number to its center frequency
+
+    :param channel: Channel number
+    :type channel: int
+    :return: Frequency in MHz
+    :rtype: int
+    """
+
+    channel = int(channel)
+    if channel == 14:
+        return 2484
+    elif 1 <= channel < 14:
+        return 2407 + channel * 5
+    elif 32 <= channel <= 177:
+        return 5000 + channel * 5
+    else:
+        raise ValueError("Invalid channel: {}".format(channel))
+
+
+def frequency_to_channel(frequency):
+    """
+    Convert a center frequency to its IEEE 802.11 channel number
+
+    :param frequency: Frequency in MHz
+    :type frequency: int
+    :return: Channel number
+    :rtype: int
+    """
+
+    frequency = int(frequency)
+    if frequency == 2484:
+        return 14
+    elif 2412 <= frequency < 2484:
+        return (frequency - 2407) // 5
+    elif 5160 <= frequency <= 5885:
+        return (frequency - 5000) // 5
+    else:
+        raise ValueError("Invalid frequency: {}".format(frequency))
+
+
+class NL80211:
+
+    def __init__(self):
+        """
+        A generic netlink socket bound to the nl80211 family, kept open so each request is a single syscall pair
+        instead of a fork/exec of a wireless tool
+        """
+
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._sock.bind((0, 0))
+        self._seq = itertools.count(1)
+
+        try:
+            _replies = self._request(GENL_ID_CTRL, NLM_F_REQUEST, CTRL_CMD_GETFAMILY,
+                                     pack_attr(CTRL_ATTR_FAMILY_NAME, b'nl80211\0'))
+            self._family = _U16.unpack(parse_attrs(_replies[0])[CTRL_ATTR_FAMILY_ID][:2])[0]
+        except (OSError, IndexError, KeyError) as e:
+            self._sock.close()
+            raise OSError(errno.ENOENT, "nl80211 is not available ({})".format(e))
+
+    def set_channel(self, ifindex, channel):
+        """
+        Set the channel of an interface
+
+        :param ifindex: Index of the interface
+        :type ifindex: int
+        :param channel: Channel number
+        :type channel: int
+        """
+
+        self._request(self._family, NLM_F_REQUEST | NLM_F_ACK, NL80211_CMD_SET_WIPHY,
+                      pack_attr(NL80211_ATTR_IFINDEX, _U32.pack(ifindex)) +
+                      pack_attr(NL80211_ATTR_WIPHY_FREQ, _U32.pack(channel_to_frequency(channel))) +
+                      pack_attr(NL80211_ATTR_WIPHY_CHANNEL_TYPE, _U32.pack(NL80211_CHAN_NO_HT)))
+
+    def get_interface(self, ifindex):
+        """
+        Query the nl80211 state of an interface
+
+        :param ifindex: Index of the interface
+        :type ifindex: int
+        :return: Dictionary of nl80211 attribute type to payload
+        :rtype: dict
+        """
+
+        return parse_attrs(self._request(self._family, NLM_F_REQUEST, NL80211_CMD_GET_INTERFACE,
+                                         pack_attr(NL80211_ATTR_IFINDEX, _U32.pack(ifindex)))[0])
+
+    def get_frequency(self, ifindex):
+        """
+        Current frequency of an interface, or None if it is not tuned
+
+        :param ifindex: Index of the interface
+        :type ifindex: int
+        :rtype: int
+        """
+
+        _attrs = self.get_interface(ifindex)
+        if NL80211_ATTR_WIPHY_FREQ in _attrs:
+            return _U32.unpack(_attrs[NL80211_ATTR_WIPHY_FREQ][:4])[0]
+        return None
+
+    def interfaces(self):
+        """
+        Dump the nl80211 state of every wireless interface
+
+        :return: Dictionary of interface name to dictionary of nl80211 attribute type to payload
+        :rtype: dict
+        """
+
+        _interfaces = {}
+        for reply in self._request(self._family, NLM_F_REQUEST | NLM_F_DUMP, NL80211_CMD_GET_INTERFACE, b''):
+            _attrs = parse_attrs(reply)
+            if NL80211_ATTR_IFNAME in _attrs:
+                _interfaces[_attrs[NL80211_ATTR_IFNAME].rstrip(b'\0').decode()] = _attrs
+
+        return _interfaces
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _request(self, msg_type, flags, cmd, attrs):
+        """
+        Send a request and collect the generic netlink payloads (without the genl header) of the replies
+
+        :return: List of attribute payloads
+        :rtype: list[bytes]
+        """
+
+        _seq = next(self._seq)
+        self._sock.send(pack_message(msg_type, flags, _seq, cmd, attrs))
+
+        _replies = []
+        while True:
+            for _type, _flags, _reply_seq, _payload in parse_messages(self._sock.recv(65536)):
+                if _reply_seq != _seq:
+                    continue
+                if _type == NLMSG_ERROR:
+                    _errno = -_ERRNO.unpack_from(_payload)[0]
+                    if _errno:
+                        raise OSError(_errno, os.strerror(_errno))
+                    return _replies
+                if _type == NLMSG_DONE:
+                    return _replies
+
+                _replies.append(_payload[_GENLMSGHDR.size:])
+
+                # Without an ack or dump, the single reply is the end of the exchange
+                if not flags & (NLM_F_ACK | NLM_F_DUMP) and not _flags & NLM_F_MULTI:
+                    return _replies
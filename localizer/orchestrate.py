@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from tqdm import tqdm
+
+module_logger = logging.getLogger(__name__)
+
+
+class PhaseTimer:
+
+    def __init__(self):
+        """
+        Wall time of each phase of a capture, in the order they ran
+        """
+
+        self.phases = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block as a phase
+
+        :param name: Name of the phase
+        :type name: str
+        """
+
+        _start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.time() - _start
+            module_logger.debug("Phase '{}' took {:.3f}s".format(name, self.phases[name]))
+
+    def record(self, name, start):
+        """
+        Record a phase that started at a given time and ends now
+
+        :param name: Name of the phase
+        :type name: str
+        :param start: Start of the phase
+        :type start: float
+        """
+
+        self.phases[name] = time.time() - start
+
+    def __str__(self):
+        return ','.join("{}:{:.3f}".format(name, elapsed) for name, elapsed in self.phases.items())
+
+
+def wait_event(event, timeout=None):
+    """
+    Await a threading.Event without blocking the loop
+
+    :param event: Event to wait for
+    :type event: threading.Event
+    :param timeout: Seconds to wait, or None to wait indefinitely
+    :type timeout: float
+    :return: Awaitable that resolves to True if the event was set
+    """
+
+    return in_thread(event.wait, timeout)
+
+
+def get_result(response_queue):
+    """
+    Await the next response a thread puts on its queue. The wait starts at once, so responses awaited together are
+    each picked up as soon as they are ready
+
+    :param response_queue: Queue
+    :type response_queue: queue.Queue
+    :return: Awaitable that resolves to the response
+    """
+
+    return in_thread(response_queue.get)
+
+
+def in_thread(function, *args):
+    """
+    Await a blocking call, made on a daemon thread that wakes the loop as soon as the call returns. Cancelling the
+    awaitable lets the thread go: it can neither hold up the loop closing nor the interpreter exiting
+
+    :param function: Function to call
+    :type function: callable
+    :return: Awaitable that resolves to the result of the call
+    """
+
+    _loop = asyncio.get_event_loop()
+    _future = _loop.create_future()
+
+    def _call():
+        try:
+            _outcome = (_future.set_result, function(*args))
+        except Exception as e:
+            _outcome = (_future.set_exception, e)
+        try:
+            _loop.call_soon_threadsafe(_settle, _future, *_outcome)
+        except RuntimeError:
+            # The loop has closed; nobody is waiting any more
+            pass
+
+    threading.Thread(target=_call, daemon=True).start()
+    return _future
+
+
+def _settle(future, setter, value):
+    if not future.done():
+        setter(value)
+
+
+def join_thread(thread):
+    """
+    Await a thread finishing
+
+    :param thread: Thread
+    :type thread: threading.Thread
+    :return: Awaitable
+    """
+
+    return in_thread(thread.join)
+
+
+async def countdown(duration, desc):
+    """
+    Show a progress bar ticking once per second for a duration. Ticks are scheduled from the start on the loop's
+    clock, so the bar does not drift behind the capture
+
+    :param duration: Seconds
+    :type duration: float
+    :param desc: Progress bar description
+    :type desc: str
+    """
+
+    _loop = asyncio.get_event_loop()
+    _start = _loop.time()
+    with tqdm(total=int(duration), desc="{:<35}".format(desc)) as pbar:
+        for tick in range(1, int(duration) + 1):
+            await asyncio.sleep(max(0, _start + tick - _loop.time()))
+            pbar.update()
+
+
+def run(coroutine):
+    """
+    Run a coroutine to completion on a fresh event loop. Interrupting it (Ctrl-C) cancels the coroutine before the
+    KeyboardInterrupt is raised, so it can clean up
+
+    :param coroutine: Coroutine
+    :return: Result of the coroutine
+    """
+
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _task = _loop.create_task(coroutine)
+    try:
+        return _loop.run_until_complete(_task)
+    except KeyboardInterrupt:
+        _task.cancel()
+        _loop.run_until_complete(asyncio.gather(_task, return_exceptions=True))
+        raise
+    finally:
+        asyncio.set_event_loop(None)
+        _loop.close()
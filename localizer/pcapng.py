@@ -0,0 +1,251 @@
+import collections
+import logging
+import struct
+
+module_logger = logging.getLogger(__name__)
+
+# Block types
+SHB = 0x0A0D0D0A
+IDB = 0x00000001
+SPB = 0x00000003
+EPB = 0x00000006
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# Link types
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+# Interface description options
+OPT_ENDOFOPT = 0
+IF_TSRESOL = 9
+
+# 802.11 management subtypes (first byte of the frame control field)
+SUBTYPE_BEACON = 0x80
+SUBTYPE_PROBE_RESP = 0x50
+
+# Radiotap fields up to dBm antenna signal: (size, alignment)
+_RADIOTAP_FIELDS = [(8, 8),  # TSFT
+                    (1, 1),  # Flags
+                    (1, 1),  # Rate
+                    (4, 2),  # Channel (frequency, flags)
+                    (2, 1),  # FHSS
+                    (1, 1),  # dBm antenna signal
+                    ]
+_RADIOTAP_CHANNEL = 3
+_RADIOTAP_DBM_ANTSIGNAL = 5
+
+# Information elements
+IE_SSID = 0
+IE_DS_PARAMETER = 3
+IE_HT_OPERATION = 61
+
+# Buffer packets in memory and write them out in large chunks, so slow storage stalls the writer less often
+WRITE_BUFFER = 4 * 1024 * 1024
+
+Packet = collections.namedtuple('Packet', ['timestamp', 'linktype', 'data', 'length'])
+Beacon = collections.namedtuple('Beacon', ['subtype', 'bssid', 'ssid', 'channel', 'tsf', 'interval'])
+
+
+class Reader:
+
+    def __init__(self, fp):
+        """
+        Incremental pcapng reader. Blocks that are only partly written are left for the next call to packets(), so a
+        file can be tailed while dumpcap is still writing it
+
+        :param fp: Binary file object positioned at the start of the section header
+        """
+
+        self._fp = fp
+        self._endian = '<'
+        self._interfaces = []
+
+    def packets(self):
+        """
+        Read all complete packets currently available
+
+        :return: Generator of Packet
+        """
+
+        while True:
+            _block_start = self._fp.tell()
+            _header = self._fp.read(8)
+            if len(_header) < 8:
+                self._fp.seek(_block_start)
+                return
+
+            _block_type, _block_length = struct.unpack(self._endian + 'II', _header)
+            if _block_type == SHB:
+                # The section header determines the byte order of everything that follows
+                _magic = self._fp.read(4)
+                if len(_magic) < 4:
+                    self._fp.seek(_block_start)
+                    return
+                self._endian = '<' if struct.unpack('<I', _magic)[0] == BYTE_ORDER_MAGIC else '>'
+                _block_length = struct.unpack(self._endian + 'I', _header[4:])[0]
+                self._fp.seek(_block_start + 8)
+
+            _body = self._fp.read(_block_length - 8)
+            if _block_length < 12 or len(_body) < _block_length - 8:
+                self._fp.seek(_block_start)
+                return
+
+            if _block_type == SHB:
+                self._interfaces = []
+            elif _block_type == IDB:
+                self._interfaces.append(self._parse_idb(_body[:-4]))
+            elif _block_type == EPB:
+                _packet = self._parse_epb(_body[:-4])
+                if _packet is not None:
+                    yield _packet
+            elif _block_type == SPB and self._interfaces:
+                _length = struct.unpack_from(self._endian + 'I', _body)[0]
+                _linktype, _snaplen, _ = self._interfaces[0]
+                _caplen = min(_length, _snaplen) if _snaplen else _length
+                yield Packet(None, _linktype, _body[4:4 + _caplen], _length)
+
+    def _parse_idb(self, body):
+        _linktype, _, _snaplen = struct.unpack_from(self._endian + 'HHI', body)
+        _resolution = 1e-6
+
+        # Walk the options looking for the timestamp resolution
+        _offset = 8
+        while _offset + 4 <= len(body):
+            _code, _length = struct.unpack_from(self._endian + 'HH', body, _offset)
+            if _code == OPT_ENDOFOPT:
+                break
+            if _code == IF_TSRESOL and _length >= 1:
+                _value = body[_offset + 4]
+                _resolution = 2 ** -(_value & 0x7f) if _value & 0x80 else 10 ** -_value
+            _offset += 4 + ((_length + 3) & ~3)
+
+        return _linktype, _snaplen, _resolution
+
+    def _parse_epb(self, body):
+        _interface, _ts_high, _ts_low, _caplen, _length = struct.unpack_from(self._endian + 'IIIII', body)
+        if _interface >= len(self._interfaces):
+            module_logger.warning("Packet for unknown interface {}".format(_interface))
+            return None
+
+        _linktype, _, _resolution = self._interfaces[_interface]
+        return Packet(((_ts_high << 32) | _ts_low) * _resolution, _linktype, body[20:20 + _caplen], _length)
+
+
+class Writer:
+
+    def __init__(self, fp, linktype=LINKTYPE_IEEE802_11_RADIOTAP, snaplen=0):
+        """
+        Minimal pcapng writer: a section header, one interface with nanosecond timestamps, then enhanced packet blocks
+
+        :param fp: Binary file object to write to
+        :param linktype: Link type of the interface
+        :type linktype: int
+        :param snaplen: Snap length of the interface, 0 for unlimited
+        :type snaplen: int
+        """
+
+        self._fp = fp
+        self.packets = 0
+        self._write_block(SHB, struct.pack('<IHHq', BYTE_ORDER_MAGIC, 1, 0, -1))
+        self._write_block(IDB, struct.pack('<HHI', linktype, 0, snaplen) +
+                          struct.pack('<HHB3x', IF_TSRESOL, 1, 9) + struct.pack('<HH', OPT_ENDOFOPT, 0))
+
+    def write(self, timestamp_ns, data, length=None):
+        """
+        Write a packet
+
+        :param timestamp_ns: Capture time, in nanoseconds since the epoch
+        :type timestamp_ns: int
+        :param data: Captured bytes (any buffer, eg a memoryview into a capture ring)
+        :param length: Original length of the packet, if it was truncated
+        :type length: int
+        """
+
+        _caplen = len(data)
+        self._write_block(EPB, struct.pack('<IIIII', 0, timestamp_ns >> 32, timestamp_ns & 0xffffffff, _caplen,
+                                           length or _caplen), data)
+        self.packets += 1
+
+    def flush(self):
+        self._fp.flush()
+
+    def _write_block(self, block_type, header, data=b''):
+        _padding = -(len(header) + len(data)) % 4
+        _length = 12 + len(header) + len(data) + _padding
+        self._fp.write(struct.pack('<II', block_type, _length))
+        self._fp.write(header)
+        self._fp.write(data)
+        self._fp.write(b'\0' * _padding + struct.pack('<I', _length))
+
+
+def parse_radiotap(data):
+    """
+    Parse the length, channel frequency and signal strength from a radiotap header
+
+    :param data: Packet data, starting with the radiotap header
+    :type data: bytes
+    :return: (header length, frequency in MHz or None, signal in dBm or None)
+    :rtype: tuple
+    """
+
+    if len(data) < 8:
+        return None, None, None
+
+    _length, = struct.unpack_from('<H', data, 2)
+    _present, = struct.unpack_from('<I', data, 4)
+
+    # Skip any extended presence bitmaps
+    _offset = 8
+    _word = _present
+    while _word & 0x80000000 and _offset + 4 <= _length:
+        _word, = struct.unpack_from('<I', data, _offset)
+        _offset += 4
+
+    _frequency = _signal = None
+    for bit, (size, align) in enumerate(_RADIOTAP_FIELDS):
+        if not _present & (1 << bit):
+            continue
+        _offset = (_offset + align - 1) & ~(align - 1)
+        if _offset + size > _length:
+            break
+        if bit == _RADIOTAP_CHANNEL:
+            _frequency, = struct.unpack_from('<H', data, _offset)
+        elif bit == _RADIOTAP_DBM_ANTSIGNAL:
+            _signal, = struct.unpack_from('<b', data, _offset)
+        _offset += size
+
+    return _length, _frequency, _signal
+
+
+def parse_beacon(frame):
+    """
+    Parse an 802.11 beacon or probe response
+
+    :param frame: 802.11 frame, without the radiotap header
+    :type frame: bytes or memoryview
+    :return: Beacon, or None if the frame is not a beacon or probe response
+    :rtype: Beacon
+    """
+
+    if len(frame) < 36 or frame[0] not in (SUBTYPE_BEACON, SUBTYPE_PROBE_RESP):
+        return None
+
+    _bssid = ':'.join('{:02x}'.format(b) for b in bytes(frame[16:22]))
+    _tsf, _interval = struct.unpack_from('<QH', frame, 24)
+
+    _ssid = None
+    _channel = None
+    _offset = 36
+    while _offset + 2 <= len(frame):
+        _id, _length = frame[_offset], frame[_offset + 1]
+        _value = frame[_offset + 2:_offset + 2 + _length]
+        if len(_value) < _length:
+            break
+        if _id == IE_SSID:
+            _ssid = bytes(_value).decode('utf-8', 'replace')
+        elif _id == IE_DS_PARAMETER and _length >= 1:
+            _channel = _value[0]
+        elif _id == IE_HT_OPERATION and _length >= 1 and _channel is None:
+            _channel = _value[0]
+        _offset += 2 + _length
+
+    return Beacon(frame[0], _bssid, _ssid, _channel, _tsf, _interval)
@@ -1,10 +1,14 @@
 import csv
+import heapq
 import logging
 import os
+import sqlite3
 import time
 from concurrent import futures
 from datetime import date
+from distutils.util import strtobool
 
+import numpy as np
 import pandas as pd
 import pyshark
 from dateutil import parser
@@ -14,20 +18,21 @@ import geomag #CB
 
 from tqdm import tqdm
 
-from localizer import locate
-from localizer.meta import meta_csv_fieldnames, capture_suffixes, required_suffixes
+from localizer import archive, locate, store, track
+from localizer.meta import meta_csv_fieldnames, capture_suffixes, required_suffixes, channel_timeline_fieldnames
 
 module_logger = logging.getLogger(__name__)
 
 
-def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True, macs=None):
+def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True, macs=None, estimator=None):
     """
     Process a captured data set
     :param meta:            meta dict containing capture results
     :param write_to_disk:   bool designating whether to write to disk
     :param guess:           bool designating whether to return a table of guessed bearings for detected BSSIDs
-    :param clockwise:       direction antenna was moving during the capture,
+    :param clockwise:       direction antenna was moving during the capture, if not recorded in the meta
     :param macs:            list of macs to filter on
+    :param estimator:       triangulate.APEstimator to fold the guessed bearings into, if any
     :return: (_beacon_count, _results_path):
     """
 
@@ -36,6 +41,10 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
     _beacon_count = 0
     _beacon_failures = 0
 
+    # Prefer the sweep direction recorded in the capture metadata, if any
+    if meta_csv_fieldnames[24] in meta and meta[meta_csv_fieldnames[24]] not in (None, ''):
+        clockwise = bool(strtobool(str(meta[meta_csv_fieldnames[24]])))
+
     # Correct bearing to compensate for magnetic declination
     #CB _declination = WorldMagneticModel()\
     #CB     .calc_mag_field(float(meta[meta_csv_fieldnames[6]]),
@@ -73,7 +82,10 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
                         ]
 
     _rows = []
-    _pcap = os.path.join(path, meta[meta_csv_fieldnames[16]])
+    _sources = []
+    # Multi-radio captures list one pcap (and one channel timeline) per radio
+    # Archived captures are read compressed; tshark decompresses as it reads
+    _pcaps = [archive.resolve(os.path.join(path, pcap)) for pcap in meta[meta_csv_fieldnames[16]].split(',')]
 
     # Build filter string
     _filter = 'wlan' #CB: 'wlan[0] == 0x80'
@@ -87,14 +99,19 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
         _mac_string += ')'
         _filter += _mac_string
 
-    packets = pyshark.FileCapture(_pcap, display_filter=_filter, keep_packets=False, use_json=True)
+    packets = merge_captures([pyshark.FileCapture(pcap, display_filter=_filter, keep_packets=False, use_json=True)
+                              for pcap in _pcaps])
 
-    for packet in packets:
+    for psource, ptime, packet in packets:
 
         try:
-            # Get time, bssid & db from packet
+            # Get bssid & db from packet
             pbssid = packet.wlan.bssid
-            ptime = parser.parse(packet.sniff_timestamp).timestamp()
+
+            # Skip packets captured outside of the sweep; dumpcap starts before and stops after the antenna
+            if ptime < float(meta["start"]) or ptime > float(meta["end"]):
+                continue
+
             pssid = next((tag.ssid for tag in packet.wlan_mgt.tagged.all.tag if hasattr(tag, 'ssid')), None)
             pssi = int(packet.wlan_radio.signal_dbm) if hasattr(packet.wlan_radio, 'signal_dbm') else int(packet.radiotap.dbm_antsignal)
             pchannel = next((int(tag.current_channel) for tag in packet.wlan_mgt.tagged.all.tag if hasattr(tag, 'current_channel')), None)
@@ -210,6 +227,7 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
             meta[meta_csv_fieldnames[11]],
         ])
 
+        _sources.append(psource)
         _beacon_count += 1
 
     _results_df = pd.DataFrame(_rows, columns=_default_columns)
@@ -217,6 +235,33 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
     _results_df.loc[:, 'mw'] = dbm_to_mw(_results_df['ssi'])
     module_logger.info("Completed processing {} beacons ({} failures)".format(_beacon_count, _beacon_failures))
 
+    # Locate each packet along the gps track, so captures taken on the move are usable; otherwise keep the average fix
+    _track = track.load_track(meta, path)
+    if _track is not None and len(_results_df):
+        _lat, _lon, _alt = track.interpolate(_track, _results_df['timestamp'].values)
+        _results_df.loc[:, 'lat'] = _lat
+        _results_df.loc[:, 'lon'] = _lon
+        _results_df.loc[:, 'alt'] = _alt
+
+    # Attribute each packet to the dwell window it was captured in, on the radio that captured it
+    if meta_csv_fieldnames[25] in meta and meta[meta_csv_fieldnames[25]]:
+        _sources = np.array(_sources, dtype=int)
+        _hop_channel = None
+        for i, timeline in enumerate(meta[meta_csv_fieldnames[25]].split(',')):
+            _timeline_path = archive.resolve(os.path.join(path, timeline))
+            if not os.path.isfile(_timeline_path):
+                continue
+            _timeline = load_channel_timeline(_timeline_path)
+            _from_source = _sources == i
+            if _hop_channel is None:
+                _hop_channel = np.zeros(len(_sources), dtype=int)
+            _hop_channel[_from_source] = hop_channels(_timeline, _results_df['timestamp'].values[_from_source])
+            _dwell = channel_dwell(_timeline, float(meta["start"]), float(meta["end"]))
+            module_logger.info("Effective dwell per channel (s): {}; mean switch latency {:.2f}ms"
+                               .format(_dwell.round(2).to_dict(), _timeline['latency'][1:].mean() * 1000))
+        if _hop_channel is not None:
+            _results_df.loc[:, 'hop_channel'] = _hop_channel
+
     # If asked to guess, return list of bssids and a guess as to their bearing
     if guess:
         _columns = ['ssid', 'bssid', 'channel', 'security', 'strength', 'method', 'bearing']
@@ -245,6 +290,15 @@ def process_capture(meta, path, write_to_disk=False, guess=False, clockwise=True
 
             guess = pd.DataFrame(_rows, columns=_columns).sort_values('strength', ascending=False)
 
+        # Keep the estimates for later sessions; the results stand on their own if the store is unavailable
+        try:
+            store.Store().record(meta, guess)
+        except sqlite3.Error as e:
+            module_logger.warning("Could not record observations: {}".format(e))
+
+        if estimator is not None:
+            estimator.update_guesses(meta, guess)
+
     # If a path is given, write the results to a file
     if write_to_disk:
         _results_path = os.path.join(path, time.strftime('%Y%m%d-%H-%M-%S') + "-results" + ".csv")
@@ -266,7 +320,7 @@ def _check_capture_dir(files):
     """
 
     for suffix in required_suffixes.values():
-        if not any(file.endswith(suffix) for file in files):
+        if not any(archive.has_suffix(file, suffix) for file in files):
             return False
 
     return True
@@ -282,7 +336,7 @@ def _check_capture_processed(files):
     :rtype: bool
     """
 
-    if any(file.endswith(capture_suffixes["results"]) for file in files):
+    if any(archive.has_suffix(file, capture_suffixes["results"]) for file in files):
         return True
 
     return False
@@ -305,7 +359,16 @@ def _get_capture_meta(files):
     return None
 
 
-def process_directory(macs=None, clockwise=True):
+def _process_and_compress(meta, path, clockwise, macs, compress):
+    # Guessing records the bearings in the store, as for captures processed as they are taken
+    _result = process_capture(meta, path, True, True, clockwise, macs)
+    # Only once the results are safely written
+    if compress:
+        archive.compress_capture(path)
+    return _result
+
+
+def process_directory(macs=None, clockwise=True, compress=True):
     """
     Process entire directory - will search subdirectories for required files and process them if not already processed
 
@@ -313,6 +376,8 @@ def process_directory(macs=None, clockwise=True):
     :type macs: list[str]
     :param clockwise: Direction of antenna travel
     :type clockwise: bool
+    :param compress: Compress the files of each capture once it is processed
+    :type compress: bool
     :return: The number of directories processed
     :rtype: int
     """
@@ -340,7 +405,7 @@ def process_directory(macs=None, clockwise=True):
                     _meta_reader = csv.DictReader(meta_csv, dialect='unix')
                     meta = next(_meta_reader)
 
-                _processes[executor.submit(process_capture, meta, root, True, False, clockwise, macs)] = _path
+                _processes[executor.submit(_process_and_compress, meta, root, clockwise, macs, compress)] = _path
 
         print("Found {} unprocessed data sets".format(len(_processes)))
 
@@ -354,5 +419,70 @@ def process_directory(macs=None, clockwise=True):
                 print("Processed {} packets in {} directories".format(_results, len(_processes)))
 
 
+def merge_captures(captures):
+    """
+    Merge packets from several captures (one per radio) into a single stream ordered by capture time
+
+    :param captures: Iterables of packets, each in time order
+    :type captures: list
+    :return: Generator of (index of the capture, timestamp, packet)
+    """
+
+    def _timed(index, capture):
+        for packet in capture:
+            yield index, parser.parse(packet.sniff_timestamp).timestamp(), packet
+
+    return heapq.merge(*[_timed(i, c) for i, c in enumerate(captures)], key=lambda p: p[1])
+
+
+def load_channel_timeline(path):
+    """
+    Load a channel timeline written by the channel hopper
+
+    :param path: Path of the timeline csv
+    :type path: str
+    :return: DataFrame with the time each channel became active, the channel, and the switch latency
+    :rtype: pd.DataFrame
+    """
+
+    return pd.read_csv(path, names=channel_timeline_fieldnames, header=0).sort_values('timestamp')
+
+
+def hop_channels(timeline, timestamps):
+    """
+    Determine which channel the radio was tuned to at each timestamp
+
+    :param timeline: Channel timeline
+    :type timeline: pd.DataFrame
+    :param timestamps: Packet timestamps
+    :type timestamps: pd.Series
+    :return: Channel per timestamp, 0 while the radio could not be tuned
+    :rtype: np.ndarray
+    """
+
+    _index = np.searchsorted(timeline['timestamp'].values, np.asarray(timestamps, dtype=float), side='right') - 1
+    return timeline['channel'].values[np.clip(_index, 0, len(timeline) - 1)]
+
+
+def channel_dwell(timeline, start, end):
+    """
+    Total time spent on each channel between start and end
+
+    :param timeline: Channel timeline
+    :type timeline: pd.DataFrame
+    :param start: Start of the window
+    :type start: float
+    :param end: End of the window
+    :type end: float
+    :return: Seconds per channel
+    :rtype: pd.Series
+    """
+
+    _times = timeline['timestamp'].values
+    _starts = np.clip(_times, start, end)
+    _ends = np.clip(np.append(_times[1:], end), start, end)
+    return pd.Series(_ends - _starts, index=timeline['channel'].values).groupby(level=0).sum()
+
+
 def dbm_to_mw(dbm):
     return 10**(dbm/10)
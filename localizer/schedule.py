@@ -0,0 +1,170 @@
+import functools
+import itertools
+import logging
+
+from localizer import motion
+
+module_logger = logging.getLogger(__name__)
+
+# Orders of up to this many sectors are searched exhaustively, larger ones greedily with local improvement
+EXACT_SEARCH_LIMIT = 6
+
+
+class Sector:
+
+    def __init__(self, bearing, width, duration, key=None):
+        """
+        A sector of bearings to sweep in a focused capture
+
+        :param bearing: Start bearing of the sector, which spans clockwise from bearing to bearing + width
+        :type bearing: float
+        :param width: Width of the sector in degrees
+        :type width: float
+        :param duration: Duration of the capture over the sector
+        :type duration: float
+        :param key: Identifier for the sector, eg the focused BSSID
+        """
+
+        self.bearing = bearing % 360
+        self.width = width
+        self.duration = duration
+        self.key = key
+
+    def start(self, clockwise):
+        """
+        Bearing the sweep starts from in the given direction
+        """
+
+        return self.bearing if clockwise else (self.bearing + self.width) % 360
+
+    def sweep(self, clockwise):
+        """
+        Signed number of degrees swept in the given direction
+        """
+
+        return self.width if clockwise else -self.width
+
+    def __repr__(self):
+        return "Sector({}, {}, {}, {})".format(self.bearing, self.width, self.duration, self.key)
+
+
+def simulate(current, visits, travel_time, bearing_min, bearing_max, return_bearing=None):
+    """
+    Simulate the antenna over a sequence of sector visits
+
+    :param current: Current (unwrapped) bearing of the antenna
+    :type current: float
+    :param visits: List of (Sector, clockwise)
+    :type visits: list[tuple]
+    :param travel_time: Function returning the time needed for a reset of the given number of degrees
+    :type travel_time: callable
+    :param bearing_min: Lowest unwrapped bearing the antenna may reach
+    :type bearing_min: float
+    :param bearing_max: Highest unwrapped bearing the antenna may reach
+    :type bearing_max: float
+    :param return_bearing: Bearing to reset to after the last visit, if any
+    :type return_bearing: float
+    :return: (Total reset time, final unwrapped bearing)
+    :rtype: tuple
+    """
+
+    _reset_time = 0
+    for sector, clockwise in visits:
+        _sweep = sector.sweep(clockwise)
+        _travel = motion.best_path(current, sector.start(clockwise), _sweep, bearing_min, bearing_max)
+        _reset_time += travel_time(_travel)
+        current += _travel + _sweep
+
+    if return_bearing is not None:
+        _travel = motion.best_path(current, return_bearing, 0, bearing_min, bearing_max)
+        _reset_time += travel_time(_travel)
+        current += _travel
+
+    return _reset_time, current
+
+
+def _exact(sectors, directions, cost):
+    _best = None
+    _best_cost = None
+    for order in itertools.permutations(sectors):
+        for dirs in itertools.product(directions, repeat=len(order)):
+            _visits = list(zip(order, dirs))
+            _cost = cost(_visits)
+            if _best_cost is None or _cost < _best_cost:
+                _best, _best_cost = _visits, _cost
+
+    return _best
+
+
+def _greedy(sectors, directions, cost):
+    # Nearest neighbour by reset time
+    _visits = []
+    _remaining = list(sectors)
+    while _remaining:
+        _next = min(((s, d) for s in _remaining for d in directions), key=lambda v: cost(_visits + [v]))
+        _visits.append(_next)
+        _remaining.remove(_next[0])
+
+    # Improve with 2-opt segment reversals, flipping direction of the reversed sectors when allowed
+    _best_cost = cost(_visits)
+    _improved = True
+    while _improved:
+        _improved = False
+        for i, j in itertools.combinations(range(len(_visits)), 2):
+            _segment = list(reversed(_visits[i:j + 1]))
+            if len(directions) > 1:
+                _candidates = [_segment, [(s, not d) for s, d in _segment]]
+            else:
+                _candidates = [_segment]
+            for candidate in _candidates:
+                _proposed = _visits[:i] + candidate + _visits[j + 1:]
+                _cost = cost(_proposed)
+                if _cost < _best_cost - 1e-9:
+                    _visits, _best_cost, _improved = _proposed, _cost, True
+
+    return _visits
+
+
+def plan(current, sectors, travel_time, bearing_min, bearing_max, return_bearing=None, bidirectional=True):
+    """
+    Order sectors (and pick a sweep direction for each) to minimize the total reset time, respecting the cable-wrap
+    limits of the antenna
+
+    :param current: Current (unwrapped) bearing of the antenna
+    :type current: float
+    :param sectors: Sectors to visit
+    :type sectors: list[Sector]
+    :param travel_time: Function returning the time needed for a reset of the given number of degrees
+    :type travel_time: callable
+    :param bearing_min: Lowest unwrapped bearing the antenna may reach
+    :type bearing_min: float
+    :param bearing_max: Highest unwrapped bearing the antenna may reach
+    :type bearing_max: float
+    :param return_bearing: Bearing to reset to after the last visit, if any
+    :type return_bearing: float
+    :param bidirectional: Allow sweeping counter-clockwise as well as clockwise
+    :type bidirectional: bool
+    :return: (List of (Sector, clockwise), predicted total duration including sweeps)
+    :rtype: tuple
+    """
+
+    if not sectors:
+        return [], 0
+
+    _directions = (True, False) if bidirectional else (True,)
+    _travel_time = functools.lru_cache(maxsize=None)(travel_time)
+
+    def cost(visits):
+        return simulate(current, visits, _travel_time, bearing_min, bearing_max,
+                        return_bearing if len(visits) == len(sectors) else None)[0]
+
+    if len(sectors) <= EXACT_SEARCH_LIMIT:
+        _visits = _exact(sectors, _directions, cost)
+    else:
+        _visits = _greedy(sectors, _directions, cost)
+
+    _duration = cost(_visits) + sum(s.duration for s in sectors)
+    module_logger.debug("Planned {} sectors; {:.1f}s resetting (in order: {:.1f}s)"
+                        .format(len(sectors), cost(_visits), cost([(s, True) for s in sectors])))
+
+    return _visits, _duration
@@ -10,13 +10,19 @@ import time
 from cmd import Cmd
 from distutils.util import strtobool
 
+import pandas as pd
 from tqdm import tqdm
 
 import localizer
-from localizer import capture, process, meta, antenna, interface
-from localizer.capture import APs
+from localizer import capture, coverage, process, meta, antenna, interface, gps, store, triangulate
+from localizer.aps import APs
 
 module_logger = logging.getLogger(__name__)
+
+# Times a batch capture is re-run after dropping too many packets
+MAX_REQUEUES = 1
+# Default radius of the nearby command (m)
+NEARBY_RADIUS = 500
 _file_handler = logging.FileHandler('localizer.log')
 _file_handler.setLevel(logging.DEBUG)
 _file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s: %(message)s'))
@@ -121,12 +127,16 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
         if macs:
             self._params.macs = macs
         self._aps = APs()
+        self._estimator = triangulate.APEstimator()
 
         # Ensure we have root
         if os.getuid() != 0:
             print("Error: this application needs root to run correctly. Please run as root.")
             exit(1)
 
+        # Start tracking the gps fix so it is warm by the first capture
+        gps.service()
+
         # WiFi
         module_logger.info("Initializing WiFi")
         # Set interface to first
@@ -179,6 +189,9 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
         Set a named parameter. All parameters require a value except for iface and macs
         - iface without a parameter will set the iface to the first system wireless iface found
         - macs without a parameter will delete the mac address whitelist
+        - duration auto [resolution] [confidence] will set the shortest duration that samples every channel at least
+          once per resolution degrees with the given confidence (by default 40 degrees at 95%, which is what the
+          standard 20s sweep reaches)
 
         :param args: Parameter name followed by new value
         :type args: str
@@ -207,6 +220,9 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
                 if split_args[0] == "iface":
                     self._params.iface = value
                 elif param == "duration":
+                    if value == "auto":
+                        # Shortest duration for the requested angular resolution (and confidence)
+                        value = self._auto_duration(*split_args[2:4])
                     self._params.duration = value
                 elif param == "degrees":
                     self._params.degrees = value
@@ -216,6 +232,12 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
                     self._params.hop_int = value
                 elif param == "hop_dist":
                     self._params.hop_dist = value
+                elif param == "hop_mode":
+                    self._params.hop_mode = value
+                elif param == "capture_engine":
+                    self._params.capture_engine = value
+                elif param == "capture_profile":
+                    self._params.capture_profile = value
                 elif param == "mac":
                     self._params.add_mac(value)
                 elif param == "macs":
@@ -235,6 +257,13 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
 
         self._update_prompt()
 
+    def _auto_duration(self, resolution=coverage.DEFAULT_RESOLUTION, confidence=coverage.DEFAULT_CONFIDENCE):
+        if self._params.degrees is None or self._params.hop_int is None or self._params.hop_dist is None:
+            raise ValueError("Set degrees, hop_int and hop_dist before an automatic duration")
+
+        return coverage.min_duration(self._params.degrees, self._params.hop_int, self._params.hop_dist,
+                                     float(resolution), float(confidence))
+
     def do_get(self, args):
         """
         View the specified parameter or all parameters if none specified. May also view system interface data
@@ -260,16 +289,63 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
             print("Debug is {}".format(localizer.debug))
             print("HTTP server is {}".format(localizer.serve))
 
-    def do_list(self, _):
+    def do_list(self, args):
         """
-        List any detected access points, their bearing, and whether they have been scanned
+        List any detected access points, their bearing, and whether they have been scanned. Long lists are paged:
+        list <page>
         """
 
+        split_args = args.split()
+
         if self._aps:
-            print(self._aps)
+            try:
+                _page = int(split_args[0]) - 1 if split_args else 0
+            except ValueError:
+                _page = -1
+            if not 0 <= _page < self._aps.pages():
+                print("Invalid page; there are {} pages".format(self._aps.pages()))
+            else:
+                print(self._aps.page(_page))
         else:
             print("No detected aps, or scan hasn't been performed")
 
+    def do_positions(self, _):
+        """
+        Show the estimated positions of access points seen from two or more capture positions this session
+        """
+
+        _positions = self._estimator.positions()
+        if _positions.empty:
+            print("No positions yet; access points must be seen from two capture positions")
+        else:
+            print(_positions.to_string())
+
+    def do_nearby(self, args):
+        """
+        List access points observed in earlier sessions from within a radius (m, default 500) of the current position:
+        nearby [radius]
+        """
+
+        split_args = args.split()
+
+        try:
+            _radius = float(split_args[0]) if split_args else NEARBY_RADIUS
+        except ValueError:
+            print("Invalid radius: {}".format(split_args[0]))
+            return
+
+        _now = time.time()
+        _fixes = gps.service().fixes(_now - gps.FIX_TIMEOUT, _now)
+        if not _fixes:
+            print("No current gps fix")
+            return
+
+        _near = store.Store().aps_near(_fixes[-1].lat, _fixes[-1].lon, _radius)
+        if _near.empty:
+            print("No access points observed within {}m".format(_radius))
+        else:
+            print(_near[['bssid', 'ssid', 'channel', 'bearing', 'strength', 'distance']].to_string())
+
     def do_capture(self, args):
         """
         Start the capture with the needed parameters set
@@ -293,9 +369,7 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
         if not _try_params.validate():
             module_logger.error("You must set 'iface' and 'duration' parameters first")
         else:
-            # Shutdown http server if it's on
-            localizer.shutdown_httpd()
-
+            # The http server stays up: it serves at idle priority and a throttled rate, so it does not starve the capture
             module_logger.info("Starting capture")
             try:
                 _result = capture.capture(_try_params, reset=_try_params.bearing_magnetic)
@@ -306,23 +380,25 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
                         _meta_reader = csv.DictReader(meta_csv, dialect='unix')
                         meta_values = next(_meta_reader)
 
-                    _, _, _, _aps = process.process_capture(meta_values, _capture_path, write_to_disk=False, guess=True, macs=_try_params.macs)
+                    _guess_file = meta_values.get(meta.meta_csv_fieldnames[20])
+                    if _guess_file and os.path.isfile(os.path.join(_capture_path, _guess_file)):
+                        # Processed, and recorded, while the capture threads finished
+                        _aps = pd.read_csv(os.path.join(_capture_path, _guess_file), index_col=0)
+                        self._estimator.update_guesses(meta_values, _aps)
+                    else:
+                        _, _, _, _aps = process.process_capture(meta_values, _capture_path, write_to_disk=False, guess=True, macs=_try_params.macs, estimator=self._estimator)
                     if len(self._aps):
                         self._aps.update(_aps)
                     else:
                         self._aps.aps = _aps
                     print(self._aps)
+                    self.do_positions('')
                 else:
                     raise RuntimeError("Capture failed")
 
             except RuntimeError as e:
                 module_logger.error(e)
 
-            finally:
-                # Restart http server if it is supposed to be on
-                if localizer.serve:
-                    localizer.start_httpd()
-
     def do_connect(self, args):
         """
         Connect to the specified access point number from the list command with the provided password.
@@ -338,7 +414,7 @@ class LocalizerShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
 
             # Connect to the access point
             try:
-                WiFiConnectShell(self._params.iface, _ap.ssid, split_args[1])
+                WiFiConnectShell(self._params.ifaces[0], _ap.ssid, split_args[1])
             except ValueError as e:
                 module_logger.error(e)
         else:
@@ -434,16 +510,31 @@ class BatchShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
             for _, _passes, _captures in self._batches:
                 _total += len(_captures)*_passes
 
-            _start_time = time.time()
-            print("Starting batch of {} captures".format(_total))
-            _curr = 0
+            # Build the whole run up front so each capture can reset the antenna for the next one
+            _runs = []
             for _, _passes, _captures in self._batches:
                 _len_pass = len(str(_passes))
                 for cap in _captures:
                     for p in range(_passes):
-                        print(localizer.R + "Capture {:>4}/{}\t\t{} elapsed".format(_curr, _total, datetime.timedelta(seconds=time.time()-_start_time)) + localizer.W)
-                        capture.capture(cap, str(p).zfill(_len_pass), cap.bearing_magnetic)
-                        _curr += 1
+                        _runs.append((cap, str(p).zfill(_len_pass)))
+
+            _start_time = time.time()
+            _retries = {}
+            print("Starting batch of {} captures".format(_total))
+            _curr = 0
+            while _curr < len(_runs):
+                cap, _pass = _runs[_curr]
+                _reset = _runs[_curr + 1][0].bearing_magnetic if _curr + 1 < len(_runs) else cap.bearing_magnetic
+                print(localizer.R + "Capture {:>4}/{}\t\t{} elapsed".format(_curr, len(_runs), datetime.timedelta(seconds=time.time()-_start_time)) + localizer.W)
+                _result = capture.capture(cap, _pass, _reset)
+
+                # Run captures that dropped too many packets again at the end of the batch, into their own pass
+                if _result and BatchShell._dropped_heavily(*_result) and _retries.get(_curr, 0) < MAX_REQUEUES:
+                    _retry = _retries.get(_curr, 0) + 1
+                    module_logger.warning("Re-queueing capture {} (pass {}) after heavy packet drops".format(cap.capture, _pass))
+                    _runs.append((cap, "{}-retry{}".format(_pass.split('-retry')[0], _retry)))
+                    _retries[len(_runs) - 1] = _retry
+                _curr += 1
 
             print("Complete - total time elapsed: {}".format(datetime.timedelta(seconds=time.time()-_start_time)))
 
@@ -508,6 +599,23 @@ class BatchShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
         return datetime.timedelta(seconds=_time)
 
 
+    @staticmethod
+    def _dropped_heavily(capture_path, meta_file):
+        """
+        Check the metadata of a finished capture for heavy packet drops
+
+        :param capture_path: Path of the capture
+        :type capture_path: str
+        :param meta_file: Name of the capture's meta file
+        :type meta_file: str
+        :rtype: bool
+        """
+
+        with open(os.path.join(capture_path, meta_file), 'rt') as meta_csv:
+            _meta = next(csv.DictReader(meta_csv, dialect='unix'))
+
+        return capture.drop_ratio(_meta[meta.meta_csv_fieldnames[29]], _meta[meta.meta_csv_fieldnames[30]]) > capture.MAX_DROP_RATIO
+
     @staticmethod
     def _parse_batch(file):
         """
@@ -599,6 +707,27 @@ class BatchShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
             else:
                 _hop_dist = interface.STD_CHANNEL_DISTANCE
 
+            if 'hop_mode' in capture_section:
+                _hop_mode = capture_section['hop_mode']
+            elif 'hop_mode' in meta_section:
+                _hop_mode = meta_section['hop_mode']
+            else:
+                _hop_mode = meta.HOP_FIXED
+
+            if 'capture_engine' in capture_section:
+                _capture_engine = capture_section['capture_engine']
+            elif 'capture_engine' in meta_section:
+                _capture_engine = meta_section['capture_engine']
+            else:
+                _capture_engine = meta.ENGINE_DUMPCAP
+
+            if 'capture_profile' in capture_section:
+                _capture_profile = capture_section['capture_profile']
+            elif 'capture_profile' in meta_section:
+                _capture_profile = meta_section['capture_profile']
+            else:
+                _capture_profile = meta.PROFILE_BEACONS
+
             if 'capture' in capture_section:
                 _capture = capture_section['capture']
             elif 'capture' in meta_section:
@@ -627,7 +756,26 @@ class BatchShell(ExitCmd, ShellCmd, DirCmd, DebugCmd):
             else:
                 _focused = None
 
-            cap = localizer.meta.Params(_iface, _duration, _degrees, _bearing, _hop_int, _hop_dist, _macs, _channel, _focused, _capture)
+            cap = localizer.meta.Params(_iface, _duration, _degrees, _bearing, _hop_int, _hop_dist, _macs, _channel, _focused, _capture, hop_mode=_hop_mode, capture_engine=_capture_engine, capture_profile=_capture_profile)
+
+            # A resolution (and optional confidence) picks the shortest duration that samples at that resolution
+            if 'resolution' in capture_section:
+                _resolution = capture_section['resolution']
+            elif 'resolution' in meta_section:
+                _resolution = meta_section['resolution']
+            else:
+                _resolution = None
+
+            if _resolution is not None:
+                if 'confidence' in capture_section:
+                    _confidence = capture_section['confidence']
+                elif 'confidence' in meta_section:
+                    _confidence = meta_section['confidence']
+                else:
+                    _confidence = coverage.DEFAULT_CONFIDENCE
+                cap.duration = coverage.min_duration(cap.degrees, cap.hop_int, cap.hop_dist, float(_resolution), float(_confidence))
+                module_logger.debug("Setting duration {} for a resolution of {} degrees".format(cap.duration, _resolution))
+
             # Validate iface
             module_logger.debug("Setting iface {}".format(_iface))
             cap.iface = _iface
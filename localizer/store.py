@@ -0,0 +1,218 @@
+import contextlib
+import logging
+import math
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from localizer.meta import meta_csv_fieldnames
+
+module_logger = logging.getLogger(__name__)
+
+# Observation store, kept in the working directory so every session run there builds on the last
+STORE_FILE = 'localizer.db'
+# Seconds to wait for another writer (eg a parallel processing job) to finish
+STORE_TIMEOUT = 30
+# Mean earth radius (m)
+EARTH_RADIUS = 6371008.8
+# Meters per degree of latitude
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+observation_fieldnames = ['bssid', 'ssid', 'security', 'channel', 'lat', 'lon', 'alt', 'bearing', 'strength', 'time', 'capture']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    bssid TEXT NOT NULL,
+    ssid TEXT,
+    security TEXT,
+    channel INTEGER,
+    lat REAL,
+    lon REAL,
+    alt REAL,
+    bearing REAL,
+    strength REAL,
+    time REAL,
+    capture TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_bssid ON observations (bssid, time);
+"""
+# A capture is its name and start time; it holds one observation per AP
+_UNIQUE = "CREATE UNIQUE INDEX IF NOT EXISTS observations_capture ON observations (capture, time, bssid)"
+# Keeps the latest of each capture's observations of an AP, for stores written before the unique index
+_DEDUPLICATE = "DELETE FROM observations WHERE id NOT IN (SELECT MAX(id) FROM observations GROUP BY capture, time, bssid)"
+_RTREE = "CREATE VIRTUAL TABLE IF NOT EXISTS observation_positions USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+_FALLBACK_INDEX = "CREATE INDEX IF NOT EXISTS observations_position ON observations (lat, lon)"
+
+
+def distance(lat, lon, lats, lons):
+    """
+    Great circle distance from a point to each of a set of points
+
+    :param lat: Latitude of the point
+    :type lat: float
+    :param lon: Longitude of the point
+    :type lon: float
+    :param lats: Latitudes
+    :type lats: np.ndarray
+    :param lons: Longitudes
+    :type lons: np.ndarray
+    :return: Distances (m)
+    :rtype: np.ndarray
+    """
+
+    _lat, _lats = math.radians(lat), np.radians(np.asarray(lats, dtype=float))
+    _dlat = _lats - _lat
+    _dlon = np.radians(np.asarray(lons, dtype=float) - lon)
+    _a = np.sin(_dlat / 2) ** 2 + math.cos(_lat) * np.cos(_lats) * np.sin(_dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(1, _a)))
+
+
+class Store:
+
+    def __init__(self, path=None):
+        """
+        SQLite store of AP observations across sessions: each capture's bearing estimate for each AP, with where and
+        when it was taken. Capture positions are indexed with an R*Tree, or a plain (lat, lon) index if SQLite was built
+        without it
+
+        :param path: Database file, defaults to STORE_FILE in the working directory
+        :type path: str
+        """
+
+        self._path = path or os.path.join(os.getcwd(), STORE_FILE)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            try:
+                conn.execute(_RTREE)
+                self.rtree = True
+            except sqlite3.OperationalError:
+                module_logger.info("SQLite has no R*Tree support; indexing positions with a plain index")
+                conn.execute(_FALLBACK_INDEX)
+                self.rtree = False
+            try:
+                conn.execute(_UNIQUE)
+            except sqlite3.IntegrityError:
+                _removed = conn.execute(_DEDUPLICATE).rowcount
+                module_logger.info("Removed {} duplicate observations from {}".format(_removed, self._path))
+                if self.rtree:
+                    conn.execute("DELETE FROM observation_positions WHERE id NOT IN (SELECT id FROM observations)")
+                conn.execute(_UNIQUE)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        _conn = sqlite3.connect(self._path, timeout=STORE_TIMEOUT)
+        try:
+            with _conn:
+                yield _conn
+        finally:
+            _conn.close()
+
+    def record(self, meta, guesses):
+        """
+        Add the bearing estimates of a processed capture, replacing any it was recorded with before, so reprocessing a
+        capture does not count it twice
+
+        :param meta: Capture meta
+        :type meta: dict
+        :param guesses: Guesses from process_capture, with ssid, bssid, channel, security, strength and bearing
+        :type guesses: pd.DataFrame
+        :return: Number of observations recorded
+        :rtype: int
+        """
+
+        _position = [_float(meta.get(meta_csv_fieldnames[i])) for i in (6, 7, 8)]
+        # Captures without a fix report 0, 0
+        if not _position[0] and not _position[1]:
+            _position = [None, None, None]
+        _time = _float(meta.get(meta_csv_fieldnames[12]))
+        _capture = meta.get(meta_csv_fieldnames[0])
+
+        _rows = [(row.bssid, row.ssid, row.security, _int(row.channel), _position[0], _position[1], _position[2],
+                  _float(row.bearing), _float(row.strength), _time, _capture)
+                 for row in guesses.itertuples(index=False)]
+
+        with self._connect() as conn:
+            # IS, as the capture may have no name or start time
+            _previous = "SELECT id FROM observations WHERE capture IS ? AND time IS ?"
+            if self.rtree:
+                conn.execute("DELETE FROM observation_positions WHERE id IN ({})".format(_previous), (_capture, _time))
+            conn.execute("DELETE FROM observations WHERE capture IS ? AND time IS ?", (_capture, _time))
+            for row in _rows:
+                _cursor = conn.execute("INSERT INTO observations ({}) VALUES ({})"
+                                       .format(', '.join(observation_fieldnames), ', '.join('?' * len(row))), row)
+                if self.rtree and row[4] is not None:
+                    conn.execute("INSERT INTO observation_positions VALUES (?, ?, ?, ?, ?)",
+                                 (_cursor.lastrowid, row[4], row[4], row[5], row[5]))
+
+        module_logger.info("Recorded {} observations in {}".format(len(_rows), self._path))
+        return len(_rows)
+
+    def aps_near(self, lat, lon, radius):
+        """
+        APs observed from captures within a radius of a position, with their latest observation from there
+
+        :param lat: Latitude
+        :type lat: float
+        :param lon: Longitude
+        :type lon: float
+        :param radius: Radius (m)
+        :type radius: float
+        :return: Observations, nearest capture position first, with its distance (m)
+        :rtype: pd.DataFrame
+        """
+
+        # Bounding box first, from the index, then the exact distance
+        _dlat = radius / METERS_PER_DEGREE
+        _dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        _box = (lat - _dlat, lat + _dlat, lon - _dlon, lon + _dlon)
+        _columns = ', '.join('o.' + f for f in observation_fieldnames)
+
+        with self._connect() as conn:
+            if self.rtree:
+                _query = "SELECT {} FROM observation_positions p JOIN observations o ON o.id = p.id " \
+                         "WHERE p.max_lat >= ? AND p.min_lat <= ? AND p.max_lon >= ? AND p.min_lon <= ?".format(_columns)
+                _params = (_box[0], _box[1], _box[2], _box[3])
+            else:
+                _query = "SELECT {} FROM observations o WHERE o.lat BETWEEN ? AND ? AND o.lon BETWEEN ? AND ?".format(_columns)
+                _params = _box
+            _near = pd.read_sql_query(_query, conn, params=_params)
+
+        _near['distance'] = distance(lat, lon, _near['lat'].values, _near['lon'].values)
+        _near = _near[_near['distance'] <= radius]
+        return _near.sort_values('time').drop_duplicates('bssid', keep='last')\
+            .sort_values('distance').reset_index(drop=True)
+
+    def last_bearing(self, bssid):
+        """
+        Latest bearing estimate for an AP, and where it was taken from
+
+        :param bssid: BSSID
+        :type bssid: str
+        :return: (bearing, lat, lon, time), or None if the AP has never been observed
+        :rtype: tuple
+        """
+
+        with self._connect() as conn:
+            return conn.execute("SELECT bearing, lat, lon, time FROM observations WHERE bssid = ? "
+                                "ORDER BY time DESC, id DESC LIMIT 1", (bssid,)).fetchone()
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+
+
+def _float(value):
+    try:
+        _value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(_value) else _value
+
+
+def _int(value):
+    _value = _float(value)
+    return None if _value is None else int(_value)
@@ -0,0 +1,118 @@
+import collections
+import logging
+import os
+import threading
+
+from localizer import pcapng
+from localizer.nl80211 import frequency_to_channel
+
+module_logger = logging.getLogger(__name__)
+
+# How long to wait for dumpcap to write more data before reading again
+TAP_POLL_INTERVAL = .05
+
+
+class BeaconTap(threading.Thread):
+
+    def __init__(self, pcap_path=None):
+        """
+        Follow a pcapng file while it is being captured and keep live per-channel beacon and BSSID counts. Without a
+        path, packets are fed directly to observe() by an in-process capture engine instead
+
+        :param pcap_path: Path of the pcapng file being written
+        :type pcap_path: str
+        """
+
+        super().__init__()
+
+        self.daemon = True
+        self._pcap_path = pcap_path
+        self._stop_flag = threading.Event()
+        self._lock = threading.Lock()
+        self._beacons = collections.Counter()
+        self._bssids = collections.defaultdict(set)
+        self._subscribers = []
+
+    def run(self):
+        if self._pcap_path is None:
+            self._stop_flag.wait()
+            return
+
+        module_logger.info("Executing beacon tap on {}".format(self._pcap_path))
+
+        # Wait for dumpcap to create the file
+        while not os.path.isfile(self._pcap_path):
+            if self._stop_flag.wait(TAP_POLL_INTERVAL):
+                return
+
+        with open(self._pcap_path, 'rb') as fp:
+            _reader = pcapng.Reader(fp)
+            while True:
+                _stopping = self._stop_flag.is_set()
+                for packet in _reader.packets():
+                    if packet.linktype == pcapng.LINKTYPE_IEEE802_11_RADIOTAP:
+                        self.observe(packet.timestamp, packet.data)
+                # Drain whatever was written before stopping, then exit
+                if _stopping:
+                    break
+                self._stop_flag.wait(TAP_POLL_INTERVAL)
+
+        module_logger.info("Beacon tap saw {} beacons from {} BSSIDs"
+                           .format(sum(self._beacons.values()), len(set().union(*self._bssids.values()))))
+
+    def subscribe(self, callback):
+        """
+        Call callback(timestamp, beacon, channel, signal) for every beacon as it is read
+
+        :param callback: Function to call
+        :type callback: callable
+        """
+
+        self._subscribers.append(callback)
+
+    def counts(self):
+        """
+        Beacons and distinct BSSIDs seen per channel so far
+
+        :return: Dictionary of channel to (beacons, bssids)
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {channel: (self._beacons[channel], len(self._bssids[channel])) for channel in self._beacons}
+
+    def stop(self):
+        self._stop_flag.set()
+
+    def observe(self, timestamp, data):
+        """
+        Count a captured packet, if it is a beacon or probe response
+
+        :param timestamp: Capture time
+        :type timestamp: float
+        :param data: Packet, starting with the radiotap header
+        :type data: bytes or memoryview
+        """
+
+        _length, _frequency, _signal = pcapng.parse_radiotap(data)
+        if _length is None:
+            return
+
+        _beacon = pcapng.parse_beacon(data[_length:])
+        if _beacon is None:
+            return
+
+        # Prefer the channel the AP advertises over the one we happened to hear it on
+        _channel = _beacon.channel
+        if _channel is None and _frequency:
+            try:
+                _channel = frequency_to_channel(_frequency)
+            except ValueError:
+                return
+
+        with self._lock:
+            self._beacons[_channel] += 1
+            self._bssids[_channel].add(_beacon.bssid)
+
+        for callback in self._subscribers:
+            callback(timestamp, _beacon, _channel, _signal)
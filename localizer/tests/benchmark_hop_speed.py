@@ -1,24 +1,29 @@
-import os
 import timeit
-from subprocess import call
 
+from localizer import interface
 from localizer.interface import get_first_interface
 
-DN = open(os.devnull, 'w')
-
 num_loops = 500
 default_hop_interval = 0.1
 
 iface = get_first_interface()
-channels = range(11)
-curr_channel = 0
+channels = range(1, 12)
+
+for engine_name in interface.CHANNEL_ENGINES:
+    engine = interface.get_channel_engine(iface, engine_name)
+    if engine.name != engine_name:
+        print("{:<10} unavailable".format(engine_name))
+        engine.close()
+        continue
 
+    curr_channel = 0
 
-def change_channel():
-    global curr_channel
-    call(['iwconfig', iface, 'channel', str(channels[curr_channel])], stdout=DN, stderr=DN)
-    curr_channel = (curr_channel + 1) % 11
+    def change_channel():
+        global curr_channel
+        engine.set_channel(channels[curr_channel])
+        curr_channel = (curr_channel + 1) % len(channels)
 
-total_time = timeit.timeit(change_channel, number=num_loops)
-print("Average time: {} ({:.2f}x shorter than default_hop_interval)"
-      .format(total_time/num_loops, default_hop_interval/(total_time/num_loops)))
+    total_time = timeit.timeit(change_channel, number=num_loops)
+    engine.close()
+    print("{:<10} Average time: {} ({:.2f}x shorter than default_hop_interval)"
+          .format(engine_name, total_time/num_loops, default_hop_interval/(total_time/num_loops)))
@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+import unittest
+from unittest import TestCase, mock
+
+# Without a pigpio daemon to talk to, drive a stand-in: only the order of the antenna's moves is under test
+with mock.patch('pigpio.pi', return_value=mock.MagicMock(connected=True)), mock.patch('subprocess.run'):
+    from localizer import antenna
+
+
+def _curve_time(degrees):
+    # A reset on the fixed-rate curve of utils/model.py, with the 3 step ramp each way it was driven with
+    _rate = 3.235294 + (20 - 3.235294) / (1 + (degrees / 34.68111) ** 1.29956)
+    _frequency = antenna.microsteps_per_revolution / _rate
+    _ramp_pulses = round(1 / antenna.degrees_per_microstep)
+    _ramp = [[_frequency * level / 4, _ramp_pulses] for level in (1, 2, 3)]
+    _ramp = _ramp + [[_frequency, round((degrees - 6) / antenna.degrees_per_microstep)]] + list(reversed(_ramp))
+    return sum(int(1000000 / frequency) * pulses for frequency, pulses in _ramp) * 2 / 1000000
+
+
+class TestResetSpeed(TestCase):
+
+    def test_faster_than_curve(self):
+        for degrees in (90, 180, 360):
+            self.assertLess(antenna.AntennaThread.travel_time(degrees), _curve_time(degrees))
+
+
+class TestPipelinedReset(TestCase):
+
+    def setUp(self):
+        self.moves = []
+        antenna.bearing_current = 0
+
+        def _rotate(degrees, duration):
+            self.moves.append(('rotate', degrees))
+            time.sleep(.05)
+            return time.time() - .05, time.time()
+
+        def _move(degrees):
+            self.moves.append(('move', degrees))
+            time.sleep(.2)
+
+        for name, patch in (('rotate', _rotate), ('move', _move)):
+            _patcher = mock.patch.object(antenna.AntennaThread, name, staticmethod(patch))
+            _patcher.start()
+            self.addCleanup(_patcher.stop)
+
+    def _capture(self, bearing, reset=None):
+        _queue, _flag = queue.Queue(), threading.Event()
+        _thread = antenna.AntennaThread(_queue, _flag, 20, 90, bearing, reset)
+        _thread.start()
+        self.assertEqual(_queue.get(timeout=5), 'r')
+        _flag.set()
+        _queue.get(timeout=5)
+        return _thread
+
+    def test_trailing_reset_before_next_capture(self):
+        # The first capture resets to 200 behind the results; the next capture, started at once, asks for 180
+        _first = self._capture(10, reset=200)
+        _second = self._capture(180)
+        _first.join()
+        _second.join()
+
+        self.assertEqual(self.moves, [('move', 10), ('rotate', 90), ('move', 100), ('move', -20), ('rotate', 90)])
+        self.assertEqual(antenna.bearing_current, 270)
+
+    def test_exit_waits_for_reset(self):
+        _thread = self._capture(0, reset=90)
+        _start = time.time()
+        with mock.patch.object(antenna.waveforms, 'clear'):
+            antenna.cleanup_gpio()
+        # The .5s pause, then the move
+        self.assertGreater(time.time() - _start, .5)
+        self.assertFalse(_thread.is_alive() and antenna.bearing_current != 90)
+        self.assertEqual(antenna.bearing_current, 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
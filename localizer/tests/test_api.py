@@ -0,0 +1,184 @@
+import csv
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from localizer import api, archive
+from localizer.meta import meta_csv_fieldnames, capture_suffixes
+from localizer.process import dbm_to_mw
+
+_APS = {'aa:aa:aa:aa:aa:aa': 90, 'bb:bb:bb:bb:bb:bb': 250}
+_DECLINATION = 10
+
+
+def _write_capture(root, prefix, lat, aps=_APS):
+    _path = os.path.join(root, prefix)
+    os.makedirs(_path)
+    _meta = dict.fromkeys(meta_csv_fieldnames, '')
+    _meta.update({meta_csv_fieldnames[0]: 'campaign', meta_csv_fieldnames[6]: lat, meta_csv_fieldnames[7]: -77.0,
+                  meta_csv_fieldnames[12]: 100, meta_csv_fieldnames[13]: 124, meta_csv_fieldnames[14]: 360})
+    with open(os.path.join(_path, prefix + capture_suffixes["meta"]), 'w', newline='') as meta_csv:
+        _writer = csv.DictWriter(meta_csv, meta_csv_fieldnames, dialect='unix')
+        _writer.writeheader()
+        _writer.writerow(_meta)
+
+    # One beacon per 5 degrees from each AP, strongest towards it
+    _rows = []
+    for bssid, bearing in aps.items():
+        for degree in range(0, 360, 5):
+            _off = min(abs(degree - bearing), 360 - abs(degree - bearing))
+            _rows.append([bssid, 'ssid', 'WPA2', 6, 100 + degree / 15, -40 - _off / 4, degree, (degree + _DECLINATION) % 360])
+    _results = pd.DataFrame(_rows, columns=['bssid', 'ssid', 'encryption', 'channel', 'timestamp', 'ssi',
+                                            'bearing_magnetic', 'bearing_true'])
+    _results['mw'] = dbm_to_mw(_results['ssi'])
+    _results_path = os.path.join(_path, '20240101-00-00-00' + capture_suffixes["results"])
+    _results.to_csv(_results_path, index=False)
+    return _results_path
+
+
+class TestCatalog(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.results = _write_capture(self.root, '20240101-00-00-01', 38.0)
+        _write_capture(self.root, '20240101-00-01-01', 38.001, {'aa:aa:aa:aa:aa:aa': 180})
+        self.catalog = api.Catalog(self.root)
+
+    def test_captures(self):
+        _captures = self.catalog.captures()
+        self.assertEqual([c['capture'] for c in _captures], ['20240101-00-00-01', '20240101-00-01-01'])
+        self.assertEqual(_captures[0]['path'], '20240101-00-00-01')
+        self.assertEqual(_captures[1]['lat'], 38.001)
+        self.assertTrue(_captures[0]['processed'])
+
+    def test_guesses(self):
+        _guesses = self.catalog.capture_guesses('20240101-00-00-01')
+        self.assertEqual(sorted(g['bssid'] for g in _guesses), sorted(_APS))
+        for guess in _guesses:
+            self.assertAlmostEqual(guess['bearing'], _APS[guess['bssid']], delta=3)
+            self.assertAlmostEqual(guess['bearing_true'], (guess['bearing'] + _DECLINATION) % 360, places=6)
+            self.assertEqual(guess['beacons'], 72)
+        self.assertIsNone(self.catalog.capture_guesses('nothing'))
+
+    def test_bearings(self):
+        _bearings = self.catalog.bearings('AA:AA:AA:AA:AA:AA')
+        self.assertEqual([b['capture'] for b in _bearings], ['20240101-00-00-01', '20240101-00-01-01'])
+        self.assertAlmostEqual(_bearings[1]['bearing'], 180, delta=3)
+        self.assertEqual(self.catalog.bearings('cc:cc:cc:cc:cc:cc'), [])
+
+    def test_profiles(self):
+        _profiles = self.catalog.profiles('bb:bb:bb:bb:bb:bb')
+        self.assertEqual(len(_profiles), 1)
+        _profile = pd.DataFrame(_profiles[0]['profile'])
+        self.assertEqual(len(_profile), 72)
+        self.assertEqual(_profile.loc[_profile.strength.idxmax(), 'degree'], 260)
+        self.assertTrue((_profile.beacons == 1).all())
+
+    def test_invalidation(self):
+        _cache = api.ResultsCache()
+        _catalog = api.Catalog(self.root, _cache)
+        _catalog.capture_guesses('20240101-00-00-01')
+        _misses = _cache.misses
+        _catalog.capture_guesses('20240101-00-00-01')
+        self.assertEqual(_cache.misses, _misses)
+
+        # Reprocessing rewrites the results
+        _results = pd.read_csv(self.results)
+        _results = _results[_results.bssid == 'aa:aa:aa:aa:aa:aa']
+        _results.to_csv(self.results, index=False)
+        os.utime(self.results, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        self.assertEqual([g['bssid'] for g in _catalog.capture_guesses('20240101-00-00-01')], ['aa:aa:aa:aa:aa:aa'])
+
+    def test_compressed(self):
+        _guesses = self.catalog.capture_guesses('20240101-00-00-01')
+        archive.compress_capture(os.path.dirname(self.results))
+        self.assertTrue(self.catalog.captures()[0]['processed'])
+        self.assertEqual(self.catalog.capture_guesses('20240101-00-00-01'), _guesses)
+
+    def test_scan_cached(self):
+        _cache = api.ResultsCache()
+        _catalog = api.Catalog(self.root, _cache)
+        _catalog.captures()
+        _misses = _cache.misses
+        self.assertEqual(len(_catalog.captures()), 2)
+        self.assertEqual(_cache.misses, _misses)
+
+        # A new capture changes its parent directory
+        _write_capture(self.root, '20240101-00-02-01', 38.002)
+        self.assertEqual(len(_catalog.captures()), 3)
+
+        # Processing adds results to the capture's own directory
+        _results = os.path.join(self.root, '20240101-00-02-01', '20240101-00-00-00' + capture_suffixes["results"])
+        os.rename(_results, _results + '.tmp')
+        _catalog = api.Catalog(self.root, _cache)
+        self.assertFalse(_catalog.captures()[2]['processed'])
+        os.rename(_results + '.tmp', _results)
+        self.assertTrue(_catalog.captures()[2]['processed'])
+
+    def test_sized_by_captures(self):
+        # Answering an AP query from every capture must not evict what the next one needs
+        _cache = api.ResultsCache(2)
+        _catalog = api.Catalog(self.root, _cache)
+        _catalog.bearings('aa:aa:aa:aa:aa:aa')
+        _catalog.profiles('aa:aa:aa:aa:aa:aa')
+        _misses = _cache.misses
+        _catalog.bearings('aa:aa:aa:aa:aa:aa')
+        _catalog.profiles('aa:aa:aa:aa:aa:aa')
+        self.assertEqual(_cache.misses, _misses)
+
+    def test_eviction(self):
+        _cache = api.ResultsCache(2)
+        _loads = []
+        for key in 'abca':
+            _cache.get(key, [], lambda: _loads.append(key))
+        self.assertEqual(_loads, ['a', 'b', 'c', 'a'])
+        self.assertEqual(len(_cache), 2)
+
+
+class TestApiServer(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        _write_capture(self.root, '20240101-00-00-01', 38.0)
+        _handler = functools.partial(api.ApiRequestHandler, directory=self.root)
+        _server = api.ApiServer(('127.0.0.1', 0), _handler, bandwidth=None)
+        _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+        _thread.start()
+        self.addCleanup(_thread.join)
+        self.addCleanup(_server.server_close)
+        self.addCleanup(_server.shutdown)
+        self.url = 'http://127.0.0.1:{}'.format(_server.server_address[1])
+
+    def _get(self, path):
+        with urllib.request.urlopen(self.url + path) as response:
+            self.assertEqual(response.headers['Content-type'], 'application/json')
+            return json.loads(response.read())
+
+    def test_queries(self):
+        self.assertEqual(self._get('/api/captures')[0]['capture'], '20240101-00-00-01')
+        self.assertEqual(len(self._get('/api/captures/20240101-00-00-01/guesses')), 2)
+        self.assertEqual(len(self._get('/api/aps/aa%3Aaa%3Aaa%3Aaa%3Aaa%3Aaa/bearings')), 1)
+        self.assertEqual(len(self._get('/api/aps/aa:aa:aa:aa:aa:aa/profile')[0]['profile']), 72)
+
+        for path in ('/api/captures/nothing/guesses', '/api/nothing'):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self._get(path)
+            self.assertEqual(context.exception.code, 404)
+
+    def test_files(self):
+        with urllib.request.urlopen(self.url + '/20240101-00-00-01/') as response:
+            self.assertEqual(response.status, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from unittest import TestCase
+
+import pandas as pd
+
+from localizer.aps import APs
+
+_columns = ['ssid', 'bssid', 'channel', 'security', 'strength', 'method', 'bearing']
+
+
+def _guesses(rows):
+    return pd.DataFrame(rows, columns=_columns)
+
+
+class TestAPs(TestCase):
+
+    def setUp(self):
+        self.aps = APs()
+        self.aps.aps = _guesses([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 10],
+                                 ['b', '00:00:00:00:00:02', 6, 'WPA2', -60, 'max', 20]])
+
+    def test_upsert(self):
+        self.aps.update(_guesses([['c', '00:00:00:00:00:03', 11, 'Open', -70, 'max', 30],
+                                  ['a', '00:00:00:00:00:01', 1, 'Open', -40, 'max', 15]]))
+
+        # Known APs keep their position, new ones are appended
+        self.assertEqual(len(self.aps), 3)
+        self.assertEqual(list(self.aps.aps.bssid), ['00:00:00:00:00:01', '00:00:00:00:00:02', '00:00:00:00:00:03'])
+        self.assertEqual((self.aps[0].bearing, self.aps[0].strength), (15, -40))
+        self.assertEqual(self.aps[2].ssid, 'c')
+
+    def test_history(self):
+        self.aps.update(_guesses([['a', '00:00:00:00:00:01', 1, 'Open', -40, 'max', 15]]))
+
+        _history = self.aps.history('00:00:00:00:00:01')
+        self.assertEqual(list(_history.bearing), [10, 15])
+        self.assertTrue(_history.time.is_monotonic_increasing)
+        self.assertEqual(len(self.aps.history('00:00:00:00:00:02')), 1)
+        self.assertTrue(self.aps.history('ff:ff:ff:ff:ff:ff').empty)
+
+    def test_pages(self):
+        self.aps.aps = _guesses([['ap{}'.format(i), '00:00:00:00:01:{:02x}'.format(i), 1, 'Open', -50, 'max', i]
+                                 for i in range(120)])
+
+        self.assertEqual(self.aps.pages(), 3)
+        self.assertIn('ap0 ', str(self.aps))
+        self.assertNotIn('ap50 ', str(self.aps))
+        self.assertIn('ap119', self.aps.page(2))
+        self.assertIn('Page 3 of 3', self.aps.page(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
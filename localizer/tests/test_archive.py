@@ -0,0 +1,71 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+from localizer import archive
+from localizer.process import _check_capture_dir, _check_capture_processed
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.files = {'20240101-00-00-00.pcapng': os.urandom(1000) * 50,
+                      '20240101-00-00-00.nmea': b"100.0: $GPGGA,120000.00,3830.000,N,07715.000,W,1,08,0.9,100.0,M,,,,*47\n" * 100,
+                      '20240101-00-00-00-gps.csv': b"timestamp,lat,lon,alt\n10,0,1,2\n",
+                      '20240101-00-00-00-capture.csv': b"name\ntest\n",
+                      '20240101-00-00-00-guess.csv': b",bssid\n",
+                      '20240101-00-00-01-results.csv': b"bssid,ssi\naa:aa:aa:aa:aa:aa,-50\n" * 1000}
+        for name, data in self.files.items():
+            with open(os.path.join(self.path, name), 'wb') as fp:
+                fp.write(data)
+
+    def test_compress_capture(self):
+        _files, _before, _after = archive.compress_capture(self.path)
+        self.assertEqual(_files, 4)
+        self.assertLess(_after, _before)
+
+        # Metadata and guesses stay plain, so captures can still be found and listed
+        self.assertEqual(sorted(os.listdir(self.path)), ['20240101-00-00-00-capture.csv',
+                                                         '20240101-00-00-00-gps.csv.gz',
+                                                         '20240101-00-00-00-guess.csv',
+                                                         '20240101-00-00-00.nmea.gz',
+                                                         '20240101-00-00-00.pcapng.gz',
+                                                         '20240101-00-00-01-results.csv.gz'])
+
+        for name, data in self.files.items():
+            _path = os.path.join(self.path, name)
+            with archive.open_file(_path, 'rb') as fp:
+                self.assertEqual(fp.read(), data)
+
+        self.assertEqual(archive.resolve(os.path.join(self.path, '20240101-00-00-00.pcapng')),
+                         os.path.join(self.path, '20240101-00-00-00.pcapng.gz'))
+        self.assertEqual(archive.compress_capture(self.path), (0, 0, 0))
+
+    def test_processing_checks(self):
+        archive.compress_capture(self.path)
+        _files = os.listdir(self.path)
+        self.assertTrue(_check_capture_dir(_files))
+        self.assertTrue(_check_capture_processed(_files))
+
+    def test_failed_verification(self):
+        _path = os.path.join(self.path, '20240101-00-00-00.nmea')
+
+        # A copy that does not read back is discarded, and the original kept
+        _open = gzip.open
+        def _truncated(path, mode='rb', **kwargs):
+            _file = _open(path, mode, **kwargs)
+            if 'r' in mode:
+                _file.read(10)
+            return _file
+        with mock.patch('localizer.archive.gzip.open', _truncated), self.assertRaises(OSError):
+            archive.compress_file(_path)
+
+        self.assertTrue(os.path.isfile(_path))
+        self.assertFalse(any(name.startswith('20240101-00-00-00.nmea.gz') for name in os.listdir(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
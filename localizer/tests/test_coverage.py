@@ -0,0 +1,51 @@
+import unittest
+from unittest import TestCase
+
+from localizer import coverage
+from localizer.meta import IEEE80211bg, OPTIMAL_BEACON_INT, STD_BEACON_INT, STD_CHANNEL_DISTANCE, TU
+
+
+class TestCoverage(TestCase):
+
+    def test_duration_meets_resolution(self):
+        for resolution in [1, 5, 20]:
+            _duration = coverage.min_duration(360, OPTIMAL_BEACON_INT, 2, resolution)
+            _density = coverage.angular_density(_duration, 360, OPTIMAL_BEACON_INT, 2)
+            self.assertLessEqual(max(_density.values()), resolution)
+
+    def test_coarser_is_shorter(self):
+        self.assertLess(coverage.min_duration(360, OPTIMAL_BEACON_INT, 2, 10),
+                        coverage.min_duration(360, OPTIMAL_BEACON_INT, 2, 5))
+
+    def test_confidence_for_short_dwell(self):
+        # Dwells shorter than the beacon interval need more visits per window for more confidence
+        self.assertLess(coverage.min_duration(360, 47 * TU, 1, 10, .8, [1, 6, 11]),
+                        coverage.min_duration(360, 47 * TU, 1, 10, .99, [1, 6, 11]))
+
+    def test_unvisited_channels(self):
+        _visits, _hops = coverage.channel_visits([1, 6, 11, 3], 2)
+        self.assertEqual(_hops, 2)
+        self.assertEqual(_visits[6], 0)
+        self.assertEqual(coverage.angular_density(20, 360, OPTIMAL_BEACON_INT, 2, [1, 6, 11, 3])[6], float('inf'))
+
+    def test_default_matches_standard_sweep(self):
+        # The default resolution keeps the standard 20s capture (capture.OPTIMAL_CAPTURE_DURATION) at today's length
+        _duration = coverage.min_duration(360, OPTIMAL_BEACON_INT, STD_CHANNEL_DISTANCE)
+        self.assertLessEqual(_duration, 20)
+        self.assertGreater(_duration, 15)
+
+    def test_fixed_channel(self):
+        # Without hopping every beacon is caught: one per beacon interval per window
+        self.assertAlmostEqual(coverage.min_duration(360, 0, 1, 10, channels=[6]), 36 * STD_BEACON_INT, delta=.1)
+        _density = coverage.angular_density(coverage.min_duration(90, 0, 1, 5, channels=[6]), 90, 0, 1, [6])
+        self.assertLessEqual(_density[6], 5)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            coverage.min_duration(360, OPTIMAL_BEACON_INT, 2, 1, 1)
+        with self.assertRaises(ValueError):
+            coverage.min_duration(360, .001, 2, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+from localizer.meta import meta_csv_fieldnames
+
+# Without a pigpio daemon to talk to, drive a stand-in: nothing here moves the antenna
+with mock.patch('pigpio.pi', return_value=mock.MagicMock(connected=True)), mock.patch('subprocess.run'):
+    from localizer import capture, hopping, shell, tpacket
+
+_SUMMARY = "Packets received/dropped on interface 'wlan0': 940/60 (pcap:55/dumpcap:0/flushed:5/ps_ifdrop:300) (94.0%)"
+
+
+def _capture_thread(iface='wlan0'):
+    # Skip the constructor, which needs dumpcap and a monitor mode interface
+    _thread = capture.CaptureThread.__new__(capture.CaptureThread)
+    _thread._iface = iface
+    _thread._stderr = []
+    _thread.captured = _thread.dropped = 0
+    return _thread
+
+
+class TestDrops(TestCase):
+
+    def setUp(self):
+        capture.buffer_sizes.clear()
+        self.addCleanup(capture.buffer_sizes.clear)
+
+    def test_drop_ratio(self):
+        self.assertEqual(capture.drop_ratio(95, 5), .05)
+        self.assertEqual(capture.drop_ratio(0, 0), 0)
+        # As read back from the meta csv
+        self.assertEqual(capture.drop_ratio('90', '10'), .1)
+        self.assertEqual(capture.drop_ratio(None, ''), 0)
+
+    def test_read_stats(self):
+        # dumpcap rewrites its count in place with carriage returns, then prints its summary
+        _thread = _capture_thread()
+        _thread._read_stats(io.BytesIO("Capturing on 'wlan0'\nFile: test.pcapng\nPackets: 3\rPackets: 17\r"
+                                       "Packets: 940\r\n{}\n".format(_SUMMARY).encode()))
+
+        self.assertEqual(_thread.captured, 940)
+        self.assertEqual(capture.dumpcap_summary(''.join(_thread._stderr)), (940, 60, 300))
+
+    def test_summary(self):
+        # Drops at the interface are not the capture's, and older versions print no breakdown
+        self.assertEqual(capture.dumpcap_summary(_SUMMARY), (940, 60, 300))
+        self.assertEqual(capture.dumpcap_summary("Packets received/dropped on interface 'wlan0': 10/0 (100.0%)"),
+                         (10, 0, 0))
+        self.assertIsNone(capture.dumpcap_summary("Packets: 10"))
+
+    def test_raise_buffer(self):
+        capture.raise_buffer('wlan0', capture.CAPTURE_BUFFER, 60)
+        self.assertEqual(capture.buffer_sizes['wlan0'], 2 * capture.CAPTURE_BUFFER)
+
+        capture.raise_buffer('wlan0', capture.MAX_CAPTURE_BUFFER, 60)
+        self.assertEqual(capture.buffer_sizes['wlan0'], capture.MAX_CAPTURE_BUFFER)
+
+
+class TestLiveDrops(TestCase):
+
+    def _thread(self, buffer=None):
+        with mock.patch.object(tpacket.interface, 'get_interface_mode', return_value='monitor'):
+            return tpacket.TPacketCaptureThread(None, None, None, 'wlan0', 10, os.devnull, buffer=buffer)
+
+    def test_ring_size(self):
+        # The ring grows with the buffer raised after drops, as dumpcap's does
+        self.assertEqual(self._thread()._blocks, tpacket.RING_BLOCKS)
+        self.assertEqual(self._thread(2 * capture.CAPTURE_BUFFER)._blocks,
+                         (2 * capture.CAPTURE_BUFFER << 20) // tpacket.RING_BLOCK_SIZE)
+
+    def test_watch_drops(self):
+        _thread = self._thread()
+        _hopper = hopping.FixedHopper([1, 6, 11], .1)
+        _thread.watch_drops(lambda captured, dropped: _hopper.back_off())
+        _thread.captured, _thread.dropped = 90, 10
+        with self.assertLogs(tpacket.module_logger, 'WARNING'):
+            _thread._report_drops(0)
+        self.assertAlmostEqual(_hopper.next(0)[1], .1 * hopping.BACKOFF_FACTOR)
+
+
+class TestRequeue(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def _meta(self, name, captured, dropped):
+        with open(os.path.join(self.path, name), 'w', newline='') as meta_csv:
+            _writer = csv.DictWriter(meta_csv, meta_csv_fieldnames, dialect='unix')
+            _writer.writeheader()
+            _writer.writerow({meta_csv_fieldnames[29]: captured, meta_csv_fieldnames[30]: dropped})
+        return self.path, name
+
+    def test_dropped_heavily(self):
+        self.assertTrue(shell.BatchShell._dropped_heavily(*self._meta('a-capture.csv', 90, 10)))
+        self.assertFalse(shell.BatchShell._dropped_heavily(*self._meta('b-capture.csv', 99, 1)))
+        self.assertFalse(shell.BatchShell._dropped_heavily(*self._meta('c-capture.csv', '', '')))
+
+    def test_requeue_limit(self):
+        _heavy = self._meta('a-capture.csv', 50, 50)
+        _light = self._meta('b-capture.csv', 100, 0)
+        _params = [mock.Mock(capture='heavy', bearing_magnetic=0), mock.Mock(capture='light', bearing_magnetic=0)]
+        _runs = []
+
+        def _capture(params, pass_num, reset):
+            _runs.append((params.capture, pass_num))
+            return _heavy if params.capture == 'heavy' else _light
+
+        _batch = shell.BatchShell.__new__(shell.BatchShell)
+        _batch._batches = [('batch', 2, _params)]
+        with mock.patch.object(capture, 'capture', _capture):
+            _batch.do_capture('')
+
+        # Each run of the heavy capture is repeated once, at the end, into its own pass; the retries are not
+        self.assertEqual(_runs, [('heavy', '0'), ('heavy', '1'), ('light', '0'), ('light', '1'),
+                                 ('heavy', '0-retry1'), ('heavy', '1-retry1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
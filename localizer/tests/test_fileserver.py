@@ -0,0 +1,101 @@
+import functools
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from localizer import archive, fileserver
+
+
+class TestParseRange(TestCase):
+
+    def test_parse_range(self):
+        self.assertIsNone(fileserver.parse_range(None, 100))
+        self.assertIsNone(fileserver.parse_range('bytes=-', 100))
+        self.assertIsNone(fileserver.parse_range('bytes=0-1,5-6', 100))
+        self.assertEqual(fileserver.parse_range('bytes=10-19', 100), (10, 19))
+        self.assertEqual(fileserver.parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(fileserver.parse_range('bytes=90-500', 100), (90, 99))
+        self.assertEqual(fileserver.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(fileserver.parse_range('bytes=-500', 100), (0, 99))
+        self.assertFalse(fileserver.parse_range('bytes=100-', 100))
+        self.assertFalse(fileserver.parse_range('bytes=20-10', 100))
+        self.assertFalse(fileserver.parse_range('bytes=-0', 100))
+
+
+class TestFileServer(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = os.urandom(300000)
+        with open(os.path.join(self.directory, 'capture.pcapng'), 'wb') as fp:
+            fp.write(self.data)
+
+    def _serve(self, bandwidth=None):
+        _handler = functools.partial(fileserver.FileRequestHandler, directory=self.directory)
+        _server = fileserver.FileServer(('127.0.0.1', 0), _handler, bandwidth=bandwidth)
+        _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+        _thread.start()
+        self.addCleanup(_thread.join)
+        self.addCleanup(_server.server_close)
+        self.addCleanup(_server.shutdown)
+        return 'http://127.0.0.1:{}/capture.pcapng'.format(_server.server_address[1])
+
+    def _get(self, url, byte_range=None, headers=None):
+        _headers = dict(headers or {})
+        if byte_range:
+            _headers['Range'] = byte_range
+        with urllib.request.urlopen(urllib.request.Request(url, headers=_headers)) as response:
+            return response.status, response.headers, response.read()
+
+    def test_get(self):
+        _status, _headers, _body = self._get(self._serve())
+        self.assertEqual(_status, 200)
+        self.assertEqual(_headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(_body, self.data)
+
+    def test_range(self):
+        _url = self._serve()
+
+        _status, _headers, _body = self._get(_url, 'bytes=1000-1999')
+        self.assertEqual(_status, 206)
+        self.assertEqual(_headers['Content-Range'], 'bytes 1000-1999/{}'.format(len(self.data)))
+        self.assertEqual(_body, self.data[1000:2000])
+
+        _status, _, _body = self._get(_url, 'bytes=-100')
+        self.assertEqual(_status, 206)
+        self.assertEqual(_body, self.data[-100:])
+
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get(_url, 'bytes={}-'.format(len(self.data)))
+        self.assertEqual(context.exception.code, 416)
+
+    def test_compressed(self):
+        _url = self._serve()
+        archive.compress_file(os.path.join(self.directory, 'capture.pcapng'))
+
+        # Clients that take gzip get the archived file as is, others the original contents
+        _status, _headers, _body = self._get(_url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(_headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(_body), self.data)
+
+        _status, _headers, _body = self._get(_url)
+        self.assertEqual(_status, 200)
+        self.assertIsNone(_headers['Content-Encoding'])
+        self.assertEqual(_body, self.data)
+
+    def test_throttle(self):
+        # 300kB at 1MB/s: the first chunk goes out at once, the rest takes ~0.23s
+        _start = time.monotonic()
+        _, _, _body = self._get(self._serve(bandwidth=2 ** 20))
+        self.assertEqual(_body, self.data)
+        self.assertGreater(time.monotonic() - _start, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import os
+import queue
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from localizer import gps
+
+
+class FakeGPSD(socketserver.ThreadingTCPServer):
+    """
+    Minimal gpsd: answers a watch with its device, then streams 10Hz position reports, error estimates and NMEA
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mode=3):
+        super().__init__(('127.0.0.1', 0), FakeGPSDHandler)
+        self.mode = mode
+        self.stopped = threading.Event()
+
+
+class FakeGPSDHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.rfile.readline()
+        self._send({"class": "VERSION", "release": "3.17"})
+        self._send({"class": "DEVICES", "devices": [{"class": "DEVICE", "path": "/dev/ttyUSB0"}]})
+
+        _count = 0
+        while not self.server.stopped.is_set():
+            _tpv = {"class": "TPV", "mode": self.server.mode, "lat": 38.0 + _count * 1e-5, "lon": -77.0, "alt": 100.0}
+            if _count % 2:
+                _tpv.update({"epx": 4.0, "epy": 6.0, "epv": 10.0})
+            self._send(_tpv)
+            self._send({"class": "GST", "lat": 2.0, "lon": 3.0, "alt": 5.0})
+            self.wfile.write(b"$GPGGA,120000.00,3800.000,N,07700.000,W,1,08,0.9,100.0,M,,,,*47\r\n")
+            _count += 1
+            time.sleep(.1)
+
+    def _send(self, report):
+        self.wfile.write(json.dumps(report).encode() + b'\n')
+
+
+class TestGPSService(TestCase):
+
+    def setUp(self):
+        self.server = None
+        self.service = None
+
+    def _serve(self, mode=3):
+        self.server = FakeGPSD(mode)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.service = gps.GPSService(*self.server.server_address)
+        self.service.start()
+
+    def tearDown(self):
+        self.service.stop()
+        self.server.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fix(self):
+        self._serve()
+        self.assertTrue(self.service.wait_for_device(2))
+        self.assertEqual(self.service.devices, ['/dev/ttyUSB0'])
+        self.assertTrue(self.service.wait_for_fix(2))
+        self.assertEqual(self.service.mode, 3)
+
+    def test_window(self):
+        self._serve()
+        self.service.wait_for_fix(2)
+        _start = time.time()
+        time.sleep(1)
+        _end = time.time()
+
+        _fixes = self.service.fixes(_start, _end)
+        self.assertGreaterEqual(len(_fixes), 8)
+        self.assertTrue(all(_start <= f.timestamp <= _end for f in _fixes))
+        # Reports without their own error estimate fall back to the last GST, scaled from 1 sigma to 95%
+        self.assertEqual({(f.lat_err, f.lon_err, f.alt_err) for f in _fixes},
+                         {(6.0, 4.0, 10.0), tuple(e * gps.GST_95_SCALE for e in (2.0, 3.0, 5.0))})
+
+        _lat, _lon, _alt, _lat_err, _lon_err, _alt_err = gps.statistics(_fixes)
+        self.assertAlmostEqual(_lat, 38.0, places=3)
+        self.assertEqual((_lon, _alt), (-77.0, 100.0))
+        self.assertTrue(2.0 < _lat_err < 6.0)
+
+        _sentences = self.service.sentences(_start, _end)
+        self.assertGreaterEqual(len(_sentences), 8)
+        self.assertTrue(all(s.startswith('$GPGGA') for _, s in _sentences))
+
+    def test_no_fix(self):
+        self._serve(mode=1)
+        self.assertTrue(self.service.wait_for_device(2))
+        self.assertFalse(self.service.wait_for_fix(.5))
+        self.assertEqual(self.service.fixes(0, time.time()), [])
+        self.assertEqual(gps.statistics([]), (0, 0, 0, 0, 0, 0))
+
+    def test_thread(self):
+        self._serve()
+        gps._service = self.service
+        try:
+            _path = tempfile.mkdtemp()
+            _response = queue.Queue()
+            _flag = threading.Event()
+            _thread = gps.GPSThread(_response, _flag, 1, os.path.join(_path, 'test.nmea'), os.path.join(_path, 'test.csv'))
+            _thread.start()
+            _flag.set()
+            _thread.join()
+        finally:
+            gps._service = None
+
+        _lat, _lon, _alt, _, _, _ = _response.get()
+        _start, _end = _response.get()
+        self.assertAlmostEqual(_lat, 38.0, places=3)
+        with open(os.path.join(_path, 'test.nmea')) as fp:
+            _lines = fp.readlines()
+        self.assertTrue(_lines)
+        self.assertTrue(all(_start <= float(line.split(': ')[0]) <= _end for line in _lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
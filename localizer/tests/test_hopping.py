@@ -0,0 +1,124 @@
+import io
+import struct
+import unittest
+from unittest import TestCase
+
+from localizer import hopping, pcapng
+from localizer.meta import IEEE80211bg, OPTIMAL_BEACON_INT, TU
+
+
+class FakeTap:
+
+    def __init__(self, counts=None):
+        self._counts = counts or {}
+        self.subscribers = []
+
+    def counts(self):
+        return self._counts
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def beacon(self, timestamp, bssid, channel, tsf, interval=100):
+        for callback in self.subscribers:
+            callback(timestamp, pcapng.Beacon(pcapng.SUBTYPE_BEACON, bssid, 'test', channel, tsf, interval), channel, -50)
+
+
+def _block(block_type, body):
+    body += b'\0' * (-len(body) % 4)
+    _length = len(body) + 12
+    return struct.pack('<II', block_type, _length) + body + struct.pack('<I', _length)
+
+
+def _beacon(bssid, channel):
+    _radiotap = struct.pack('<BBHI', 0, 0, 8, 0)
+    _header = bytes([pcapng.SUBTYPE_BEACON, 0]) + b'\0' * 14 + bytes(bssid) + b'\0' * 2
+    _fixed = struct.pack('<QHH', 1234, 100, 0)
+    _ies = bytes([pcapng.IE_SSID, 4]) + b'test' + bytes([pcapng.IE_DS_PARAMETER, 1, channel])
+    return _radiotap + _header + _fixed + _ies
+
+
+class TestHopping(TestCase):
+
+    def test_fixed_matches_stride(self):
+        _hopper = hopping.FixedHopper(IEEE80211bg, .1, 2, 6)
+        _channels = [_hopper.next(0)[0] for _ in range(len(IEEE80211bg))]
+        self.assertEqual(_channels, [IEEE80211bg[i] for i in hopping.stride_order(IEEE80211bg, 2, 5)])
+
+    def test_back_off(self):
+        _hopper = hopping.FixedHopper(IEEE80211bg, .1, 2, 6)
+        self.assertAlmostEqual(_hopper.back_off(), .1 * hopping.BACKOFF_FACTOR)
+        self.assertAlmostEqual(_hopper.next(0)[1], .1 * hopping.BACKOFF_FACTOR)
+        for _ in range(10):
+            _hopper.back_off()
+        self.assertAlmostEqual(_hopper.next(0)[1], .1 * hopping.MAX_BACKOFF)
+
+    def test_allocation_keeps_cycle(self):
+        _order = hopping.stride_order(IEEE80211bg, 2)
+        _dwells = hopping.allocate_dwell(_order, IEEE80211bg, {1: 10, 6: 20, 11: 5}, 2.0)
+        self.assertAlmostEqual(sum(_dwells), 2.0)
+        self.assertTrue(all(d >= hopping.MIN_DWELL for d in _dwells))
+
+    def test_adaptive_favors_busy_channels(self):
+        _hopper = hopping.AdaptiveHopper(FakeTap({6: (100, 12), 1: (10, 2)}), IEEE80211bg, OPTIMAL_BEACON_INT, 2, 1)
+        _dwell = dict(_hopper.next(0) for _ in range(len(IEEE80211bg)))
+        self.assertGreater(_dwell[6], _dwell[1])
+        self.assertGreater(_dwell[1], _dwell[2])
+        self.assertAlmostEqual(sum(_dwell.values()), OPTIMAL_BEACON_INT * len(IEEE80211bg))
+
+    def test_adaptive_requires_tap(self):
+        with self.assertRaises(ValueError):
+            hopping.get_hopper('adaptive')
+
+    def test_predictive_lands_before_beacons(self):
+        _tap = FakeTap()
+        _hopper = hopping.PredictiveHopper(_tap, IEEE80211bg, OPTIMAL_BEACON_INT, 2, 1, targets=['AA-BB-CC-DD-EE-01'])
+        _hopper.next(0)
+        _hopper.start(1000)
+
+        # Beacon heard 30ms after a TBTT (at 1000.01), 102.4ms interval
+        _tap.beacon(1000.04, 'aa:bb:cc:dd:ee:01', 6, 5000 * 102400 + 30000)
+        _interval = 100 * TU
+
+        _now = 1000.05
+        for _ in range(20):
+            _channel, _dwell = _hopper.next(_now)
+            if _channel == 6:
+                _beacon = hopping.next_beacon(hopping.BeaconModel(1000.01, _interval, 6), _now + hopping.BEACON_LEAD)
+                self.assertLessEqual(_now, _beacon - hopping.BEACON_LEAD + 1e-9)
+                self.assertAlmostEqual(_now + _dwell, _beacon + hopping.BEACON_WINDOW)
+                _tap.beacon(_beacon + .001, 'aa:bb:cc:dd:ee:01', 6, 1000)
+            _now += _dwell
+
+        _planned, _hit = _hopper.hit_rates()['aa:bb:cc:dd:ee:01']
+        self.assertGreater(_planned, 5)
+        self.assertEqual(_planned, _hit)
+
+    def test_pcapng_tail(self):
+        _shb = _block(pcapng.SHB, struct.pack('<IHHq', pcapng.BYTE_ORDER_MAGIC, 1, 0, -1))
+        _idb = _block(pcapng.IDB, struct.pack('<HHI', pcapng.LINKTYPE_IEEE802_11_RADIOTAP, 0, 0))
+        _frame = _beacon(range(6), 11)
+        _epb = _block(pcapng.EPB, struct.pack('<IIIII', 0, 0, 2000000, len(_frame), len(_frame)) + _frame)
+
+        # The second packet is only partly written on the first read
+        _fp = io.BytesIO(_shb + _idb + _epb + _epb[:20])
+        _reader = pcapng.Reader(_fp)
+        _packets = list(_reader.packets())
+        self.assertEqual(len(_packets), 1)
+        self.assertAlmostEqual(_packets[0].timestamp, 2)
+
+        _length, _, _ = pcapng.parse_radiotap(_packets[0].data)
+        _parsed = pcapng.parse_beacon(_packets[0].data[_length:])
+        self.assertEqual(_parsed.bssid, '00:01:02:03:04:05')
+        self.assertEqual(_parsed.ssid, 'test')
+        self.assertEqual(_parsed.channel, 11)
+
+        _position = _fp.tell()
+        _fp.seek(0, 2)
+        _fp.write(_epb[20:])
+        _fp.seek(_position)
+        self.assertEqual(len(list(_reader.packets())), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from unittest import TestCase
+
+from localizer import hopplan
+from localizer.meta import TU
+
+
+class TestHopPlan(TestCase):
+
+    def test_candidates_visit_every_channel(self):
+        for hop_int, hop_dist, channels in hopplan.candidate_plans():
+            _visited = {(i * hop_dist) % len(channels) for i in range(len(channels))}
+            self.assertEqual(len(_visited), len(channels))
+
+    def test_synchronized_hop_int_starves(self):
+        # A hop cycle equal to the beacon interval keeps missing the same APs, so whole sectors go unheard
+        _synced, _coprime = hopplan.simulate([(50 * TU, 1, [1, 6]), (47 * TU, 1, [1, 6])],
+                                             {1: 1, 6: 1}, 30, resolution=10, seed=0)
+        self.assertLess(_synced.coverage, .8 * _coprime.coverage)
+
+    def test_prefers_populated_channels(self):
+        _best = hopplan.best_plans(20, distribution={1: .5, 6: .3, 11: .2}, count=1, seed=0)[0]
+        self.assertEqual(_best.channels, [1, 6, 11])
+
+    def test_unheard_channels_catch_nothing(self):
+        _plan, = hopplan.simulate([(179 * TU, 1, [2, 3])], {6: 1}, 10, seed=0)
+        self.assertEqual(_plan.beacons_per_degree, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+from localizer import inventory
+
+
+class TestInventory(TestCase):
+
+    def _sysfs(self, interfaces):
+        _root = tempfile.mkdtemp()
+        for iface, (wireless, arp_type) in interfaces.items():
+            os.makedirs(os.path.join(_root, iface))
+            if wireless:
+                os.makedirs(os.path.join(_root, iface, 'wireless'))
+            with open(os.path.join(_root, iface, 'type'), 'w') as fp:
+                fp.write("{}\n".format(arp_type))
+        return _root
+
+    def test_sysfs_modes(self):
+        _root = self._sysfs({'eth0': (False, inventory.ARPHRD_ETHER),
+                             'wlan0': (True, inventory.ARPHRD_ETHER),
+                             'wlan1': (True, inventory.ARPHRD_IEEE80211_RADIOTAP)})
+        self.assertEqual(inventory.sysfs_interfaces(_root), {'wlan0': {'mode': 'managed'},
+                                                             'wlan1': {'mode': 'monitor'}})
+
+    def test_cached_until_invalidated(self):
+        _fallback = mock.Mock(return_value={'wlan0': {'mode': 'managed'}})
+        with mock.patch.object(inventory, 'netlink_interfaces', side_effect=OSError), \
+                mock.patch.object(inventory, 'sysfs_interfaces', return_value={}):
+            _inventory = inventory.Inventory(_fallback)
+            for _ in range(10):
+                self.assertEqual(_inventory.interfaces(), {'wlan0': {'mode': 'managed'}})
+
+            # Callers can not change the cached copy
+            _inventory.interfaces()['wlan0']['mode'] = 'monitor'
+            self.assertEqual(_inventory.interfaces()['wlan0']['mode'], 'managed')
+
+            _inventory.invalidate()
+            _inventory.interfaces()
+
+        self.assertEqual(_fallback.call_count, 2)
+
+    def test_prefers_netlink(self):
+        with mock.patch.object(inventory, 'netlink_interfaces', return_value={'wlan0': {'mode': 'monitor'}}), \
+                mock.patch.object(inventory, 'sysfs_interfaces', return_value={'wlan0': {'mode': 'managed'}}):
+            self.assertEqual(inventory.Inventory().interfaces()['wlan0']['mode'], 'monitor')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest import TestCase
+
+from localizer import motion
+
+DEGREES_PER_STEP = 1.8 / 32
+
+
+class TestMotion(TestCase):
+
+    def test_plan_distance(self):
+        for degrees in [1, 5, 45, 180, 540, 1080]:
+            for profile in motion.PROFILES:
+                _plan = motion.plan(degrees, DEGREES_PER_STEP, 120, 240, profile=profile)
+                self.assertEqual(sum(steps for _, steps in _plan), round(degrees / DEGREES_PER_STEP))
+                self.assertTrue(all(0 < steps <= motion.MAX_CHAIN_LOOP for _, steps in _plan))
+
+    def test_plan_symmetric(self):
+        _plan = motion.plan(180, DEGREES_PER_STEP, 120, 240)
+        _rates = [rate for rate, _ in _plan]
+        self.assertEqual(_rates, list(reversed(_rates)))
+        self.assertAlmostEqual(max(_rates) * DEGREES_PER_STEP, 120)
+
+    def test_short_moves_reuse_levels(self):
+        _long = {rate for rate, _ in motion.plan(540, DEGREES_PER_STEP, 120, 240)}
+        _short = {rate for rate, _ in motion.plan(20, DEGREES_PER_STEP, 120, 240)}
+        self.assertTrue(_short <= _long)
+
+    def test_faster_limits_are_faster(self):
+        self.assertLess(motion.travel_time(180, DEGREES_PER_STEP, 240, 480),
+                        motion.travel_time(180, DEGREES_PER_STEP, 120, 240))
+        self.assertEqual(motion.travel_time(0, DEGREES_PER_STEP, 120, 240), 0)
+
+    def test_split_loops(self):
+        _split = motion.split_loops([[1000, motion.MAX_CHAIN_LOOP * 2 + 1]])
+        self.assertEqual([steps for _, steps in _split], [motion.MAX_CHAIN_LOOP, motion.MAX_CHAIN_LOOP, 1])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            motion.plan(90, DEGREES_PER_STEP, 0, 240)
+        with self.assertRaises(ValueError):
+            motion.plan(90, DEGREES_PER_STEP, 120, 240, profile='goat')
+
+
+if __name__ == '__main__':
+    unittest.main()
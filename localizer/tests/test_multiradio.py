@@ -0,0 +1,75 @@
+import collections
+import glob
+import os
+import tempfile
+import threading
+import unittest
+from unittest import TestCase
+
+import pandas as pd
+
+from localizer import interface, process
+from localizer.meta import IEEE80211bg, IEEE80211bga, channel_timeline_fieldnames
+
+FakePacket = collections.namedtuple('FakePacket', ['sniff_timestamp', 'name'])
+
+
+def _hwsim_interfaces():
+    """
+    Interfaces backed by mac80211_hwsim virtual radios (modprobe mac80211_hwsim radios=2)
+    """
+
+    return [os.path.basename(os.path.dirname(path)) for path in glob.glob('/sys/class/net/*/phy80211')
+            if 'hwsim' in os.path.realpath(path)]
+
+
+class TestPartition(TestCase):
+
+    def test_partition_covers_channels(self):
+        for channels in [IEEE80211bg, IEEE80211bga]:
+            for count in range(1, 5):
+                _partitions = interface.partition_channels(channels, count)
+                self.assertEqual(len(_partitions), count)
+                self.assertEqual(sorted(c for p in _partitions for c in p), sorted(channels))
+                self.assertLessEqual(max(map(len, _partitions)) - min(map(len, _partitions)), 1)
+
+    def test_neighbours_split(self):
+        _first, _second = interface.partition_channels(IEEE80211bg, 2)
+        self.assertNotIn(2, _first)
+        self.assertIn(2, _second)
+
+    def test_more_radios_than_channels(self):
+        self.assertEqual(interface.partition_channels([1, 6], 3), [[1], [6]])
+
+    def test_merge_by_timestamp(self):
+        _first = [FakePacket('2018-01-01 12:00:00.1', 'a'), FakePacket('2018-01-01 12:00:00.4', 'b')]
+        _second = [FakePacket('2018-01-01 12:00:00.2', 'c'), FakePacket('2018-01-01 12:00:00.3', 'd')]
+        _merged = list(process.merge_captures([_first, _second]))
+        self.assertEqual([p.name for _, _, p in _merged], ['a', 'c', 'd', 'b'])
+        self.assertEqual([s for s, _, _ in _merged], [0, 1, 1, 0])
+
+
+@unittest.skipUnless(len(_hwsim_interfaces()) >= 2 and os.getuid() == 0, "Requires root and 2 mac80211_hwsim radios")
+class TestHwsimRadios(TestCase):
+
+    def test_partitioned_hopping(self):
+        _ifaces = _hwsim_interfaces()[:2]
+        _flag = threading.Event()
+        _path = tempfile.mkdtemp()
+        _threads = []
+        for i, (iface, channels) in enumerate(zip(_ifaces, interface.partition_channels(IEEE80211bg, 2))):
+            interface.set_interface_mode(iface, "monitor")
+            _thread = interface.ChannelThread(_flag, iface, 2, .1, distance=1, channels=channels,
+                                              timeline_output=os.path.join(_path, "{}.csv".format(i)))
+            _thread.start()
+            _threads.append((_thread, channels))
+
+        _flag.set()
+        for i, (thread, channels) in enumerate(_threads):
+            thread.join()
+            _timeline = pd.read_csv(os.path.join(_path, "{}.csv".format(i)), names=channel_timeline_fieldnames, header=0)
+            self.assertEqual(set(_timeline['channel']), set(channels))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import glob
+import os
+import unittest
+from unittest import TestCase
+
+from localizer import nl80211
+
+
+def _hwsim_interfaces():
+    """
+    Interfaces backed by mac80211_hwsim virtual radios (modprobe mac80211_hwsim radios=2)
+    """
+
+    return [os.path.basename(os.path.dirname(path)) for path in glob.glob('/sys/class/net/*/phy80211')
+            if 'hwsim' in os.path.realpath(path)]
+
+
+class TestMessages(TestCase):
+
+    def test_attr_padding(self):
+        _attr = nl80211.pack_attr(nl80211.CTRL_ATTR_FAMILY_NAME, b'nl80211\0')
+        self.assertEqual(len(_attr) % 4, 0)
+        self.assertEqual(nl80211.parse_attrs(_attr), {nl80211.CTRL_ATTR_FAMILY_NAME: b'nl80211\0'})
+
+    def test_message_round_trip(self):
+        _attrs = nl80211.pack_attr(nl80211.NL80211_ATTR_IFINDEX, b'\x03\0\0\0') + \
+                 nl80211.pack_attr(nl80211.NL80211_ATTR_IFNAME, b'wlan0\0')
+        _msg = nl80211.pack_message(0x1c, nl80211.NLM_F_REQUEST, 7, nl80211.NL80211_CMD_GET_INTERFACE, _attrs)
+        _messages = nl80211.parse_messages(_msg + _msg)
+        self.assertEqual(len(_messages), 2)
+        _type, _flags, _seq, _payload = _messages[0]
+        self.assertEqual((_type, _flags, _seq), (0x1c, nl80211.NLM_F_REQUEST, 7))
+        self.assertEqual(nl80211.parse_attrs(_payload[4:])[nl80211.NL80211_ATTR_IFNAME], b'wlan0\0')
+
+    def test_channel_frequency(self):
+        for channel, frequency in [(1, 2412), (6, 2437), (11, 2462), (14, 2484), (36, 5180), (161, 5805)]:
+            self.assertEqual(nl80211.channel_to_frequency(channel), frequency)
+            self.assertEqual(nl80211.frequency_to_channel(frequency), channel)
+        with self.assertRaises(ValueError):
+            nl80211.channel_to_frequency(0)
+
+
+@unittest.skipUnless(_hwsim_interfaces() and os.getuid() == 0, "Requires root and mac80211_hwsim radios")
+class TestHwsim(TestCase):
+
+    def test_set_channel(self):
+        from localizer import interface
+
+        _iface = _hwsim_interfaces()[0]
+        interface.set_interface_mode(_iface, "monitor")
+        _ifindex = nl80211.socket.if_nametoindex(_iface)
+
+        with nl80211.NL80211() as nl:
+            for channel in [1, 6, 11]:
+                nl.set_channel(_ifindex, channel)
+                self.assertEqual(nl.get_frequency(_ifindex), nl80211.channel_to_frequency(channel))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import queue
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from localizer import orchestrate
+
+
+class TestOrchestrate(TestCase):
+
+    def test_gather(self):
+        _flag = threading.Event()
+        _responses = [queue.Queue() for _ in range(3)]
+
+        def _respond(delay, response_queue, value):
+            _flag.wait()
+            time.sleep(delay)
+            response_queue.put(value)
+
+        for i, response_queue in enumerate(_responses):
+            threading.Thread(target=_respond, args=(.2, response_queue, i), daemon=True).start()
+
+        async def _orchestrate(timer):
+            with timer.phase('start'):
+                _flag.set()
+                await orchestrate.wait_event(_flag, 1)
+            with timer.phase('results'):
+                return await asyncio.gather(*[orchestrate.get_result(q) for q in _responses])
+
+        _timer = orchestrate.PhaseTimer()
+        _start = time.time()
+        self.assertEqual(orchestrate.run(_orchestrate(_timer)), [0, 1, 2])
+
+        # Responses are awaited together, not one after the other
+        self.assertLess(time.time() - _start, .5)
+        self.assertEqual(list(_timer.phases), ['start', 'results'])
+        self.assertRegex(str(_timer), r'^start:\d+\.\d{3},results:0\.\d{3}$')
+
+    def test_timeouts(self):
+        _thread = threading.Thread(target=time.sleep, args=(.3,))
+        _thread.start()
+
+        async def _wait():
+            _set = await orchestrate.wait_event(threading.Event(), .2)
+            await orchestrate.join_thread(_thread)
+            return _set
+
+        _start = time.time()
+        self.assertFalse(orchestrate.run(_wait()))
+        self.assertFalse(_thread.is_alive())
+        self.assertAlmostEqual(time.time() - _start, .3, delta=.1)
+
+    def test_interrupt(self):
+        def _interrupt():
+            raise KeyboardInterrupt
+
+        _stop = threading.Event()
+        _thread = threading.Thread(target=_stop.wait, daemon=True)
+        _thread.start()
+        _running = set(threading.enumerate())
+
+        async def _wait():
+            asyncio.get_event_loop().call_later(.1, _interrupt)
+            # Nothing answers, nor does the thread finish, while the loop runs
+            await asyncio.gather(orchestrate.get_result(queue.Queue()), orchestrate.wait_event(threading.Event()),
+                                 orchestrate.join_thread(_thread))
+
+        with self.assertRaises(KeyboardInterrupt):
+            orchestrate.run(_wait())
+
+        # Waiters left blocked cannot hold up the interpreter exiting, nor fail once their wait ends after the loop
+        self.assertTrue(all(t.daemon for t in set(threading.enumerate()) - _running))
+        _stop.set()
+        _thread.join()
+
+    def test_wakes_at_once(self):
+        _response = queue.Queue()
+        threading.Timer(.2, _response.put, args=('ready',)).start()
+
+        async def _wait():
+            _start = time.time()
+            _result = await orchestrate.get_result(_response)
+            return _result, time.time() - _start
+
+        _result, _waited = orchestrate.run(_wait())
+        self.assertEqual(_result, 'ready')
+        self.assertAlmostEqual(_waited, .2, delta=.02)
+
+    def test_countdown(self):
+        _start = time.time()
+        orchestrate.run(orchestrate.countdown(2, "Testing"))
+        self.assertAlmostEqual(time.time() - _start, 2, delta=.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import unittest
+from unittest import TestCase
+
+from localizer import motion, schedule
+
+BEARING_MIN = -360
+BEARING_MAX = 720
+
+
+def _travel_time(degrees):
+    return motion.travel_time(abs(degrees), 1.8 / 32, 120, 240)
+
+
+class TestSchedule(TestCase):
+
+    def setUp(self):
+        random.seed(0)
+
+    def _sectors(self, n):
+        return [schedule.Sector(random.uniform(0, 360), 84, 6, i) for i in range(n)]
+
+    def test_visits_every_sector_once(self):
+        for n in [1, 4, 9]:
+            _sectors = self._sectors(n)
+            _visits, _ = schedule.plan(0, _sectors, _travel_time, BEARING_MIN, BEARING_MAX, 0)
+            self.assertEqual(sorted(s.key for s, _ in _visits), list(range(n)))
+
+    def test_not_worse_than_given_order(self):
+        for n in [3, 6, 10]:
+            _sectors = self._sectors(n)
+            _in_order = [(s, True) for s in _sectors]
+            _baseline, _ = schedule.simulate(0, _in_order, _travel_time, BEARING_MIN, BEARING_MAX, 0)
+            _visits, _predicted = schedule.plan(0, _sectors, _travel_time, BEARING_MIN, BEARING_MAX, 0)
+            self.assertLessEqual(_predicted, _baseline + sum(s.duration for s in _sectors) + 1e-9)
+
+    def test_respects_wrap_limits(self):
+        _current = 0
+        _sectors = self._sectors(8)
+        _visits, _ = schedule.plan(_current, _sectors, _travel_time, BEARING_MIN, BEARING_MAX)
+        for sector, clockwise in _visits:
+            _sweep = sector.sweep(clockwise)
+            _current += motion.best_path(_current, sector.start(clockwise), _sweep, BEARING_MIN, BEARING_MAX)
+            self.assertAlmostEqual(_current % 360, sector.start(clockwise) % 360)
+            _current += _sweep
+            self.assertLessEqual(_current, BEARING_MAX)
+            self.assertGreaterEqual(_current, BEARING_MIN)
+
+    def test_counterclockwise_sector(self):
+        _sector = schedule.Sector(350, 20, 6)
+        self.assertEqual(_sector.start(False), 10)
+        self.assertEqual(_sector.sweep(False), -20)
+
+    def test_empty(self):
+        self.assertEqual(schedule.plan(0, [], _travel_time, BEARING_MIN, BEARING_MAX), ([], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import pandas as pd
+
+from localizer import store
+
+_columns = ['ssid', 'bssid', 'channel', 'security', 'strength', 'method', 'bearing']
+
+
+def _meta(lat, lon, start):
+    return {'name': 'test', 'pos_lat': lat, 'pos_lon': lon, 'pos_alt': 10, 'start': start}
+
+
+class TestStore(TestCase):
+
+    def setUp(self):
+        self.store = store.Store(os.path.join(tempfile.mkdtemp(), store.STORE_FILE))
+        self.store.record(_meta(38.0, -77.0, 100), pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 10],
+                                                                 ['b', '00:00:00:00:00:02', 6, 'WPA2', -60, 'max', 20]],
+                                                                columns=_columns))
+        # 1km north
+        self.store.record(_meta(38.009, -77.0, 200), pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -40, 'max', 190]],
+                                                                  columns=_columns))
+        # No fix
+        self.store.record(_meta(0, 0, 300), pd.DataFrame([['c', '00:00:00:00:00:03', 11, 'Open', -70, 'max', 30]],
+                                                         columns=_columns))
+
+    def test_last_bearing(self):
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(self.store.last_bearing('00:00:00:00:00:01'), (190, 38.009, -77.0, 200))
+        self.assertEqual(self.store.last_bearing('00:00:00:00:00:03'), (30, None, None, 300))
+        self.assertIsNone(self.store.last_bearing('ff:ff:ff:ff:ff:ff'))
+
+    def test_aps_near(self):
+        _near = self.store.aps_near(38.0, -77.0, 500)
+        self.assertEqual(sorted(_near.bssid), ['00:00:00:00:00:01', '00:00:00:00:00:02'])
+        self.assertEqual(list(_near[_near.bssid == '00:00:00:00:00:01'].bearing), [10])
+
+        # Both capture positions are in range: the latest observation wins
+        _near = self.store.aps_near(38.0045, -77.0, 600)
+        self.assertEqual(list(_near[_near.bssid == '00:00:00:00:00:01'].bearing), [190])
+        self.assertTrue(self.store.aps_near(39, -77.0, 500).empty)
+
+    def test_rerecord(self):
+        # Reprocessing a capture replaces its observations, whatever it sees this time
+        self.store.record(_meta(38.0, -77.0, 100), pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 15]],
+                                                                columns=_columns))
+        self.assertEqual(len(self.store), 3)
+        _near = self.store.aps_near(38.0, -77.0, 500)
+        self.assertEqual(list(_near.bssid), ['00:00:00:00:00:01'])
+        self.assertEqual(list(_near.bearing), [15])
+
+        # The same name at another time is another capture
+        self.store.record(_meta(38.0, -77.0, 400), pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 20]],
+                                                                columns=_columns))
+        self.assertEqual(len(self.store), 4)
+        if self.store.rtree:
+            # Every observation with a fix, and no replaced one, is indexed
+            with self.store._connect() as conn:
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM observation_positions").fetchone()[0], 3)
+
+    def test_deduplicate(self):
+        # Stores written before captures were keyed
+        _path = os.path.join(tempfile.mkdtemp(), store.STORE_FILE)
+        _store = store.Store(_path)
+        _guesses = pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 10]], columns=_columns)
+        with _store._connect() as conn:
+            conn.execute("DROP INDEX observations_capture")
+        for _ in range(2):
+            with _store._connect() as conn:
+                conn.execute("INSERT INTO observations (bssid, capture, time, lat, lon) "
+                             "VALUES ('00:00:00:00:00:01', 'test', 100, 38.0, -77.0)")
+        self.assertEqual(len(_store), 2)
+
+        _store = store.Store(_path)
+        self.assertEqual(len(_store), 1)
+        _store.record(_meta(38.0, -77.0, 100), _guesses)
+        _store.record(_meta(38.0, -77.0, 100), _guesses)
+        self.assertEqual(len(_store), 1)
+
+    def test_fallback_index(self):
+        # The bounding box query must agree without the R*Tree
+        self.store.rtree = False
+        self.assertEqual(sorted(self.store.aps_near(38.0, -77.0, 500).bssid), ['00:00:00:00:00:01', '00:00:00:00:00:02'])
+
+    def test_distance(self):
+        self.assertAlmostEqual(store.distance(38.0, -77.0, [38.009], [-77.0])[0], 1000.8, delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
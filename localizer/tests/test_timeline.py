@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from localizer import interface, process
+from localizer.interface import write_channel_timeline
+from localizer.meta import channel_timeline_fieldnames
+
+
+class TestChannelTimeline(TestCase):
+
+    def setUp(self):
+        # Tuned to 1 at 10s, 6 at 10.5s, 11 at 11s, then back to 1 at 11.5s
+        self.timeline = pd.DataFrame([[10, 1, .002], [10.5, 6, .003], [11, 11, .002], [11.5, 1, .004]],
+                                     columns=channel_timeline_fieldnames)
+
+    def test_hop_channels(self):
+        np.testing.assert_array_equal(process.hop_channels(self.timeline, [10.2, 10.7, 11.2, 11.7]), [1, 6, 11, 1])
+
+    def test_hop_channels_edges(self):
+        # Before the first entry the radio is on the channel it was first tuned to
+        np.testing.assert_array_equal(process.hop_channels(self.timeline, [0, 9.99]), [1, 1])
+        # A packet stamped exactly on a switch belongs to the new channel
+        np.testing.assert_array_equal(process.hop_channels(self.timeline, [10.5, 11]), [6, 11])
+        # After the last hop the radio stays where it is
+        np.testing.assert_array_equal(process.hop_channels(self.timeline, [11.5, 100]), [1, 1])
+
+    def test_channel_dwell(self):
+        _dwell = process.channel_dwell(self.timeline, 10, 12)
+        self.assertEqual(_dwell.to_dict(), {1: 1.0, 6: .5, 11: .5})
+
+    def test_channel_dwell_clipped(self):
+        # Time outside the window does not count, nor do channels only visited outside it
+        _dwell = process.channel_dwell(self.timeline, 10.25, 11.25)
+        self.assertEqual(_dwell.to_dict(), {1: .25, 6: .5, 11: .25})
+        self.assertAlmostEqual(_dwell.sum(), 1)
+
+        _dwell = process.channel_dwell(self.timeline, 10.6, 10.9)
+        self.assertEqual(list(_dwell[_dwell > 0].index), [6])
+        self.assertAlmostEqual(_dwell[6], .3)
+
+    def test_round_trip(self):
+        _path = os.path.join(tempfile.mkdtemp(), 'test-channels.csv')
+        # Loading puts the entries in time order, whatever order they were written in
+        write_channel_timeline(_path, [tuple(row) for row in self.timeline.iloc[[1, 0, 2, 3]].values])
+
+        _timeline = process.load_channel_timeline(_path)
+        self.assertEqual(list(_timeline.columns), channel_timeline_fieldnames)
+        np.testing.assert_allclose(_timeline.values, self.timeline.values)
+
+
+class FailingEngine:
+
+    def __init__(self, failing):
+        """
+        Channel engine that cannot tune some channels, as when a netlink request fails
+        """
+
+        self._failing = failing
+        self.channels = []
+
+    def set_channel(self, channel):
+        self.channels.append(channel)
+        return channel not in self._failing
+
+    def close(self):
+        pass
+
+
+class TestFailedSwitch(TestCase):
+
+    def _hop(self, engine):
+        _path = os.path.join(tempfile.mkdtemp(), 'test-channels.csv')
+        _flag = threading.Event()
+        with mock.patch.object(interface, 'get_interface_mode', return_value='monitor'), \
+                mock.patch.object(interface, 'get_channel_engine', return_value=engine):
+            _thread = interface.ChannelThread(_flag, 'wlan0', .25, .1, distance=1, channels=[1, 6, 11],
+                                              timeline_output=_path)
+            _thread.start()
+            _flag.set()
+            _thread.join()
+        return process.load_channel_timeline(_path)
+
+    def test_failed_hop(self):
+        # Packets after the failed switch to 6 stay with 1, the channel the radio is still on
+        _engine = FailingEngine([6])
+        _timeline = self._hop(_engine)
+        self.assertEqual(_engine.channels, [1, 6, 11])
+        self.assertEqual(list(_timeline['channel']), [1, 11])
+
+    def test_failed_first_channel(self):
+        # Nothing is known of the channel the radio was left on
+        _timeline = self._hop(FailingEngine([1]))
+        self.assertEqual(list(_timeline['channel']), [0, 6, 11])
+
+
+if __name__ == '__main__':
+    unittest.main()
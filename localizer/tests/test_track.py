@@ -0,0 +1,73 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from localizer import archive, track
+
+
+class TestTrack(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def _write(self, name, lines):
+        with open(os.path.join(self.path, name), 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        return name
+
+    def test_load_nmea(self):
+        _file = self._write('test.nmea', [
+            "100.000000: $GPGGA,120000.00,3830.000,N,07715.000,W,1,08,0.9,100.0,M,,,,*47",
+            "100.100000: $GPRMC,120000.00,A,3830.000,N,07715.000,W,0.0,0.0,010118,,,A*00",
+            "101.000000: $GNGGA,120001.00,3830.600,N,07715.600,W,2,08,0.9,110.0,M,,,,*47",
+            "102.000000: $GPGGA,120002.00,,,,,0,00,,,M,,,,*47",
+            "garbage",
+            "103.000000: $GPGGA,120003.00,3400.000,S,01800.000,E,1,08,0.9,,M,,,,*47",
+        ])
+
+        _track = track.load_nmea(os.path.join(self.path, _file))
+        self.assertEqual(list(_track['timestamp']), [100, 101, 103])
+        np.testing.assert_allclose(_track['lat'], [38.5, 38.51, -34])
+        np.testing.assert_allclose(_track['lon'], [-77.25, -77.26, 18])
+        self.assertEqual(list(_track['alt'][:2]), [100, 110])
+        self.assertTrue(np.isnan(_track['alt'][2]))
+
+    def test_load_track(self):
+        _nmea = self._write('test.nmea', [])
+        _coords = self._write('test-gps.csv', ["timestamp,lat,lon,alt,lat_err,lon_error,alt_error",
+                                               "11,1,2,3,,,", "10,0,1,2,,,"])
+
+        # The empty recording falls back to the gps csv
+        _track = track.load_track({'nmea': _nmea, 'coords': _coords}, self.path)
+        self.assertEqual(list(_track['timestamp']), [10, 11])
+        self.assertIsNone(track.load_track({'nmea': _nmea}, self.path))
+
+    def test_load_track_compressed(self):
+        with gzip.open(os.path.join(self.path, 'test.nmea.gz'), 'wt') as fp:
+            fp.write("100.0: $GPGGA,120000.00,3830.000,N,07715.000,W,1,08,0.9,100.0,M,,,,*47\n"
+                     "101.0: $GPGGA,120001.00,3830.600,N,07715.600,W,1,08,0.9,110.0,M,,,,*47\n")
+
+        # Archived files are found by the names the meta gives them
+        _track = track.load_track({'nmea': 'test.nmea'}, self.path)
+        self.assertEqual(list(_track['timestamp']), [100, 101])
+        archive.compress_file(os.path.join(self.path, self._write('test-gps.csv', [
+            "timestamp,lat,lon,alt", "10,0,1,2", "11,1,2,3"])))
+        self.assertEqual(list(track.load_track({'coords': 'test-gps.csv'}, self.path)['timestamp']), [10, 11])
+
+    def test_interpolate(self):
+        _track = track.load_coords(os.path.join(self.path, self._write('test-gps.csv', [
+            "timestamp,lat,lon,alt", "0,10,179,0", "10,20,-179,", "20,30,-178,20"])))
+
+        _lat, _lon, _alt = track.interpolate(_track, [-5, 5, 15, 25])
+        np.testing.assert_allclose(_lat, [10, 15, 25, 30])
+        # Across the antimeridian, not back around the globe
+        np.testing.assert_allclose(_lon, [179, -180, -178.5, -178])
+        np.testing.assert_allclose(_alt, [0, 5, 15, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
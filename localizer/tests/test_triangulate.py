@@ -0,0 +1,123 @@
+import csv
+import math
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from localizer import triangulate
+from localizer.meta import meta_csv_fieldnames
+from localizer.store import METERS_PER_DEGREE
+
+_LAT, _LON = 38.0, -77.0
+
+
+def _offset(north, east):
+    return _LAT + north / METERS_PER_DEGREE, _LON + east / (METERS_PER_DEGREE * math.cos(math.radians(_LAT)))
+
+
+def _bearing(observer, ap):
+    return math.degrees(math.atan2((ap[1] - observer[1]) * math.cos(math.radians(_LAT)), ap[0] - observer[0])) % 360
+
+
+class TestTriangulate(TestCase):
+
+    def _bearings(self, aps, observers, noise=0, seed=0):
+        _rng = np.random.RandomState(seed)
+        _rows = []
+        for bssid, ap in aps.items():
+            for observer in observers:
+                _rows.append([bssid, 'ssid', observer[0], observer[1], _bearing(observer, ap) + _rng.normal(0, noise)])
+        return pd.DataFrame(_rows, columns=['bssid', 'ssid', 'lat', 'lon', 'bearing'])
+
+    def test_exact(self):
+        _aps = {'a': _offset(100, 50), 'b': _offset(-30, 200)}
+        _positions = triangulate.triangulate(self._bearings(_aps, [_offset(0, 0), _offset(0, 100), _offset(50, -50)]))
+
+        self.assertEqual(sorted(_positions.bssid), ['a', 'b'])
+        for row in _positions.itertuples():
+            self.assertAlmostEqual(row.lat, _aps[row.bssid][0], places=6)
+            self.assertAlmostEqual(row.lon, _aps[row.bssid][1], places=6)
+            self.assertAlmostEqual(row.rms, 0, places=3)
+            self.assertEqual(row.observations, 3)
+
+    def test_ellipse(self):
+        # Observers spread east-west see an AP far to the north with poor depth: the ellipse points north
+        _aps = {'a': _offset(500, 0)}
+        _positions = triangulate.triangulate(self._bearings(_aps, [_offset(0, -50), _offset(0, 50), _offset(0, 0)], 2))
+
+        self.assertEqual(len(_positions), 1)
+        self.assertGreater(_positions.semi_major[0], 3 * _positions.semi_minor[0])
+        self.assertTrue(_positions.orientation[0] < 10 or _positions.orientation[0] > 170)
+        _north = (_positions.lat[0] - _LAT) * METERS_PER_DEGREE
+        self.assertLess(abs(_north - 500), _positions.semi_major[0])
+
+    def test_rejected(self):
+        # One position only, and a pair of bearings pointing away from each other
+        _bearings = pd.concat([self._bearings({'a': _offset(100, 0)}, [_offset(0, 0), _offset(0, 0)]),
+                               pd.DataFrame([['b', 'ssid', _LAT, _LON, 315], ['b', 'ssid', _offset(0, 100)[0], _offset(0, 100)[1], 45]],
+                                            columns=['bssid', 'ssid', 'lat', 'lon', 'bearing'])])
+        self.assertTrue(triangulate.triangulate(_bearings).empty)
+
+    def test_load_bearings(self):
+        _path = tempfile.mkdtemp()
+        for i, observer in enumerate([_offset(0, 0), _offset(0, 100)]):
+            os.makedirs(os.path.join(_path, str(i)))
+            _meta = {f: '' for f in meta_csv_fieldnames}
+            _meta.update({'pos_lat': observer[0], 'pos_lon': observer[1], 'start': 1500000000, 'guess': 'test-guess.csv'})
+            with open(os.path.join(_path, str(i), 'test-capture.csv'), 'w', newline='') as fp:
+                _writer = csv.DictWriter(fp, dialect='unix', fieldnames=meta_csv_fieldnames)
+                _writer.writeheader()
+                _writer.writerow(_meta)
+            pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 45]],
+                         columns=['ssid', 'bssid', 'channel', 'security', 'strength', 'method', 'bearing'])\
+                .to_csv(os.path.join(_path, str(i), 'test-guess.csv'), sep=',')
+
+        _bearings = triangulate.load_bearings(_path)
+        self.assertEqual(len(_bearings), 2)
+        # Corrected for declination, about 11 degrees west here
+        self.assertTrue((abs(_bearings.bearing - 34) < 2).all())
+
+
+class TestAPEstimator(TestCase):
+
+    def test_converges(self):
+        # The online estimate matches the batch solution for noise free bearings, one bearing at a time
+        _ap = _offset(100, 50)
+        _estimator = triangulate.APEstimator()
+        _observers = [_offset(0, 0), _offset(0, 100), _offset(50, -50), _offset(-20, 30)]
+
+        _estimator.update('a', 'ssid', _observers[0][0], _observers[0][1], _bearing(_observers[0], _ap), -60)
+        self.assertIsNone(_estimator.position('a'))
+        self.assertTrue(_estimator.positions().empty)
+
+        _majors = []
+        for observer in _observers[1:]:
+            _estimator.update('a', 'ssid', observer[0], observer[1], _bearing(observer, _ap), -60)
+            _lat, _lon, _observations, _major, _minor, _ = _estimator.position('a')
+            self.assertAlmostEqual(_lat, _ap[0], places=6)
+            self.assertAlmostEqual(_lon, _ap[1], places=6)
+            _majors.append(_major)
+
+        self.assertEqual(_observations, 4)
+        self.assertEqual(sorted(_majors, reverse=True), _majors)
+        self.assertEqual(list(_estimator.positions().bssid), ['a'])
+
+    def test_update_guesses(self):
+        _estimator = triangulate.APEstimator()
+        _guesses = pd.DataFrame([['a', '00:00:00:00:00:01', 1, 'Open', -50, 'max', 45]],
+                                columns=['ssid', 'bssid', 'channel', 'security', 'strength', 'method', 'bearing'])
+        self.assertEqual(_estimator.update_guesses({'pos_lat': 0, 'pos_lon': 0, 'start': 1500000000}, _guesses), 0)
+        self.assertEqual(_estimator.update_guesses({'pos_lat': _LAT, 'pos_lon': _LON, 'start': 1500000000}, _guesses), 1)
+        self.assertEqual(len(_estimator), 1)
+
+    def test_strength_range(self):
+        self.assertEqual(triangulate.strength_range(-20), triangulate.MIN_RANGE)
+        self.assertAlmostEqual(triangulate.strength_range(-100), 100, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,383 @@
+import ctypes
+import logging
+import mmap
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from localizer import interface, inventory, pcapng
+from localizer.meta import PROFILE_BEACONS, PROFILE_MGMT, PROFILE_ALL, CAPTURE_PROFILES, profile_snaplens
+
+module_logger = logging.getLogger(__name__)
+
+# From linux/if_packet.h and linux/if_ether.h
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 3
+SO_ATTACH_FILTER = 26
+
+# Ring geometry: blocks are handed to us when full, or after RING_BLOCK_TIMEOUT so live taps are not starved
+RING_BLOCK_SIZE = 1 << 20
+RING_BLOCKS = 16
+RING_FRAME_SIZE = 1 << 11
+RING_BLOCK_TIMEOUT = 100
+POLL_TIMEOUT = 100
+# Rising drop counts are reported at most this often during a capture (s)
+DROP_REPORT_INTERVAL = 1
+
+# Link types of the interfaces we may capture on, by ARPHRD type
+LINKTYPES = {inventory.ARPHRD_IEEE80211_RADIOTAP: pcapng.LINKTYPE_IEEE802_11_RADIOTAP}
+LINKTYPE_ETHERNET = 1
+
+# Classic BPF opcodes, from linux/filter.h
+BPF_LD_B_ABS = 0x30
+BPF_LD_B_IND = 0x50
+BPF_ALU_LSH_K = 0x64
+BPF_ALU_OR_X = 0x4c
+BPF_ALU_AND_K = 0x54
+BPF_JMP_JEQ_K = 0x15
+BPF_RET_K = 0x06
+BPF_MISC_TAX = 0x07
+
+# Snap length that keeps whole frames
+MAX_SNAPLEN = 0x40000
+# Frame type bits of the first frame control byte; management frames are type 0
+FC_TYPE_MASK = 0x0c
+FC_TYPE_MGMT = 0x00
+
+_BLOCK_HEADER = struct.Struct('=IIIIIIQ')
+_PACKET_HEADER = struct.Struct('=IIIIIIH')
+_STATS = struct.Struct('=III')
+
+
+class SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16),
+                ('jt', ctypes.c_uint8),
+                ('jf', ctypes.c_uint8),
+                ('k', ctypes.c_uint32)]
+
+
+class SockFprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_uint16),
+                ('filter', ctypes.POINTER(SockFilter))]
+
+
+def frame_filter(first_bytes, snaplen=MAX_SNAPLEN, mask=0xff):
+    """
+    Classic BPF program for radiotap captures accepting frames whose first frame control byte, masked, is one of the
+    given values. The radiotap header is variable length, so its (little endian) length is loaded into X first
+
+    :param first_bytes: Accepted values of the masked first byte, eg SUBTYPE_BEACON and SUBTYPE_PROBE_RESP
+    :type first_bytes: list[int]
+    :param snaplen: Bytes of each accepted frame to keep
+    :type snaplen: int
+    :param mask: Mask applied to the first byte
+    :type mask: int
+    :return: List of (code, jt, jf, k)
+    :rtype: list[tuple]
+    """
+
+    _program = [(BPF_LD_B_ABS, 0, 0, 3),
+                (BPF_ALU_LSH_K, 0, 0, 8),
+                (BPF_MISC_TAX, 0, 0, 0),
+                (BPF_LD_B_ABS, 0, 0, 2),
+                (BPF_ALU_OR_X, 0, 0, 0),
+                (BPF_MISC_TAX, 0, 0, 0),
+                (BPF_LD_B_IND, 0, 0, 0)]
+    if mask != 0xff:
+        _program.append((BPF_ALU_AND_K, 0, 0, mask))
+
+    # Each comparison jumps to the accept at the end of the list, or falls through to the next / the reject
+    for i, value in enumerate(first_bytes):
+        _remaining = len(first_bytes) - i - 1
+        _program.append((BPF_JMP_JEQ_K, _remaining, 0 if _remaining else 1, value))
+
+    _program.append((BPF_RET_K, 0, 0, snaplen))
+    _program.append((BPF_RET_K, 0, 0, 0))
+    return _program
+
+
+def beacon_filter(snaplen=MAX_SNAPLEN):
+    """
+    Classic BPF program accepting only beacons and probe responses
+    """
+
+    return frame_filter([pcapng.SUBTYPE_BEACON, pcapng.SUBTYPE_PROBE_RESP], snaplen)
+
+
+def profile_filter(profile):
+    """
+    Classic BPF program for a capture profile
+
+    :param profile: One of CAPTURE_PROFILES
+    :type profile: str
+    :return: List of (code, jt, jf, k), or None to keep every frame whole
+    :rtype: list[tuple]
+    """
+
+    _snaplen = profile_snaplens.get(profile) or MAX_SNAPLEN
+    if profile == PROFILE_BEACONS:
+        return beacon_filter(_snaplen)
+    elif profile == PROFILE_MGMT:
+        return frame_filter([FC_TYPE_MGMT], _snaplen, FC_TYPE_MASK)
+    elif profile == PROFILE_ALL:
+        return None
+    else:
+        raise ValueError("Invalid capture profile: {}; should be one of {}".format(profile, CAPTURE_PROFILES))
+
+
+def attach_filter(sock, program):
+    """
+    Attach a classic BPF program to a socket
+
+    :param sock: Socket
+    :type sock: socket.socket
+    :param program: List of (code, jt, jf, k)
+    :type program: list[tuple]
+    :return: The filter array, which must be kept alive as long as the program is attached
+    """
+
+    _filters = (SockFilter * len(program))(*[SockFilter(*instruction) for instruction in program])
+    _fprog = SockFprog(len(program), ctypes.cast(_filters, ctypes.POINTER(SockFilter)))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(_fprog))
+    return _filters
+
+
+class Ring:
+
+    def __init__(self, iface, program=None, block_size=RING_BLOCK_SIZE, blocks=RING_BLOCKS):
+        """
+        AF_PACKET socket bound to an interface, with a TPACKET_V3 receive ring mapped into our memory
+
+        :param iface: Interface to capture on
+        :type iface: str
+        :param program: Classic BPF program to filter with in the kernel, if any
+        :type program: list[tuple]
+        """
+
+        self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            # Filter before the ring is set up so nothing unfiltered gets in
+            self._filters = attach_filter(self._sock, program) if program else None
+            self._sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            self._sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                                  struct.pack('=IIIIIII', block_size, blocks, RING_FRAME_SIZE,
+                                              block_size * blocks // RING_FRAME_SIZE, RING_BLOCK_TIMEOUT, 0, 0))
+            self._ring = mmap.mmap(self._sock.fileno(), block_size * blocks, mmap.MAP_SHARED,
+                                   mmap.PROT_READ | mmap.PROT_WRITE)
+            self._sock.bind((iface, ETH_P_ALL))
+        except OSError:
+            self._sock.close()
+            raise
+
+        self._view = memoryview(self._ring)
+        self._block_size = block_size
+        self._blocks = blocks
+        self._block = 0
+        self._poll = select.poll()
+        self._poll.register(self._sock, select.POLLIN | select.POLLERR)
+
+        self.received = 0
+        self.dropped = 0
+
+    def read(self, callback, timeout=POLL_TIMEOUT):
+        """
+        Wait for packets and call callback(timestamp_ns, data, length) for each. data is a memoryview into the ring,
+        only valid during the call
+
+        :param callback: Function to call per packet
+        :type callback: callable
+        :param timeout: Time to wait for a block (ms)
+        :type timeout: int
+        :return: Number of packets read
+        :rtype: int
+        """
+
+        _count = 0
+        if not self._ready():
+            self._poll.poll(timeout)
+
+        while self._ready():
+            _offset = self._block * self._block_size
+            _, _, _, _packets, _first, _, _ = _BLOCK_HEADER.unpack_from(self._ring, _offset)
+
+            _packet = _offset + _first
+            for _ in range(_packets):
+                _next, _sec, _nsec, _snaplen, _length, _, _mac = _PACKET_HEADER.unpack_from(self._ring, _packet)
+                callback(_sec * 1000000000 + _nsec, self._view[_packet + _mac:_packet + _mac + _snaplen], _length)
+                _packet += _next
+
+            # Hand the block back to the kernel
+            struct.pack_into('=I', self._ring, _offset + 8, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self._blocks
+            _count += _packets
+
+        return _count
+
+    def stats(self):
+        """
+        Update the received and dropped counters from the kernel (which resets them on every read)
+
+        :return: (received, dropped)
+        :rtype: tuple
+        """
+
+        _packets, _drops, _ = _STATS.unpack(self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _STATS.size))
+        # The kernel counts drops as received too
+        self.received += _packets - _drops
+        self.dropped += _drops
+        return self.received, self.dropped
+
+    def close(self):
+        self._view.release()
+        self._ring.close()
+        self._sock.close()
+
+    def _ready(self):
+        return struct.unpack_from('=I', self._ring, self._block * self._block_size + 8)[0] & TP_STATUS_USER
+
+
+def linktype(iface):
+    """
+    pcapng link type of an interface
+
+    :param iface: Interface
+    :type iface: str
+    :rtype: int
+    """
+
+    try:
+        with open(os.path.join(inventory.SYSFS_NET, iface, 'type')) as fp:
+            return LINKTYPES.get(int(fp.read()), LINKTYPE_ETHERNET)
+    except (OSError, ValueError):
+        return LINKTYPE_ETHERNET
+
+
+class TPacketCaptureThread(threading.Thread):
+
+    def __init__(self, response_queue, initialize_flag, start_flag, iface, duration, output, profile=PROFILE_BEACONS, buffer=None):
+        """
+        In-process alternative to CaptureThread: reads a TPACKET_V3 ring and writes pcapng itself with large buffered
+        writes. Same synchronization and responses as CaptureThread
+
+        :param profile: Capture profile, one of CAPTURE_PROFILES, filtered in the kernel
+        :type profile: str
+        :param buffer: Size of the ring (MB), defaults to RING_BLOCKS blocks
+        :type buffer: int
+        """
+
+        super().__init__()
+
+        module_logger.info("Starting TPACKET_V3 Packet Capture Thread")
+
+        self.daemon = True
+        self._response_queue = response_queue
+        self._initialize_flag = initialize_flag
+        self._start_flag = start_flag
+        self._iface = iface
+        self._duration = duration
+        self._output = output
+        self._program = profile_filter(profile)
+        self._snaplen = profile_snaplens[profile]
+        self._blocks = max(1, (buffer << 20) // RING_BLOCK_SIZE) if buffer else RING_BLOCKS
+        self._subscribers = []
+        self._drop_watchers = []
+        self._cancelled = False
+
+        self.captured = 0
+        self.dropped = 0
+
+        # Ensure we are in monitor mode
+        while interface.get_interface_mode(self._iface) != "monitor":
+            interface.set_interface_mode(self._iface, "monitor")
+
+    def subscribe(self, callback):
+        """
+        Call callback(timestamp, data) for every packet as it is captured. data is a memoryview into the capture ring
+        and is only valid during the call
+
+        :param callback: Function to call
+        :type callback: callable
+        """
+
+        self._subscribers.append(callback)
+
+    def watch_drops(self, callback):
+        """
+        Call callback(captured, dropped) whenever the ring's drop count has risen during the capture, at most every
+        DROP_REPORT_INTERVAL
+
+        :param callback: Function to call
+        :type callback: callable
+        """
+
+        self._drop_watchers.append(callback)
+
+    def run(self):
+        module_logger.info("Executing TPACKET_V3 capture thread")
+
+        _ring = Ring(self._iface, self._program, blocks=self._blocks)
+        with open(self._output, 'wb', buffering=pcapng.WRITE_BUFFER) as fp:
+            _writer = pcapng.Writer(fp, linktype(self._iface), self._snaplen)
+
+            def _packet(timestamp_ns, data, length):
+                _writer.write(timestamp_ns, data, length)
+                for callback in self._subscribers:
+                    callback(timestamp_ns / 1000000000, data)
+
+            # Keep draining the ring while the other threads set up; processing drops packets outside of the sweep
+            while not self._initialize_flag.wait(0):
+                _ring.read(_packet)
+
+            if self._cancelled:
+                _ring.close()
+                return
+
+            _start_time = time.time()
+            self._start_flag.set()
+
+            # Capture until the duration (plus a margin) has elapsed
+            _stop_time = _start_time + self._duration + 1
+            _reported = 0
+            _next_report = _start_time
+            while time.time() < _stop_time:
+                _ring.read(_packet, min(POLL_TIMEOUT, max(0, int((_stop_time - time.time()) * 1000))))
+                self.captured, self.dropped = _ring.stats()
+                if self.dropped > _reported and time.time() >= _next_report:
+                    self._report_drops(_reported)
+                    _reported = self.dropped
+                    _next_report = time.time() + DROP_REPORT_INTERVAL
+
+            _ring.read(_packet, 0)
+            self.captured, self.dropped = _ring.stats()
+            _ring.close()
+
+        _end_time = time.time()
+        module_logger.info("Captured {} packets for {:.2f}s (expected {}s), {} dropped"
+                           .format(_writer.packets, _end_time - _start_time, self._duration, self.dropped))
+
+        # Respond with actual
+        self._response_queue.put((self.captured, self.dropped))
+        self._response_queue.put((_start_time, _end_time))
+
+    def cancel(self):
+        """
+        Stop capturing once the synchronization flag is raised
+        """
+
+        self._cancelled = True
+
+    def _report_drops(self, reported):
+        if not reported:
+            module_logger.warning("{} is dropping packets ({} of {} so far)"
+                                  .format(self._iface, self.dropped, self.captured + self.dropped))
+        for callback in self._drop_watchers:
+            callback(self.captured, self.dropped)
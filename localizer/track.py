@@ -0,0 +1,131 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from localizer import archive
+from localizer.meta import meta_csv_fieldnames
+
+module_logger = logging.getLogger(__name__)
+
+# Columns of the GGA sentence, after the talker/type field
+_GGA_TIME, _GGA_LAT, _GGA_NS, _GGA_LON, _GGA_EW, _GGA_QUALITY, _GGA_SATELLITES, _GGA_HDOP, _GGA_ALT = range(1, 10)
+
+track_fieldnames = ['timestamp', 'lat', 'lon', 'alt']
+
+
+def _degrees(values, hemispheres, negative):
+    # NMEA coordinates are (d)ddmm.mmmm
+    _values = pd.to_numeric(values, errors='coerce')
+    _degrees = np.floor(_values / 100)
+    return (_degrees + (_values - _degrees * 100) / 60) * np.where(hemispheres == negative, -1, 1)
+
+
+def load_nmea(path):
+    """
+    Load the positions of a timestamped NMEA recording (gpspipe -r -uu format: "<unix time>: <sentence>"), parsing
+    every GGA sentence at once
+
+    :param path: Path of the NMEA file, compressed or not
+    :type path: str
+    :return: DataFrame of timestamp, lat, lon and alt, sorted by timestamp, for sentences with a fix
+    :rtype: pd.DataFrame
+    """
+
+    with archive.open_file(path, errors='replace') as fp:
+        _lines = pd.Series(fp.read().splitlines())
+
+    _lines = _lines[_lines.str.contains(r'^\d+(?:\.\d*)?: \$..GGA,', regex=True)]
+    if _lines.empty:
+        return pd.DataFrame(columns=track_fieldnames, dtype=float)
+
+    _split = _lines.str.split(': ', n=1, expand=True)
+    # Drop the checksum, then split the fields
+    _fields = _split[1].str.split('*', n=1).str[0].str.split(',', expand=True)
+    if _fields.shape[1] <= _GGA_ALT:
+        return pd.DataFrame(columns=track_fieldnames, dtype=float)
+
+    _track = pd.DataFrame({'timestamp': pd.to_numeric(_split[0], errors='coerce').values,
+                           'lat': _degrees(_fields[_GGA_LAT], _fields[_GGA_NS], 'S').values,
+                           'lon': _degrees(_fields[_GGA_LON], _fields[_GGA_EW], 'W').values,
+                           'alt': pd.to_numeric(_fields[_GGA_ALT], errors='coerce').values})
+
+    # Quality 0 is no fix
+    _fixed = pd.to_numeric(_fields[_GGA_QUALITY], errors='coerce').fillna(0).values > 0
+    return _track[_fixed].dropna(subset=['timestamp', 'lat', 'lon']).sort_values('timestamp').reset_index(drop=True)
+
+
+def load_coords(path):
+    """
+    Load the fixes recorded in a capture's gps csv
+
+    :param path: Path of the gps csv
+    :type path: str
+    :return: DataFrame of timestamp, lat, lon and alt, sorted by timestamp
+    :rtype: pd.DataFrame
+    """
+
+    _coords = pd.read_csv(path, usecols=track_fieldnames)
+    return _coords.apply(pd.to_numeric, errors='coerce').dropna(subset=['timestamp', 'lat', 'lon'])\
+        .sort_values('timestamp').reset_index(drop=True)
+
+
+def load_track(meta, path):
+    """
+    Load the track of a capture: the NMEA recording, which holds every fix at the device's rate, or the gps csv if the
+    recording has no usable positions
+
+    :param meta: Capture meta
+    :type meta: dict
+    :param path: Directory of the capture
+    :type path: str
+    :return: DataFrame of timestamp, lat, lon and alt, or None if neither file has at least two fixes
+    :rtype: pd.DataFrame
+    """
+
+    _sources = [(meta_csv_fieldnames[17], load_nmea), (meta_csv_fieldnames[18], load_coords)]
+    for field, loader in _sources:
+        if not meta.get(field):
+            continue
+        _file = archive.resolve(os.path.join(path, meta[field]))
+        if not os.path.isfile(_file):
+            continue
+
+        try:
+            _track = loader(_file)
+        except (OSError, ValueError) as e:
+            module_logger.warning("Could not load track from {}: {}".format(_file, e))
+            continue
+
+        if len(_track) >= 2:
+            module_logger.info("Loaded {} fixes from {}".format(len(_track), _file))
+            return _track
+
+    return None
+
+
+def interpolate(track, timestamps):
+    """
+    Position at each timestamp, linearly interpolated between fixes (and held at the first and last fix outside them)
+
+    :param track: Track, as returned by load_track
+    :type track: pd.DataFrame
+    :param timestamps: Timestamps to locate
+    :type timestamps: np.ndarray
+    :return: (lat, lon, alt) arrays
+    :rtype: tuple
+    """
+
+    _timestamps = np.asarray(timestamps, dtype=float)
+    _times = track['timestamp'].values
+
+    # Interpolate longitude unwrapped, so tracks crossing the antimeridian do not sweep the globe
+    _lon = np.degrees(np.unwrap(np.radians(track['lon'].values)))
+    _lon = (np.interp(_timestamps, _times, _lon) + 180) % 360 - 180
+
+    _alt = track['alt'].values
+    _valid = ~np.isnan(_alt)
+    _alt = np.interp(_timestamps, _times[_valid], _alt[_valid]) if _valid.any() else np.full(len(_timestamps), np.nan)
+
+    return np.interp(_timestamps, _times, track['lat'].values), _lon, _alt
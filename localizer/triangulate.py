@@ -0,0 +1,348 @@
+import csv
+import logging
+import math
+import os
+import time
+from datetime import date
+
+import geomag
+import numpy as np
+import pandas as pd
+
+from localizer.meta import meta_csv_fieldnames, capture_suffixes
+from localizer.store import METERS_PER_DEGREE
+
+module_logger = logging.getLogger(__name__)
+
+# Standard deviation of a single bearing estimate (degrees)
+BEARING_SIGMA = 10
+# Observers closer than this to an AP are weighted as if they were this far (m)
+MIN_RANGE = 10
+# Capture positions must span at least this much for the bearings of an AP to intersect usefully (m)
+MIN_BASELINE = 10
+# Reweighting passes after the first solve, as ranges become known
+ITERATIONS = 2
+# Scale of the error ellipse axes for 95% confidence (square root of the chi-squared quantile with 2 dof)
+ELLIPSE_SCALE = math.sqrt(-2 * math.log(.05))
+# Suffix of the file AP positions are written to
+APS_SUFFIX = "-aps.csv"
+# Log-distance path loss model, for a first range guess from signal strength: strength at 1m (dBm), and exponent
+RSSI_REFERENCE = -40
+PATH_LOSS_EXPONENT = 3
+
+position_fieldnames = ['bssid', 'ssid', 'lat', 'lon', 'observations', 'semi_major', 'semi_minor', 'orientation', 'rms']
+
+
+def load_bearings(path):
+    """
+    Bearing estimates of every AP from every capture position, from the guess files of the captures under path.
+    Bearings are converted to true north with the declination at the capture
+
+    :param path: Campaign directory
+    :type path: str
+    :return: DataFrame of bssid, ssid, lat, lon and bearing (true)
+    :rtype: pd.DataFrame
+    """
+
+    _bearings = []
+    for root, dirs, files in os.walk(path):
+        _meta = next((f for f in files if f.endswith(capture_suffixes["meta"])), None)
+        if _meta is None:
+            continue
+
+        with open(os.path.join(root, _meta), 'rt') as meta_csv:
+            meta = next(csv.DictReader(meta_csv, dialect='unix'), None)
+        if not meta or not meta.get(meta_csv_fieldnames[20]) or not os.path.isfile(os.path.join(root, meta[meta_csv_fieldnames[20]])):
+            continue
+
+        try:
+            _lat, _lon, _start = (float(meta[meta_csv_fieldnames[i]]) for i in (6, 7, 12))
+        except (TypeError, ValueError):
+            continue
+        # Captures without a fix report 0, 0
+        if not _lat and not _lon:
+            continue
+
+        _guesses = pd.read_csv(os.path.join(root, meta[meta_csv_fieldnames[20]]), index_col=0)
+        _declination = geomag.declination(_lat, _lon, 0, date.fromtimestamp(_start))
+        _bearings.append(pd.DataFrame({'bssid': _guesses['bssid'].values,
+                                       'ssid': _guesses['ssid'].values,
+                                       'lat': _lat,
+                                       'lon': _lon,
+                                       'bearing': (_guesses['bearing'].values + _declination) % 360}))
+
+    if not _bearings:
+        return pd.DataFrame(columns=['bssid', 'ssid', 'lat', 'lon', 'bearing'])
+
+    return pd.concat(_bearings, ignore_index=True).dropna(subset=['bssid', 'bearing'])
+
+
+def _group_sum(groups, count, values):
+    return np.bincount(groups, weights=values, minlength=count)
+
+
+def _ellipse(a, b, d):
+    # 95% error ellipse of the position whose information (inverse covariance) matrix is [[a, b], [b, d]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _det = a * d - b * b
+        _cxx, _cxy, _cyy = d / _det, -b / _det, a / _det
+        _mean = (_cxx + _cyy) / 2
+        _spread = np.sqrt(((_cxx - _cyy) / 2) ** 2 + _cxy ** 2)
+        _major = ELLIPSE_SCALE * np.sqrt(_mean + _spread)
+        _minor = ELLIPSE_SCALE * np.sqrt(np.maximum(_mean - _spread, 0))
+    return _major, _minor, np.degrees(np.arctan2(2 * _cxy, _cyy - _cxx) / 2) % 180
+
+
+def triangulate(bearings, sigma=BEARING_SIGMA, iterations=ITERATIONS):
+    """
+    Locate every AP seen from two or more capture positions by weighted least squares intersection of its bearings.
+    Each bearing is a line through the capture position; the AP is the point minimizing the weighted squared
+    perpendicular distances to its lines. Weights are the inverse variance of that distance, which grows with range,
+    so they are refined as the ranges become known. All APs are solved at once
+
+    :param bearings: DataFrame of bssid, ssid, lat, lon and bearing (true, degrees)
+    :type bearings: pd.DataFrame
+    :param sigma: Standard deviation of a bearing (degrees)
+    :type sigma: float
+    :param iterations: Reweighting passes
+    :type iterations: int
+    :return: DataFrame of position_fieldnames: position, number of bearings, 95% error ellipse (semi axes in m,
+             orientation of the major axis in degrees from north) and RMS bearing residual (degrees)
+    :rtype: pd.DataFrame
+    """
+
+    _codes, _bssids = pd.factorize(bearings['bssid'])
+    _count = len(_bssids)
+    if not _count:
+        return pd.DataFrame(columns=position_fieldnames)
+
+    # Local east/north coordinates around each AP's mean capture position
+    _lat0 = _group_sum(_codes, _count, bearings['lat'].values) / np.bincount(_codes)
+    _lon0 = _group_sum(_codes, _count, bearings['lon'].values) / np.bincount(_codes)
+    _x = (bearings['lon'].values - _lon0[_codes]) * METERS_PER_DEGREE * np.cos(np.radians(_lat0[_codes]))
+    _y = (bearings['lat'].values - _lat0[_codes]) * METERS_PER_DEGREE
+
+    # Unit normal to each bearing line, and the line's offset along it
+    _theta = np.radians(bearings['bearing'].values.astype(float))
+    _nx, _ny = np.cos(_theta), -np.sin(_theta)
+    _c = _nx * _x + _ny * _y
+    _sigma = math.radians(sigma)
+
+    # The first pass has no ranges; assume they are all equal
+    _w = np.ones(len(_codes))
+    for i in range(iterations + 1):
+        _a = _group_sum(_codes, _count, _w * _nx * _nx)
+        _b = _group_sum(_codes, _count, _w * _nx * _ny)
+        _d = _group_sum(_codes, _count, _w * _ny * _ny)
+        _ex = _group_sum(_codes, _count, _w * _nx * _c)
+        _ey = _group_sum(_codes, _count, _w * _ny * _c)
+
+        _det = _a * _d - _b * _b
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _px = (_d * _ex - _b * _ey) / _det
+            _py = (_a * _ey - _b * _ex) / _det
+
+        _range = np.hypot(_px[_codes] - _x, _py[_codes] - _y)
+        _w = 1 / (np.maximum(np.nan_to_num(_range, nan=MIN_RANGE), MIN_RANGE) * _sigma) ** 2
+
+    # With inverse variance weights, the inverse of the normal matrix is the covariance of the position
+    _major, _minor, _orientation = _ellipse(_a, _b, _d)
+
+    # Bearing residuals
+    _predicted = np.degrees(np.arctan2(_px[_codes] - _x, _py[_codes] - _y))
+    _residual = (_predicted - bearings['bearing'].values + 180) % 360 - 180
+    _rms = np.sqrt(_group_sum(_codes, _count, _residual ** 2) / np.bincount(_codes))
+
+    # Usable only with a real baseline, and with the AP in front of the observers rather than behind them
+    _baseline = np.sqrt(_group_sum(_codes, _count, _x ** 2 + _y ** 2) / np.bincount(_codes))
+    _ahead = _group_sum(_codes, _count, (np.abs(_residual) < 90).astype(float)) / np.bincount(_codes)
+    _valid = (np.bincount(_codes) >= 2) & (_baseline >= MIN_BASELINE / 2) & (np.abs(_det) > 0) & (_ahead > .5)
+
+    _ssids = bearings.groupby(_codes)['ssid'].last().values
+    _positions = pd.DataFrame({'bssid': np.asarray(_bssids),
+                               'ssid': _ssids,
+                               'lat': _lat0 + _py / METERS_PER_DEGREE,
+                               'lon': _lon0 + _px / (METERS_PER_DEGREE * np.cos(np.radians(_lat0))),
+                               'observations': np.bincount(_codes),
+                               'semi_major': _major,
+                               'semi_minor': _minor,
+                               'orientation': _orientation,
+                               'rms': _rms}, columns=position_fieldnames)
+
+    return _positions[_valid].sort_values('semi_major').reset_index(drop=True)
+
+
+def locate_aps(path):
+    """
+    Locate the APs of a campaign, then print and write the positions to the working directory
+
+    :param path: Campaign directory
+    :type path: str
+    :return: Positions
+    :rtype: pd.DataFrame
+    """
+
+    _start = time.time()
+    _bearings = load_bearings(path)
+    _positions = triangulate(_bearings)
+    module_logger.info("Located {} of {} APs from {} bearings in {:.2f}s".format(
+        len(_positions), _bearings['bssid'].nunique(), len(_bearings), time.time() - _start))
+
+    if _positions.empty:
+        print("No APs were observed from two or more capture positions in {}".format(path))
+        return _positions
+
+    _output = os.path.join(path, time.strftime('%Y%m%d-%H-%M-%S') + APS_SUFFIX)
+    _positions.to_csv(_output, index=False)
+    print(_positions.to_string())
+    print("Wrote {} AP positions to {}".format(len(_positions), _output))
+    return _positions
+
+
+def strength_range(strength):
+    """
+    Rough range to an AP from its signal strength, by the log-distance path loss model
+
+    :param strength: Signal strength (dBm)
+    :type strength: float
+    :return: Range (m), at least MIN_RANGE
+    :rtype: float
+    """
+
+    return max(MIN_RANGE, 10 ** ((RSSI_REFERENCE - strength) / (10 * PATH_LOSS_EXPONENT)))
+
+
+class APEstimator:
+
+    def __init__(self, sigma=BEARING_SIGMA):
+        """
+        Running position estimate of every AP, updated in constant time per bearing. Each AP keeps the information form
+        of the least squares intersection (the normal matrix and vector) in local east/north coordinates around its
+        first observer; a bearing adds its line, weighted by the inverse variance of the perpendicular distance at the
+        range estimated so far (or guessed from signal strength, before there is an estimate). Earlier weights are not
+        revisited, which is what keeps updates O(1); triangulate() over the whole campaign refines them all
+
+        :param sigma: Standard deviation of a bearing (degrees)
+        :type sigma: float
+        """
+
+        self._sigma = math.radians(sigma)
+        # BSSID to [lat0, lon0, a, b, d, ex, ey, observations, baseline, ssid]
+        self._states = {}
+
+    def update(self, bssid, ssid, lat, lon, bearing, strength=None):
+        """
+        Fold one bearing into an AP's estimate
+
+        :param bssid: BSSID
+        :type bssid: str
+        :param ssid: SSID
+        :type ssid: str
+        :param lat: Latitude of the observer
+        :type lat: float
+        :param lon: Longitude of the observer
+        :type lon: float
+        :param bearing: True bearing to the AP (degrees)
+        :type bearing: float
+        :param strength: Signal strength (dBm)
+        :type strength: float
+        """
+
+        _state = self._states.get(bssid)
+        if _state is None:
+            _state = self._states[bssid] = [lat, lon, 0, 0, 0, 0, 0, 0, 0, ssid]
+
+        _x = (lon - _state[1]) * METERS_PER_DEGREE * math.cos(math.radians(_state[0]))
+        _y = (lat - _state[0]) * METERS_PER_DEGREE
+        _nx, _ny = math.cos(math.radians(bearing)), -math.sin(math.radians(bearing))
+        _c = _nx * _x + _ny * _y
+
+        _estimate = self._solve(_state)
+        if _estimate is not None:
+            _range = max(MIN_RANGE, math.hypot(_estimate[0] - _x, _estimate[1] - _y))
+        elif strength is not None and not math.isnan(strength):
+            _range = strength_range(strength)
+        else:
+            _range = MIN_RANGE
+        _w = 1 / (_range * self._sigma) ** 2
+
+        _state[2] += _w * _nx * _nx
+        _state[3] += _w * _nx * _ny
+        _state[4] += _w * _ny * _ny
+        _state[5] += _w * _nx * _c
+        _state[6] += _w * _ny * _c
+        _state[7] += 1
+        _state[8] = max(_state[8], math.hypot(_x, _y))
+        _state[9] = ssid
+
+    def update_guesses(self, meta, guesses):
+        """
+        Fold the bearing guesses of a processed capture into the estimates
+
+        :param meta: Capture meta
+        :type meta: dict
+        :param guesses: Guesses from process_capture, with ssid, bssid, strength and bearing (magnetic)
+        :type guesses: pd.DataFrame
+        :return: Number of bearings used
+        :rtype: int
+        """
+
+        try:
+            _lat, _lon, _start = (float(meta[meta_csv_fieldnames[i]]) for i in (6, 7, 12))
+        except (KeyError, TypeError, ValueError):
+            return 0
+        if not _lat and not _lon:
+            return 0
+
+        _declination = geomag.declination(_lat, _lon, 0, date.fromtimestamp(_start))
+        for row in guesses.itertuples(index=False):
+            self.update(row.bssid, row.ssid, _lat, _lon, (float(row.bearing) + _declination) % 360, float(row.strength))
+
+        return len(guesses)
+
+    def position(self, bssid):
+        """
+        Current estimate of an AP's position
+
+        :param bssid: BSSID
+        :type bssid: str
+        :return: (lat, lon, observations, semi_major, semi_minor, orientation), or None while the AP has not been seen
+                 from two positions
+        :rtype: tuple
+        """
+
+        _state = self._states.get(bssid)
+        _estimate = self._solve(_state) if _state else None
+        if _estimate is None:
+            return None
+
+        _major, _minor, _orientation = _ellipse(_state[2], _state[3], _state[4])
+        return (_state[0] + _estimate[1] / METERS_PER_DEGREE,
+                _state[1] + _estimate[0] / (METERS_PER_DEGREE * math.cos(math.radians(_state[0]))),
+                _state[7], float(_major), float(_minor), float(_orientation))
+
+    def positions(self):
+        """
+        Current estimates of every AP seen from two positions
+
+        :return: DataFrame of bssid, ssid, lat, lon, observations and error ellipse, most certain first
+        :rtype: pd.DataFrame
+        """
+
+        _rows = []
+        for bssid, state in self._states.items():
+            _position = self.position(bssid)
+            if _position is not None:
+                _rows.append((bssid, state[9]) + _position)
+
+        return pd.DataFrame(_rows, columns=position_fieldnames[:-1]).sort_values('semi_major').reset_index(drop=True)
+
+    def __len__(self):
+        return len(self._states)
+
+    @staticmethod
+    def _solve(state):
+        _det = state[2] * state[4] - state[3] * state[3]
+        if state[7] < 2 or state[8] < MIN_BASELINE or _det <= 0:
+            return None
+        return (state[4] * state[5] - state[3] * state[6]) / _det, (state[2] * state[6] - state[3] * state[5]) / _det
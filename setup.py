@@ -19,7 +19,6 @@ setup(
     packages=['localizer'],
     install_requires=[
         'pyshark',
-        'gpsd-py3',
         'tqdm',
         'pandas',
         'scipy',
@@ -32,7 +31,7 @@ setup(
         'wifi==0.8.0rc1',
     ],
     test_suite='nose.collector',
-    tests_require=['nose'],
+    tests_require=['nose', 'gpsd-py3'],
     entry_points={
         'console_scripts': ['localizer=localizer.main:main'],
     },